@@ -1,3 +1,5 @@
+from app.ai_engine.base import LLMEngine, LLMError
 from app.ai_engine.gemini import GeminiEngine
+from app.ai_engine.factory import get_llm_engine
 
-__all__ = ["GeminiEngine"]
+__all__ = ["LLMEngine", "LLMError", "GeminiEngine", "get_llm_engine"]
@@ -0,0 +1,93 @@
+import asyncio
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+from app.config import get_settings
+from app.ai_engine.coalescing import SingleFlight
+from app.ai_engine.errors import LLMError
+from app.ai_engine.resilience import ResilientCaller
+
+settings = get_settings()
+
+generate_flight = SingleFlight()
+
+SYSTEM_PROMPT = """You are CyberScholar, an expert cybersecurity educator AI. Your role is to teach cybersecurity concepts with an emphasis on ethical practices and legal compliance.
+
+IMPORTANT GUIDELINES:
+1. Always emphasize that all techniques should only be used in authorized environments
+2. Recommend legitimate practice platforms: HackTheBox, TryHackMe, PentesterLab, DVWA, OWASP WebGoat
+3. Explain both offensive and defensive perspectives
+4. Include disclaimers for sensitive topics
+5. Provide code examples with explanations
+6. Use markdown formatting with code blocks for clarity
+7. Be clear about legal and ethical implications
+
+EDUCATIONAL FOCUS AREAS:
+- Reconnaissance and information gathering
+- Vulnerability assessment and exploitation
+- Payload creation and delivery mechanisms
+- Python security scripting and automation
+- Kali Linux tools and techniques
+- Defense strategies and mitigation
+- Security concepts and best practices
+
+Always respond helpfully but responsibly, steering conversations toward legitimate learning."""
+
+
+class LLMEngine(ABC):
+    """Interface implemented by every LLM backend (see LLM_PROVIDER)"""
+
+    name = "base"
+
+    def __init__(self):
+        self.resilience = ResilientCaller()
+
+    @abstractmethod
+    def generate(self, message: str, context: Optional[str] = None, history: Optional[List[dict]] = None) -> Dict:
+        """Return {"text", "input_tokens", "output_tokens"} for one prompt"""
+
+    @abstractmethod
+    def stream(self, message: str, context: Optional[str] = None, history: Optional[List[dict]] = None) -> Iterator[str]:
+        """Yield the response text in chunks as it is produced"""
+
+    @abstractmethod
+    def generate_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+        """Return one embedding per input text"""
+
+    @property
+    def model_name(self) -> str:
+        return self.name
+
+    @staticmethod
+    def format_message(message: str, context: Optional[str] = None) -> str:
+        if context:
+            return f"Context:\n{context}\n\nUser Question:\n{message}"
+        return message
+
+    @staticmethod
+    def get_system_prompt() -> str:
+        return SYSTEM_PROMPT
+
+    async def generate_async(self, message: str, context: Optional[str] = None, history: Optional[List[dict]] = None) -> Dict:
+        """Run generate off the event loop with retries, coalescing identical in-flight prompts"""
+        def call():
+            return self.resilience.call(lambda: self.generate(message, context, history))
+
+        if not settings.LLM_COALESCING_ENABLED:
+            return await call()
+
+        key = SingleFlight.make_key(self.model_name, message, context, history or [])
+        result = await generate_flight.do(key, call)
+        return dict(result)
+
+    async def stream_async(self, message: str, context: Optional[str] = None, history: Optional[List[dict]] = None) -> AsyncIterator[str]:
+        """Async iterator over stream(), pulling each chunk in a worker thread"""
+        chunks = self.stream(message, context, history)
+        done = object()
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, done)
+            if chunk is done:
+                break
+            yield chunk
+
+    def generate_embeddings(self, text: str) -> List[float]:
+        return self.generate_embeddings_batch([text])[0]
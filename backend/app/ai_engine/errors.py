@@ -0,0 +1,22 @@
+from typing import Optional
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """Upstream LLM failure, tagged with the HTTP-style status it maps to"""
+
+    def __init__(self, message: str, status_code: int = 500, retryable: Optional[bool] = None, retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = status_code in RETRYABLE_STATUS_CODES if retryable is None else retryable
+        self.retry_after = retry_after
+
+    @property
+    def response_status(self) -> int:
+        """Status to return to our own clients"""
+        if self.status_code == 429:
+            return 429
+        if self.status_code >= 500:
+            return 503
+        return 502
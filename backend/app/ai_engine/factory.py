@@ -0,0 +1,18 @@
+from functools import lru_cache
+from app.config import get_settings
+from app.ai_engine.base import LLMEngine
+
+
+@lru_cache()
+def get_llm_engine() -> LLMEngine:
+    """Return the process-wide LLM backend selected by LLM_PROVIDER"""
+    provider = get_settings().LLM_PROVIDER.lower()
+
+    if provider == "gemini":
+        from app.ai_engine.gemini import GeminiEngine
+        return GeminiEngine()
+    if provider == "mock":
+        from app.ai_engine.mock_engine import MockLLMEngine
+        return MockLLMEngine()
+
+    raise ValueError(f"Unsupported LLM_PROVIDER: {provider}")
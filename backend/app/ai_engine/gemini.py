@@ -1,12 +1,29 @@
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 from app.config import get_settings
-from typing import List, Optional
+from app.ai_engine.base import LLMEngine
+from app.ai_engine.errors import LLMError
+from app.ai_engine.prompt_builder import PromptBuilder
+from typing import Iterator, List, Optional, Dict
 
 settings = get_settings()
 
 
-class GeminiEngine:
+def to_llm_error(prefix: str, error: Exception) -> LLMError:
+    """Classify SDK failures so 429/5xx are retried and everything else fails fast"""
+    message = f"{prefix}: {str(error)}"
+    if isinstance(error, google_exceptions.GoogleAPICallError) and isinstance(error.code, int):
+        return LLMError(message, status_code=int(error.code))
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return LLMError(message, status_code=503)
+    return LLMError(message, status_code=502, retryable=False)
+
+
+class GeminiEngine(LLMEngine):
+    name = "gemini"
+
     def __init__(self):
+        super().__init__()
         genai.configure(api_key=settings.GOOGLE_API_KEY)
         self.model = genai.GenerativeModel(
             settings.GEMINI_MODEL,
@@ -23,6 +40,10 @@ class GeminiEngine:
         )
         self.chat = None
 
+    @property
+    def model_name(self) -> str:
+        return settings.GEMINI_MODEL
+
     def start_chat(self, history: Optional[List[dict]] = None):
         """Start a new chat session with optional history"""
         conversation_history = history or []
@@ -31,10 +52,7 @@ class GeminiEngine:
 
     def send_message(self, message: str, context: Optional[str] = None) -> str:
         """Send a message and get response"""
-        if context:
-            full_message = f"Context:\n{context}\n\nUser Question:\n{message}"
-        else:
-            full_message = message
+        full_message = self.format_message(message, context)
 
         try:
             response = self.chat.send_message(full_message)
@@ -42,6 +60,43 @@ class GeminiEngine:
         except Exception as e:
             raise Exception(f"Error sending message to Gemini: {str(e)}")
 
+    def generate(self, message: str, context: Optional[str] = None, history: Optional[List[dict]] = None) -> Dict:
+        """Send a message in a fresh chat and return the response text with token usage"""
+        full_message = self.format_message(message, context)
+
+        try:
+            chat = self.model.start_chat(history=history or [])
+            response = chat.send_message(full_message)
+            text = response.text
+        except Exception as e:
+            raise to_llm_error("Error sending message to Gemini", e)
+
+        usage = getattr(response, "usage_metadata", None)
+        input_tokens = getattr(usage, "prompt_token_count", None) if usage else None
+        output_tokens = getattr(usage, "candidates_token_count", None) if usage else None
+        if not input_tokens:
+            input_tokens = PromptBuilder.estimate_tokens(full_message) + PromptBuilder.estimate_history_tokens(history or [])
+        if not output_tokens:
+            output_tokens = PromptBuilder.estimate_tokens(text)
+
+        return {
+            "text": text,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+        }
+
+    def stream(self, message: str, context: Optional[str] = None, history: Optional[List[dict]] = None) -> Iterator[str]:
+        """Stream the response text chunk by chunk"""
+        full_message = self.format_message(message, context)
+
+        try:
+            chat = self.model.start_chat(history=history or [])
+            for chunk in chat.send_message(full_message, stream=True):
+                if chunk.text:
+                    yield chunk.text
+        except Exception as e:
+            raise to_llm_error("Error sending message to Gemini", e)
+
     def generate_embeddings(self, text: str) -> List[float]:
         """Generate embeddings for text using Gemini"""
         try:
@@ -54,26 +109,14 @@ class GeminiEngine:
         except Exception as e:
             raise Exception(f"Error generating embeddings: {str(e)}")
 
-    @staticmethod
-    def get_system_prompt() -> str:
-        return """You are CyberScholar, an expert cybersecurity educator AI. Your role is to teach cybersecurity concepts with an emphasis on ethical practices and legal compliance.
-
-IMPORTANT GUIDELINES:
-1. Always emphasize that all techniques should only be used in authorized environments
-2. Recommend legitimate practice platforms: HackTheBox, TryHackMe, PentesterLab, DVWA, OWASP WebGoat
-3. Explain both offensive and defensive perspectives
-4. Include disclaimers for sensitive topics
-5. Provide code examples with explanations
-6. Use markdown formatting with code blocks for clarity
-7. Be clear about legal and ethical implications
-
-EDUCATIONAL FOCUS AREAS:
-- Reconnaissance and information gathering
-- Vulnerability assessment and exploitation
-- Payload creation and delivery mechanisms
-- Python security scripting and automation
-- Kali Linux tools and techniques
-- Defense strategies and mitigation
-- Security concepts and best practices
-
-Always respond helpfully but responsibly, steering conversations toward legitimate learning."""
+    def generate_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings for several texts in one request"""
+        try:
+            result = genai.embed_content(
+                model="models/embedding-001",
+                content=texts,
+                task_type="RETRIEVAL_DOCUMENT"
+            )
+            return result["embedding"]
+        except Exception as e:
+            raise to_llm_error("Error generating embeddings", e)
@@ -0,0 +1,88 @@
+import hashlib
+import random
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+from app.config import get_settings
+from app.ai_engine.base import LLMEngine, LLMError
+from app.ai_engine.prompt_builder import PromptBuilder
+
+settings = get_settings()
+
+VOCABULARY = [
+    "reconnaissance", "enumeration", "payload", "exploit", "mitigation", "firewall",
+    "nmap", "scan", "port", "service", "vulnerability", "patch", "authorized", "lab",
+    "network", "packet", "hash", "encryption", "defense", "monitoring", "the", "a",
+    "of", "to", "and", "in", "is", "for", "with", "on", "this", "that", "always",
+]
+
+
+class MockLLMEngine(LLMEngine):
+    """Deterministic offline backend for load tests and benchmarks.
+
+    Responses depend only on the prompt and MOCK_LLM_SEED; latency, token rate
+    and failures are simulated from the MOCK_LLM_* settings.
+    """
+
+    name = "mock"
+    EMBEDDING_DIMENSIONS = 768
+
+    def __init__(self):
+        super().__init__()
+        self._rng = random.Random(settings.MOCK_LLM_SEED)
+        self._rng_lock = threading.Lock()
+
+    def _prompt_rng(self, *parts: str) -> random.Random:
+        digest = hashlib.sha256("\x00".join([str(settings.MOCK_LLM_SEED), *parts]).encode("utf-8")).digest()
+        return random.Random(int.from_bytes(digest[:8], "big"))
+
+    def _maybe_fail(self):
+        with self._rng_lock:
+            roll = self._rng.random()
+            jitter = self._rng.uniform(-1, 1) * settings.MOCK_LLM_LATENCY_JITTER_MS
+        if roll < settings.MOCK_LLM_FAILURE_RATE:
+            raise LLMError("Injected mock LLM failure", status_code=settings.MOCK_LLM_FAILURE_STATUS)
+        return max(0.0, settings.MOCK_LLM_LATENCY_MS + jitter) / 1000
+
+    def _response_words(self, full_message: str) -> List[str]:
+        rng = self._prompt_rng(full_message)
+        count = max(1, settings.MOCK_LLM_RESPONSE_TOKENS)
+        return [rng.choice(VOCABULARY) for _ in range(count)]
+
+    def _token_delay(self) -> float:
+        if settings.MOCK_LLM_TOKENS_PER_SECOND <= 0:
+            return 0.0
+        return 1.0 / settings.MOCK_LLM_TOKENS_PER_SECOND
+
+    def generate(self, message: str, context: Optional[str] = None, history: Optional[List[dict]] = None) -> Dict:
+        full_message = self.format_message(message, context)
+        first_token_delay = self._maybe_fail()
+        words = self._response_words(full_message)
+
+        time.sleep(first_token_delay + self._token_delay() * len(words))
+
+        return {
+            "text": " ".join(words),
+            "input_tokens": PromptBuilder.estimate_tokens(full_message) + PromptBuilder.estimate_history_tokens(history or []),
+            "output_tokens": len(words),
+        }
+
+    def stream(self, message: str, context: Optional[str] = None, history: Optional[List[dict]] = None) -> Iterator[str]:
+        full_message = self.format_message(message, context)
+        first_token_delay = self._maybe_fail()
+        words = self._response_words(full_message)
+
+        time.sleep(first_token_delay)
+        token_delay = self._token_delay()
+        for i, word in enumerate(words):
+            if token_delay:
+                time.sleep(token_delay)
+            yield word if i == 0 else f" {word}"
+
+    def generate_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self._maybe_fail())
+        embeddings = []
+        for text in texts:
+            rng = self._prompt_rng("embedding", text)
+            embeddings.append([rng.uniform(-1, 1) for _ in range(self.EMBEDDING_DIMENSIONS)])
+        return embeddings
@@ -0,0 +1,196 @@
+from typing import List, Dict, Optional, Callable
+from app.config import get_settings
+
+settings = get_settings()
+
+
+class PromptBuilder:
+    CHARS_PER_TOKEN = 4
+    SHINGLE_SIZE = 5
+    MIN_OVERLAP_WORDS = 5
+    MAX_OVERLAP_WORDS = 100
+    MIN_TRUNCATED_CHUNK_TOKENS = 32
+
+    @staticmethod
+    def estimate_tokens(text: Optional[str]) -> int:
+        """Estimate the number of LLM tokens in text (~4 characters per token)"""
+        if not text:
+            return 0
+        return (len(text) + PromptBuilder.CHARS_PER_TOKEN - 1) // PromptBuilder.CHARS_PER_TOKEN
+
+    @staticmethod
+    def estimate_history_tokens(history: List[dict]) -> int:
+        """Estimate tokens used by a Gemini-style conversation history"""
+        total = 0
+        for entry in history:
+            for part in entry.get("parts", []):
+                total += PromptBuilder.estimate_tokens(part.get("text", ""))
+        return total
+
+    @staticmethod
+    def score(doc: Dict) -> float:
+        """Relevance score of a retrieved chunk (higher is better)"""
+        if doc.get("score") is not None:
+            return float(doc["score"])
+        distance = doc.get("distance")
+        if distance is None:
+            return 0.0
+        return 1.0 - float(distance)
+
+    @staticmethod
+    def _shingles(words: List[str]) -> set:
+        size = PromptBuilder.SHINGLE_SIZE
+        if len(words) < size:
+            return {" ".join(words)} if words else set()
+        return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+    @staticmethod
+    def _overlap_length(previous: List[str], current: List[str]) -> int:
+        """Length of the longest suffix of previous that is a prefix of current"""
+        max_len = min(len(previous), len(current), PromptBuilder.MAX_OVERLAP_WORDS)
+        for length in range(max_len, PromptBuilder.MIN_OVERLAP_WORDS - 1, -1):
+            if previous[-length:] == current[:length]:
+                return length
+        return 0
+
+    @staticmethod
+    def dedupe_chunks(docs: List[Dict], threshold: Optional[float] = None) -> List[Dict]:
+        """Drop near-duplicate chunks and strip text shared with higher-ranked chunks.
+
+        Chunks are produced with a sliding-window overlap, so neighbouring chunks
+        of the same document repeat each other's edges; re-uploaded documents
+        repeat whole chunks.
+        """
+        if threshold is None:
+            threshold = settings.CONTEXT_DEDUP_THRESHOLD
+
+        kept = []
+        kept_words = []
+        kept_shingles = []
+        for doc in docs:
+            words = doc.get("content", "").split()
+            if not words:
+                continue
+
+            shingles = PromptBuilder._shingles(words)
+            duplicate = False
+            for other in kept_shingles:
+                smaller = min(len(shingles), len(other)) or 1
+                if len(shingles & other) / smaller >= threshold:
+                    duplicate = True
+                    break
+            if duplicate:
+                continue
+
+            for previous in kept_words:
+                overlap = PromptBuilder._overlap_length(previous, words)
+                if overlap:
+                    words = words[overlap:]
+                overlap = PromptBuilder._overlap_length(words, previous)
+                if overlap:
+                    words = words[:-overlap]
+                if not words:
+                    break
+            if not words:
+                continue
+
+            kept.append({**doc, "content": " ".join(words)})
+            kept_words.append(words)
+            kept_shingles.append(shingles)
+
+        return kept
+
+    @staticmethod
+    def fit_context(
+        docs: List[Dict],
+        token_budget: Optional[int] = None,
+        max_chunk_chars: Optional[int] = None,
+    ) -> List[Dict]:
+        """Select the best-scoring, de-duplicated chunks that fit in the token budget"""
+        if token_budget is None:
+            token_budget = settings.CONTEXT_TOKEN_BUDGET
+
+        ranked = sorted(docs, key=PromptBuilder.score, reverse=True)
+        ranked = PromptBuilder.dedupe_chunks(ranked)
+
+        selected = []
+        remaining = token_budget
+        for doc in ranked:
+            content = doc["content"]
+            if max_chunk_chars and len(content) > max_chunk_chars:
+                content = content[:max_chunk_chars]
+
+            tokens = PromptBuilder.estimate_tokens(content)
+            if tokens > remaining:
+                if remaining < PromptBuilder.MIN_TRUNCATED_CHUNK_TOKENS:
+                    break
+                content = content[:remaining * PromptBuilder.CHARS_PER_TOKEN]
+                tokens = PromptBuilder.estimate_tokens(content)
+
+            selected.append({**doc, "content": content, "tokens": tokens})
+            remaining -= tokens
+            if remaining <= 0:
+                break
+
+        return selected
+
+    @staticmethod
+    def trim_history(history: List[dict], token_budget: Optional[int] = None) -> List[dict]:
+        """Keep the most recent conversation turns that fit in the token budget"""
+        if token_budget is None:
+            token_budget = settings.HISTORY_TOKEN_BUDGET
+
+        kept = []
+        used = 0
+        for entry in reversed(history):
+            tokens = PromptBuilder.estimate_history_tokens([entry])
+            if used + tokens > token_budget:
+                break
+            kept.append(entry)
+            used += tokens
+
+        kept.reverse()
+        # Gemini expects the history to open with a user turn
+        while kept and kept[0].get("role") != "user":
+            kept.pop(0)
+        return kept
+
+    @staticmethod
+    def build(
+        message: str,
+        instructions: str = "",
+        docs: Optional[List[Dict]] = None,
+        history: Optional[List[dict]] = None,
+        format_chunk: Callable[[Dict], str] = lambda doc: f"- {doc['content']}\n",
+        context_header: str = "",
+        max_chunk_chars: Optional[int] = None,
+    ) -> Dict:
+        """Assemble a prompt within PROMPT_TOKEN_BUDGET.
+
+        The instructions and user message are always sent; retrieved context is
+        fitted next (up to CONTEXT_TOKEN_BUDGET) and the remaining budget goes to
+        the most recent history (up to HISTORY_TOKEN_BUDGET).
+        """
+        fixed_tokens = PromptBuilder.estimate_tokens(instructions) + PromptBuilder.estimate_tokens(message)
+        available = max(0, settings.PROMPT_TOKEN_BUDGET - fixed_tokens)
+
+        context = ""
+        selected = []
+        if docs:
+            context_budget = min(settings.CONTEXT_TOKEN_BUDGET, available)
+            selected = PromptBuilder.fit_context(docs, context_budget, max_chunk_chars)
+            if selected:
+                context = context_header + "".join(format_chunk(doc) for doc in selected)
+        context_tokens = PromptBuilder.estimate_tokens(context)
+
+        trimmed_history = []
+        if history:
+            history_budget = min(settings.HISTORY_TOKEN_BUDGET, max(0, available - context_tokens))
+            trimmed_history = PromptBuilder.trim_history(history, history_budget)
+
+        return {
+            "context": context,
+            "documents": selected,
+            "history": trimmed_history,
+            "input_tokens": fixed_tokens + context_tokens + PromptBuilder.estimate_history_tokens(trimmed_history),
+        }
@@ -0,0 +1,246 @@
+import asyncio
+import random
+import time
+from collections import defaultdict, deque
+from typing import Any, Callable, Deque, Dict, Optional
+from app.config import get_settings
+from app.ai_engine.errors import LLMError
+
+settings = get_settings()
+
+
+class LLMMetrics:
+    """Per-outcome call counts and latency percentiles over a sliding sample window"""
+
+    def __init__(self, max_samples: int = 1000):
+        self.max_samples = max_samples
+        self.counts: Dict[str, int] = defaultdict(int)
+        self.latencies: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=self.max_samples))
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def record(self, outcome: str, latency: Optional[float] = None):
+        self.counts[outcome] += 1
+        if latency is not None:
+            self.latencies[outcome].append(latency)
+
+    @staticmethod
+    def percentile(samples, fraction: float) -> Optional[float]:
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+        return ordered[index]
+
+    def hedge_delay(self) -> Optional[float]:
+        """Latency after which a hedged request is worth sending, once enough samples exist"""
+        samples = self.latencies.get("success")
+        if not samples or len(samples) < settings.LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return self.percentile(samples, settings.LLM_HEDGE_PERCENTILE)
+
+    def snapshot(self) -> Dict[str, Any]:
+        total = sum(self.counts.values())
+        failures = total - self.counts.get("success", 0)
+        outcomes = {}
+        for outcome, count in self.counts.items():
+            samples = self.latencies.get(outcome)
+            outcomes[outcome] = {
+                "count": count,
+                "p50_ms": self._ms(self.percentile(samples, 0.50)),
+                "p95_ms": self._ms(self.percentile(samples, 0.95)),
+                "p99_ms": self._ms(self.percentile(samples, 0.99)),
+            }
+        return {
+            "total_attempts": total,
+            "error_rate": failures / total if total else 0.0,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "outcomes": outcomes,
+        }
+
+    @staticmethod
+    def _ms(value: Optional[float]) -> Optional[float]:
+        return round(value * 1000, 1) if value is not None else None
+
+
+class CircuitBreaker:
+    """Open after consecutive upstream failures, then let a single probe through after a cool-down"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+
+    def allow_request(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+            self.state = self.HALF_OPEN
+            self.probe_in_flight = False
+        if self.state == self.HALF_OPEN and not self.probe_in_flight:
+            self.probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.probe_in_flight = False
+
+    def release_probe(self):
+        """Let the next request probe again after one that ended without a verdict on upstream health"""
+        self.probe_in_flight = False
+
+    def retry_after(self) -> int:
+        return max(1, int(self.reset_seconds - (time.monotonic() - self.opened_at)))
+
+
+class RetryBudget:
+    """Cap retries to a fraction of recent calls so an outage cannot multiply upstream load"""
+
+    WINDOW_SECONDS = 60
+
+    def __init__(self, ratio: float, minimum: int = 10):
+        self.ratio = ratio
+        self.minimum = minimum
+        self.calls: Deque[float] = deque()
+        self.retries: Deque[float] = deque()
+
+    def _trim(self, now: float):
+        cutoff = now - self.WINDOW_SECONDS
+        for events in (self.calls, self.retries):
+            while events and events[0] < cutoff:
+                events.popleft()
+
+    def record_call(self):
+        self.calls.append(time.monotonic())
+
+    def try_spend(self) -> bool:
+        now = time.monotonic()
+        self._trim(now)
+        if len(self.retries) >= max(self.minimum, self.ratio * len(self.calls)):
+            return False
+        self.retries.append(now)
+        return True
+
+
+class ResilientCaller:
+    """Run blocking LLM calls with jittered retries, a circuit breaker and optional hedging"""
+
+    def __init__(self):
+        self.metrics = LLMMetrics()
+        self.breaker = CircuitBreaker(settings.LLM_CIRCUIT_FAILURE_THRESHOLD, settings.LLM_CIRCUIT_RESET_SECONDS)
+        self.budget = RetryBudget(settings.LLM_RETRY_BUDGET_RATIO)
+
+    @staticmethod
+    def backoff_delay(attempt: int) -> float:
+        """Full-jitter exponential backoff in seconds"""
+        ceiling = min(settings.LLM_RETRY_MAX_DELAY_MS, settings.LLM_RETRY_BASE_DELAY_MS * (2 ** attempt))
+        return random.uniform(0, ceiling) / 1000
+
+    @staticmethod
+    def _as_llm_error(error: Exception) -> LLMError:
+        if isinstance(error, LLMError):
+            return error
+        return LLMError(str(error), status_code=502, retryable=False)
+
+    async def call(self, fn: Callable[[], Any]) -> Any:
+        self.budget.record_call()
+        attempt = 0
+        while True:
+            if not self.breaker.allow_request():
+                self.metrics.record("circuit_open")
+                raise LLMError(
+                    "LLM service is temporarily unavailable",
+                    status_code=503,
+                    retryable=False,
+                    retry_after=self.breaker.retry_after()
+                )
+
+            is_probe = self.breaker.state == CircuitBreaker.HALF_OPEN
+            start = time.monotonic()
+            try:
+                result = await self._call_with_hedge(fn)
+            except Exception as e:
+                error = self._as_llm_error(e)
+                latency = time.monotonic() - start
+                if error.retryable:
+                    self.breaker.record_failure()
+                    self.metrics.record("rate_limited" if error.status_code == 429 else "upstream_error", latency)
+                else:
+                    # Says nothing about upstream health, so a half-open circuit must not close on it
+                    if is_probe:
+                        self.breaker.release_probe()
+                    self.metrics.record("error", latency)
+
+                if (
+                    not error.retryable
+                    or attempt >= settings.LLM_MAX_RETRIES
+                    or self.breaker.state != CircuitBreaker.CLOSED
+                    or not self.budget.try_spend()
+                ):
+                    raise error
+
+                self.metrics.retries += 1
+                await asyncio.sleep(self.backoff_delay(attempt))
+                attempt += 1
+                continue
+            except BaseException:
+                # Cancelled (client gone, request timeout): free the probe slot or the circuit never closes again
+                if is_probe:
+                    self.breaker.release_probe()
+                raise
+
+            self.breaker.record_success()
+            self.metrics.record("success", time.monotonic() - start)
+            return result
+
+    async def _call_with_hedge(self, fn: Callable[[], Any]) -> Any:
+        primary = asyncio.ensure_future(asyncio.to_thread(fn))
+        delay = self.metrics.hedge_delay() if settings.LLM_HEDGE_ENABLED else None
+        if delay is None:
+            return await primary
+
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+
+        self.metrics.hedges += 1
+        hedge = asyncio.ensure_future(asyncio.to_thread(fn))
+        pending = {primary, hedge}
+        first_error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        self.metrics.hedge_wins += 1
+                    for loser in pending:
+                        loser.add_done_callback(lambda t: t.cancelled() or t.exception())
+                    return task.result()
+                first_error = first_error or task.exception()
+        raise first_error
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "circuit_state": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            **self.metrics.snapshot(),
+        }
@@ -1,10 +1,12 @@
-from fastapi import APIRouter, HTTPException, Depends, Query, status
-from pydantic import BaseModel
-from typing import Optional
-from app.db.queries import AdminQueries, SubscriptionQueries, PaymentQueries, TokenQueries, BankSettingsQueries
+from fastapi import APIRouter, HTTPException, Depends, Query, Response, status
+from pydantic import BaseModel, Field
+from typing import Optional, List, Literal
+from app.db.queries import AdminQueries, SubscriptionQueries, PaymentQueries, TokenQueries, BankSettingsQueries, AnalyticsQueries, catalog_cache
 from app.api.dependencies.admin_auth import verify_admin_token
 from datetime import datetime, timedelta
-from app.core.supabase_client import supabase
+from app.core.supabase_async import SupabaseRequestError, is_transient_error, supabase_async
+from app.db.payment_confirmations import payment_confirmation_queue
+from app.ai_engine import get_llm_engine
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -26,6 +28,25 @@ class TokenAdjustmentRequest(BaseModel):
     notes: Optional[str] = None
 
 
+class BulkUserFilter(BaseModel):
+    tier: Optional[str] = None
+    status: Optional[str] = None
+    is_banned: Optional[bool] = None
+    email_domain: Optional[str] = None
+    all: bool = False
+
+
+class BulkUserOperationRequest(BaseModel):
+    operation: Literal["grant_tokens", "remove_tokens", "ban", "unban", "set_tier", "cancel_subscription"]
+    user_ids: Optional[List[str]] = Field(None, max_length=50000)
+    filter: Optional[BulkUserFilter] = None
+    amount: Optional[int] = Field(None, gt=0)
+    reason: Optional[str] = None
+    notes: Optional[str] = None
+    tier: Optional[str] = None
+    dry_run: bool = False
+
+
 class SubscriptionActivateRequest(BaseModel):
     user_id: str
     plan_id: str
@@ -93,15 +114,44 @@ async def get_dashboard_stats():
     return stats
 
 
+@router.get("/analytics/usage", dependencies=[Depends(verify_admin_token)])
+async def get_usage_analytics(
+    bucket: str = Query("day", pattern="^(hour|day)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    group_by: str = Query("plan", pattern="^(plan|user|total)$"),
+    metric: Optional[str] = None,
+    user_id: Optional[str] = None,
+    plan: Optional[str] = None
+):
+    end = AnalyticsQueries.naive_utc(end) or datetime.utcnow()
+    start = AnalyticsQueries.naive_utc(start) or end - AnalyticsQueries.DEFAULT_RANGE[bucket]
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if end - start > AnalyticsQueries.MAX_RANGE[bucket]:
+        raise HTTPException(status_code=400, detail=f"Range too large for {bucket} buckets (max {AnalyticsQueries.MAX_RANGE[bucket].days} days)")
+
+    series = await AnalyticsQueries.get_usage(bucket, start, end, group_by, metric, user_id, plan)
+    return {"bucket": bucket, "start": start, "end": end, "group_by": group_by, "series": series}
+
+
+@router.get("/llm-metrics", dependencies=[Depends(verify_admin_token)])
+async def get_llm_metrics():
+    return get_llm_engine().resilience.snapshot()
+
+
 @router.get("/users", dependencies=[Depends(verify_admin_token)])
 async def list_users(
+    response: Response,
     search: Optional[str] = Query(None),
     tier: Optional[str] = Query(None),
     status: Optional[str] = Query(None),
     limit: int = Query(50, ge=1, le=100),
-    offset: int = Query(0, ge=0)
+    cursor: Optional[str] = Query(None)
 ):
-    users = await AdminQueries.get_all_users(search=search, tier=tier, status=status, limit=limit, offset=offset)
+    users, next_cursor = await AdminQueries.get_all_users(search=search, tier=tier, status=status, limit=limit, cursor=cursor)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return users
 
 
@@ -127,6 +177,40 @@ async def update_user(user_id: str, payload: UserUpdateRequest):
     return user
 
 
+@router.post("/users/bulk", dependencies=[Depends(verify_admin_token)])
+async def bulk_user_operation(payload: BulkUserOperationRequest):
+    user_filter = payload.filter.dict(exclude_none=True) if payload.filter else {}
+    if not user_filter.get("all"):
+        user_filter.pop("all", None)
+    user_filter = user_filter or None
+    if not payload.user_ids and not user_filter:
+        raise HTTPException(status_code=400, detail="Provide user_ids or a filter (use filter.all to target every user)")
+    if payload.operation in ("grant_tokens", "remove_tokens") and not payload.amount:
+        raise HTTPException(status_code=400, detail="amount is required for token operations")
+    if payload.operation == "set_tier" and not payload.tier:
+        raise HTTPException(status_code=400, detail="tier is required for set_tier")
+
+    params = {key: value for key, value in {
+        "amount": payload.amount, "reason": payload.reason, "notes": payload.notes, "tier": payload.tier
+    }.items() if value is not None}
+    try:
+        results = await AdminQueries.bulk_operation(
+            payload.operation, payload.user_ids, user_filter, params, dry_run=payload.dry_run
+        )
+    except Exception as e:
+        if is_transient_error(e):
+            raise HTTPException(status_code=503, detail="Bulk operation could not reach the database, nothing was applied")
+        if isinstance(e, (SupabaseRequestError, ValueError)):
+            raise HTTPException(status_code=400, detail=f"Bulk operation rejected: {str(e)}")
+        print(f"Error running bulk operation: {str(e)}")
+        raise HTTPException(status_code=502, detail="Bulk operation failed, nothing was applied")
+
+    summary = {}
+    for row in results:
+        summary[row["status"]] = summary.get(row["status"], 0) + 1
+    return {"operation": payload.operation, "dry_run": payload.dry_run, "summary": summary, "results": results}
+
+
 @router.post("/users/{user_id}/ban", dependencies=[Depends(verify_admin_token)])
 async def ban_user(user_id: str, payload: BanUserRequest):
     user = await AdminQueries.ban_user(user_id, payload.reason)
@@ -197,10 +281,9 @@ async def activate_subscription(payload: SubscriptionActivateRequest):
     
     await AdminQueries.update_user(payload.user_id, {
         "subscription_tier": plan["slug"],
-        "subscription_status": "active",
-        "tokens_total": plan["tokens_per_month"],
-        "tokens_used": 0
+        "subscription_status": "active"
     })
+    await TokenQueries.set_token_allowance(payload.user_id, plan["tokens_per_month"], 0, reason=f"Subscription activated: {plan['name']}")
     
     return subscription
 
@@ -262,40 +345,24 @@ async def list_payments(
 
 
 @router.post("/payments/{payment_id}/confirm", dependencies=[Depends(verify_admin_token)])
-async def confirm_payment(payment_id: str, payload: PaymentConfirmRequest):
-    payment = await PaymentQueries.confirm_payment(payment_id, payload.notes)
-    
-    plan = await SubscriptionQueries.get_plan_by_id(payment["plan_id"])
-    subscription = await SubscriptionQueries.create_subscription(
-        user_id=payment["user_id"],
-        plan_id=payment["plan_id"],
-        plan_name=payment["plan_name"],
-        billing_cycle=payment["billing_cycle"],
-        price_paid=payment["amount"],
-        tokens_total=plan["tokens_per_month"]
-    )
-    
-    profile_update = await AdminQueries.update_user(payment["user_id"], {
-        "subscription_tier": plan["slug"],
-        "subscription_status": "active",
-        "subscription_id": subscription["id"],
-        "tokens_total": plan["tokens_per_month"]
-    })
-    
-    if not profile_update:
-        print(f"Warning: Failed to update profile for user {payment['user_id']}")
-        try:
-            supabase.table("profiles").update({
-                "subscription_tier": plan["slug"],
-                "subscription_status": "active",
-                "subscription_id": subscription["id"],
-                "tokens_total": plan["tokens_per_month"]
-            }).eq("id", payment["user_id"]).execute()
-            print(f"Fallback profile update succeeded for user {payment['user_id']}")
-        except Exception as e:
-            print(f"Error updating profile: {str(e)}")
-    
-    return payment
+async def confirm_payment(payment_id: str, payload: PaymentConfirmRequest, response: Response):
+    try:
+        result = await PaymentQueries.confirm_payment(payment_id, payload.notes)
+    except Exception as e:
+        if not is_transient_error(e):
+            raise HTTPException(status_code=400, detail=str(e))
+        # Supabase is unreachable: keep the confirmation and let the worker deliver it
+        await payment_confirmation_queue.enqueue(payment_id, payload.notes, error=str(e) or type(e).__name__)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {"status": "queued", "payment_id": payment_id}
+
+    if result["status"] == "not_found":
+        raise HTTPException(status_code=404, detail="Payment request not found")
+    if result["status"] == "refused":
+        raise HTTPException(status_code=409, detail=f"Payment request is {result['payment']['status']}")
+    if result["status"] == "plan_not_found":
+        raise HTTPException(status_code=409, detail="Plan for this payment no longer exists")
+    return result["payment"]
 
 
 @router.post("/payments/{payment_id}/reject", dependencies=[Depends(verify_admin_token)])
@@ -312,7 +379,7 @@ async def list_plans():
 
 @router.post("/plans", dependencies=[Depends(verify_admin_token)])
 async def create_plan(payload: PlanCreateRequest):
-    result = supabase.table("subscription_plans").insert({
+    result = await supabase_async.table("subscription_plans").insert({
         "name": payload.name,
         "slug": payload.slug,
         "description": payload.description,
@@ -325,6 +392,7 @@ async def create_plan(payload: PlanCreateRequest):
         "sort_order": payload.sort_order,
         "is_active": True
     }).execute()
+    catalog_cache.invalidate("plans")
     return result.data[0] if result.data else None
 
 
@@ -350,7 +418,8 @@ async def update_plan(plan_id: str, payload: PlanUpdateRequest):
     
     update_data["updated_at"] = datetime.utcnow().isoformat()
     
-    result = supabase.table("subscription_plans").update(update_data).eq("id", plan_id).execute()
+    result = await supabase_async.table("subscription_plans").update(update_data).eq("id", plan_id).execute()
+    catalog_cache.invalidate("plans")
     return result.data[0] if result.data else None
 
 
@@ -358,32 +427,36 @@ async def update_plan(plan_id: str, payload: PlanUpdateRequest):
 async def delete_plan(plan_id: str):
     await SubscriptionQueries.get_plan_by_id(plan_id)
     
-    supabase.table("subscription_plans").update({"is_active": False}).eq("id", plan_id).execute()
+    await supabase_async.table("subscription_plans").update({"is_active": False}).eq("id", plan_id).execute()
+    catalog_cache.invalidate("plans")
     
     return {"status": "Plan deactivated"}
 
 
 @router.get("/token-packs", dependencies=[Depends(verify_admin_token)])
 async def list_token_packs():
-    result = supabase.table("token_packs").select("*").execute()
+    result = await supabase_async.table("token_packs").select("*").execute()
     return result.data or []
 
 
 @router.post("/token-packs", dependencies=[Depends(verify_admin_token)])
 async def create_token_pack(payload: dict):
-    result = supabase.table("token_packs").insert(payload).execute()
+    result = await supabase_async.table("token_packs").insert(payload).execute()
+    catalog_cache.invalidate("token_packs")
     return result.data[0] if result.data else None
 
 
 @router.put("/token-packs/{pack_id}", dependencies=[Depends(verify_admin_token)])
 async def update_token_pack(pack_id: str, payload: dict):
-    result = supabase.table("token_packs").update(payload).eq("id", pack_id).execute()
+    result = await supabase_async.table("token_packs").update(payload).eq("id", pack_id).execute()
+    catalog_cache.invalidate("token_packs")
     return result.data[0] if result.data else None
 
 
 @router.delete("/token-packs/{pack_id}", dependencies=[Depends(verify_admin_token)])
 async def delete_token_pack(pack_id: str):
-    result = supabase.table("token_packs").delete().eq("id", pack_id).execute()
+    result = await supabase_async.table("token_packs").delete().eq("id", pack_id).execute()
+    catalog_cache.invalidate("token_packs")
     return {"success": True, "message": "Token pack deleted"}
 
 
@@ -396,6 +469,7 @@ async def get_settings():
 @router.put("/settings", dependencies=[Depends(verify_admin_token)])
 async def update_settings(payload: BankSettingsUpdate):
     settings = await BankSettingsQueries.update_bank_settings(payload.dict(exclude_none=True))
+    catalog_cache.invalidate("bank_settings")
     return settings
 
 
@@ -409,23 +483,9 @@ class TokenCostUpdate(BaseModel):
 @router.get("/token-config", dependencies=[Depends(verify_admin_token)])
 async def get_token_config():
     try:
-        result = supabase.rpc('get_token_config').execute()
-        if result.data and len(result.data) > 0:
-            return result.data[0]
-        return {
-            "cost_per_message": 1.0,
-            "cost_per_character_response": 0.0,
-            "enabled_per_message": True,
-            "enabled_per_character": False
-        }
+        return (await TokenQueries.get_cached_token_config()).value
     except Exception as e:
-        print(f"Error fetching token config: {str(e)}")
-        return {
-            "cost_per_message": 1.0,
-            "cost_per_character_response": 0.0,
-            "enabled_per_message": True,
-            "enabled_per_character": False
-        }
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f"Token config unavailable: {str(e)}")
 
 
 @router.put("/token-config", dependencies=[Depends(verify_admin_token)])
@@ -434,7 +494,8 @@ async def update_token_config(payload: TokenCostUpdate):
         update_data = payload.dict(exclude_none=True)
         update_data["updated_at"] = datetime.utcnow().isoformat()
         
-        result = supabase.table("token_config").update(update_data).execute()
+        result = await supabase_async.table("token_config").update(update_data).execute()
+        catalog_cache.invalidate("token_config")
         if result.data and len(result.data) > 0:
             return result.data[0]
         return {"success": True}
@@ -1,8 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta, datetime
 from datetime import timedelta as td
-from app.database import get_db
+from app.database import get_async_db
 from app.models import User
 from app import schemas, security
 from app.config import get_settings
@@ -19,7 +20,7 @@ logger = logging.getLogger(__name__)
 
 
 @router.post("/register", response_model=schemas.TokenResponse)
-async def register(user_data: ValidatedUserCreate, db: Session = Depends(get_db)):
+async def register(user_data: ValidatedUserCreate, db: AsyncSession = Depends(get_async_db)):
     if not EmailValidator.validate_email(user_data.email):
         logger.warning(f"Invalid email format attempted: {user_data.email}")
         raise HTTPException(
@@ -27,7 +28,7 @@ async def register(user_data: ValidatedUserCreate, db: Session = Depends(get_db)
             detail="Invalid email format"
         )
     
-    existing_user = db.query(User).filter(User.email == user_data.email.lower()).first()
+    existing_user = await db.scalar(select(User).where(User.email == user_data.email.lower()))
     if existing_user:
         logger.warning(f"Duplicate registration attempt for email: {user_data.email}")
         raise HTTPException(
@@ -35,7 +36,7 @@ async def register(user_data: ValidatedUserCreate, db: Session = Depends(get_db)
             detail="This account already exists"
         )
     
-    existing_username = db.query(User).filter(User.username == user_data.username).first()
+    existing_username = await db.scalar(select(User).where(User.username == user_data.username))
     if existing_username:
         logger.warning(f"Duplicate username attempt: {user_data.username}")
         raise HTTPException(
@@ -43,7 +44,7 @@ async def register(user_data: ValidatedUserCreate, db: Session = Depends(get_db)
             detail="This account already exists"
         )
     
-    hashed_password = security.get_password_hash(user_data.password)
+    hashed_password = await security.get_password_hash(user_data.password)
     
     new_user = User(
         email=user_data.email,
@@ -52,8 +53,8 @@ async def register(user_data: ValidatedUserCreate, db: Session = Depends(get_db)
     )
     
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = security.create_access_token(
@@ -75,7 +76,7 @@ async def register(user_data: ValidatedUserCreate, db: Session = Depends(get_db)
 
 
 @router.post("/login", response_model=schemas.TokenResponse)
-async def login(credentials: schemas.UserLogin, db: Session = Depends(get_db)):
+async def login(credentials: schemas.UserLogin, db: AsyncSession = Depends(get_async_db)):
     if not EmailValidator.validate_email(credentials.email):
         logger.warning(f"Login attempt with invalid email format: {credentials.email}")
         raise HTTPException(
@@ -83,9 +84,9 @@ async def login(credentials: schemas.UserLogin, db: Session = Depends(get_db)):
             detail="Invalid credentials"
         )
     
-    user = db.query(User).filter(User.email == credentials.email.lower()).first()
+    user = await db.scalar(select(User).where(User.email == credentials.email.lower()))
     
-    if not user or not security.verify_password(credentials.password, user.hashed_password):
+    if not user or not await security.verify_password(credentials.password, user.hashed_password):
         logger.warning(f"Failed login attempt for email: {credentials.email}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -1,15 +1,33 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from app.database import get_db
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Response, UploadFile, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import noload, selectinload
+from typing import Optional
+from datetime import datetime
+import asyncio
+import uuid
+from app.config import get_settings
+from app.database import get_async_db
 from app.models import User, ChatSession, ChatMessage
 from app import schemas, security
-from app.ai_engine.gemini import GeminiEngine
+from app.ai_engine import get_llm_engine, LLMError
+from app.ai_engine.prompt_builder import PromptBuilder
 from app.training.vector_store import VectorStore
 from app.safety_filter import SafetyFilter
+from app.db.token_reservations import token_reservations
+from app.db.write_behind import chat_write_buffer
+from app.db.archive import ChatArchiveError, chat_archiver
+from app.db.search import ChatSearch
+from app.db.chat_transfer import ChatImportError, ChatTransfer
+from app.utils.pagination import CursorPagination
 
 router = APIRouter(prefix="/chat", tags=["chat"])
+settings = get_settings()
 
-gemini_engine = GeminiEngine()
+SUMMARY_PREVIEW_CHARS = 120
+
+llm_engine = get_llm_engine()
 vector_store = VectorStore()
 
 
@@ -17,7 +35,7 @@ vector_store = VectorStore()
 async def send_message(
     chat_request: schemas.ChatRequest,
     current_user: User = Depends(security.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     is_safe, message_or_redirect = SafetyFilter.filter_query(chat_request.message)
     
@@ -27,88 +45,113 @@ async def send_message(
             detail=message_or_redirect
         )
     
+    await chat_write_buffer.flush_if_pending(current_user.id, db)
+    
+    received_at = datetime.utcnow()
     session_id = chat_request.session_id
     if not session_id:
-        session = ChatSession(user_id=current_user.id)
-        db.add(session)
-        db.commit()
-        db.refresh(session)
+        session = ChatSession(
+            id=str(uuid.uuid4()),
+            user_id=current_user.id,
+            created_at=received_at,
+            updated_at=received_at
+        )
         session_id = session.id
+        is_new_session = True
     else:
-        session = db.query(ChatSession).filter(
-            ChatSession.id == session_id,
-            ChatSession.user_id == current_user.id
-        ).first()
-        
-        if not session:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Chat session not found"
-            )
+        session = await get_user_session(db, session_id, current_user.id, rehydrate=True)
+        is_new_session = False
     
-    user_message = ChatMessage(
-        session_id=session_id,
-        role="user",
-        content=chat_request.message
-    )
-    db.add(user_message)
-    db.commit()
-    db.refresh(user_message)
-    
-    retrieved_docs = vector_store.retrieve(current_user.id, chat_request.message, n_results=3)
-    context = ""
-    if retrieved_docs:
-        context = "Retrieved knowledge base:\n"
-        for doc in retrieved_docs:
-            context += f"- {doc['content'][:200]}...\n"
-    
-    conversation_history = []
-    messages = db.query(ChatMessage).filter(
-        ChatMessage.session_id == session_id
-    ).order_by(ChatMessage.created_at).all()
-    
-    for msg in messages[:-1]:
-        gemini_role = "model" if msg.role == "assistant" else "user"
-        conversation_history.append({
-            "role": gemini_role,
-            "parts": [{"text": msg.content}]
-        })
+    async def load_history():
+        if is_new_session:
+            return []
+        messages = (await db.scalars(
+            select(ChatMessage).where(
+                ChatMessage.session_id == session_id
+            ).order_by(ChatMessage.created_at)
+        )).all()
+        return [
+            {
+                "role": "model" if msg.role == "assistant" else "user",
+                "parts": [{"text": msg.content}]
+            }
+            for msg in messages
+        ]
     
-    gemini_engine.start_chat(conversation_history)
-    
-    system_prompt = GeminiEngine.get_system_prompt()
-    full_prompt = f"{system_prompt}\n\n{chat_request.message}"
-    
-    try:
-        ai_response = gemini_engine.send_message(full_prompt, context)
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error generating response: {str(e)}"
+    # The balance check, retrieval (in a worker thread) and the history query run concurrently;
+    # the hold is in place before anything reaches the LLM, so an empty balance never does
+    reservation, (retrieved_docs, conversation_history) = await token_reservations.reserve_during(
+        current_user.id,
+        asyncio.gather(
+            asyncio.to_thread(vector_store.retrieve, current_user.id, chat_request.message, 3),
+            load_history()
         )
-    
-    ai_response = SafetyFilter.add_educational_disclaimer(ai_response, chat_request.message)
-    
-    ai_message = ChatMessage(
-        session_id=session_id,
-        role="assistant",
-        content=ai_response
     )
-    db.add(ai_message)
-    db.commit()
-    db.refresh(ai_message)
-    
-    # Deduct 1 token for the chat message
-    try:
-        from app.db.queries import TokenQueries
-        await TokenQueries.add_token_transaction(
-            user_id=current_user.id,
-            amount=1,
-            transaction_type="usage",
-            reason="Chat message"
+    with reservation:
+        system_prompt = llm_engine.get_system_prompt()
+        full_prompt = f"{system_prompt}\n\n{chat_request.message}"
+
+        prompt = PromptBuilder.build(
+            message=full_prompt,
+            docs=retrieved_docs,
+            history=conversation_history,
+            context_header="Retrieved knowledge base:\n",
+            format_chunk=lambda doc: f"- {doc['content']}...\n",
+            max_chunk_chars=200
+        )
+
+        try:
+            result = await llm_engine.generate_async(full_prompt, prompt["context"], history=prompt["history"])
+            ai_response = result["text"]
+        except LLMError as e:
+            raise HTTPException(
+                status_code=e.response_status,
+                detail=f"Error generating response: {str(e)}",
+                headers={"Retry-After": str(e.retry_after)} if e.retry_after else None
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error generating response: {str(e)}"
+            )
+
+        ai_response = SafetyFilter.add_educational_disclaimer(ai_response, chat_request.message)
+        responded_at = datetime.utcnow()
+
+        user_message = ChatMessage(
+            id=str(uuid.uuid4()),
+            session_id=session_id,
+            role="user",
+            content=chat_request.message,
+            created_at=received_at
+        )
+        ai_message = ChatMessage(
+            id=str(uuid.uuid4()),
+            session_id=session_id,
+            role="assistant",
+            content=ai_response,
+            created_at=responded_at
+        )
+        if chat_write_buffer.enabled:
+            await chat_write_buffer.enqueue(
+                current_user.id,
+                new_session=session if is_new_session else None,
+                messages=[user_message, ai_message],
+                touch=None if is_new_session else {"id": session_id, "updated_at": responded_at}
+            )
+        else:
+            if is_new_session:
+                db.add(session)
+            session.updated_at = responded_at
+            db.add_all([user_message, ai_message])
+            await db.commit()
+
+        reservation.settle(
+            response_text=result["text"],
+            reason="Chat message",
+            input_tokens=result["input_tokens"],
+            output_tokens=result["output_tokens"]
         )
-    except Exception as e:
-        print(f"Warning: Failed to deduct token: {str(e)}")
     
     return {
         "message": {
@@ -122,56 +165,202 @@ async def send_message(
     }
 
 
+async def get_user_session(db: AsyncSession, session_id: str, user_id: str, *options, rehydrate: bool = False) -> ChatSession:
+    await chat_write_buffer.flush_if_pending(user_id, db)
+    query = select(ChatSession).where(
+        ChatSession.id == session_id,
+        ChatSession.user_id == user_id
+    )
+    session = await db.scalar(query.options(*(options or (noload(ChatSession.messages),))))
+
+    if not session:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Chat session not found"
+        )
+
+    if rehydrate and session.archived_at:
+        try:
+            await chat_archiver.rehydrate(db, session)
+        except ChatArchiveError as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(e)
+            )
+        if options:
+            session = await db.scalar(query.options(*options).execution_options(populate_existing=True))
+    return session
+
+
+async def page_messages(db: AsyncSession, session_id: str, limit: int, cursor: Optional[str] = None) -> tuple:
+    """Newest-first page of a session's messages; the cursor walks back in time"""
+    query = select(ChatMessage).where(ChatMessage.session_id == session_id)
+    position = CursorPagination.decode(cursor)
+    if position:
+        query = query.where(tuple_(ChatMessage.created_at, ChatMessage.id) < position)
+
+    query = query.order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc()).limit(limit + 1)
+    rows = (await db.scalars(query)).all()
+    return rows[:limit], CursorPagination.next_cursor(rows, limit, "created_at")
+
+
 @router.get("/sessions", response_model=list[schemas.ChatSessionResponse])
 async def get_sessions(
     current_user: User = Depends(security.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    sessions = db.query(ChatSession).filter(
-        ChatSession.user_id == current_user.id
-    ).order_by(ChatSession.updated_at.desc()).all()
-    
-    return sessions
+    """Every session with its messages; paginated lists use /sessions/summaries"""
+    await chat_write_buffer.flush_if_pending(current_user.id, db)
+    return (await db.scalars(
+        select(ChatSession).options(selectinload(ChatSession.messages)).where(
+            ChatSession.user_id == current_user.id
+        ).order_by(ChatSession.updated_at.desc(), ChatSession.id.desc())
+    )).all()
+
+
+@router.get("/sessions/summaries", response_model=schemas.ChatSessionSummaryPage)
+async def get_session_summaries(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(security.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    await chat_write_buffer.flush_if_pending(current_user.id, db)
+    hot_message_count = select(func.count(ChatMessage.id)).where(
+        ChatMessage.session_id == ChatSession.id
+    ).correlate(ChatSession).scalar_subquery()
+    message_count = func.coalesce(ChatSession.archived_message_count, 0) + hot_message_count
+    last_message_preview = select(func.substr(ChatMessage.content, 1, SUMMARY_PREVIEW_CHARS)).where(
+        ChatMessage.session_id == ChatSession.id
+    ).order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc()).limit(1).correlate(ChatSession).scalar_subquery()
+
+    query = select(
+        ChatSession.id,
+        ChatSession.title,
+        ChatSession.created_at,
+        ChatSession.updated_at,
+        message_count.label("message_count"),
+        last_message_preview.label("last_message_preview"),
+        ChatSession.archived_at.is_not(None).label("archived"),
+    ).where(ChatSession.user_id == current_user.id)
+
+    position = CursorPagination.decode(cursor)
+    if position:
+        query = query.where(tuple_(ChatSession.updated_at, ChatSession.id) < position)
+
+    query = query.order_by(ChatSession.updated_at.desc(), ChatSession.id.desc()).limit(limit + 1)
+    rows = (await db.execute(query)).all()
+    return {
+        "items": [row._asdict() for row in rows[:limit]],
+        "next_cursor": CursorPagination.next_cursor(rows, limit, "updated_at"),
+    }
+
+
+@router.get("/search", response_model=schemas.ChatSearchPage)
+async def search_messages(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000),
+    current_user: User = Depends(security.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    await chat_write_buffer.flush_if_pending(current_user.id, db)
+    rows = await ChatSearch.search(db, current_user.id, q, limit, offset)
+    return {
+        "query": q,
+        "items": rows[:limit],
+        "limit": limit,
+        "offset": offset,
+        "has_more": len(rows) > limit,
+    }
+
+
+@router.get("/export")
+async def export_chats(current_user: User = Depends(security.get_current_user)):
+    """Download every session and message as NDJSON, streamed straight from the database"""
+    filename = f"chats-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.ndjson"
+    return StreamingResponse(
+        ChatTransfer.export_ndjson(current_user.id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@router.post("/import", response_model=schemas.ChatImportResponse)
+async def import_chats(
+    file: UploadFile = File(...),
+    current_user: User = Depends(security.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Load an NDJSON export as new sessions; nothing is saved if any line is invalid"""
+    if file.size and file.size > settings.MAX_UPLOAD_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"File size exceeds maximum allowed size of {settings.MAX_UPLOAD_SIZE / 1024 / 1024}MB"
+        )
+
+    async def chunks():
+        while chunk := await file.read(64 * 1024):
+            yield chunk
+
+    try:
+        return await ChatTransfer.import_ndjson(db, current_user.id, chunks())
+    except ChatImportError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
 
 @router.get("/session/{session_id}", response_model=schemas.ChatSessionResponse)
 async def get_session(
     session_id: str,
+    response: Response,
+    message_limit: Optional[int] = Query(None, ge=1, le=200),
+    cursor: Optional[str] = None,
     current_user: User = Depends(security.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    session = db.query(ChatSession).filter(
-        ChatSession.id == session_id,
-        ChatSession.user_id == current_user.id
-    ).first()
-    
-    if not session:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Chat session not found"
-        )
-    
-    return session
+    """The session with all its messages, or with its newest message_limit; X-Next-Cursor pages further back"""
+    if message_limit is None:
+        return await get_user_session(db, session_id, current_user.id, selectinload(ChatSession.messages), rehydrate=True)
+
+    session = await get_user_session(db, session_id, current_user.id, rehydrate=True)
+    messages, next_cursor = await page_messages(db, session.id, message_limit, cursor)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+    return {
+        "id": session.id,
+        "title": session.title,
+        "created_at": session.created_at,
+        "updated_at": session.updated_at,
+        "messages": list(reversed(messages)),
+    }
+
+
+@router.get("/session/{session_id}/messages", response_model=schemas.ChatMessagePage)
+async def get_session_messages(
+    session_id: str,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(security.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    session = await get_user_session(db, session_id, current_user.id, rehydrate=True)
+    messages, next_cursor = await page_messages(db, session.id, limit, cursor)
+    return {"items": messages, "next_cursor": next_cursor}
 
 
 @router.delete("/session/{session_id}")
 async def delete_session(
     session_id: str,
     current_user: User = Depends(security.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    session = db.query(ChatSession).filter(
-        ChatSession.id == session_id,
-        ChatSession.user_id == current_user.id
-    ).first()
-    
-    if not session:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Chat session not found"
-        )
+    session = await get_user_session(db, session_id, current_user.id, selectinload(ChatSession.messages))
+    archive_path = session.archive_path
     
-    db.delete(session)
-    db.commit()
+    await db.delete(session)
+    await db.commit()
+    if archive_path:
+        await asyncio.to_thread(chat_archiver.remove_blob, archive_path)
     
     return {"message": "Chat session deleted successfully"}
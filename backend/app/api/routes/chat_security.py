@@ -1,18 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
-from passlib.context import CryptContext
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import secrets
 from datetime import datetime, timedelta
-from app.database import get_db
+from app.database import get_async_db
 from app.models import User, ChatSecurity
 from app import security
 from app.core.supabase_client import supabase
 
 router = APIRouter(prefix="/chat-security", tags=["chat-security"])
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 
 class SetPasswordRequest(BaseModel):
     password: str
@@ -66,7 +64,7 @@ def is_strong_password(password: str) -> bool:
 async def set_password(
     req: SetPasswordRequest,
     current_user: User = Depends(security.get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     if not is_strong_password(req.password):
         raise HTTPException(
@@ -76,9 +74,9 @@ async def set_password(
 
     try:
         salt = secrets.token_hex(16)
-        password_hash = pwd_context.hash(req.password + salt)
+        password_hash = await security.get_password_hash(req.password + salt)
 
-        chat_security = db.query(ChatSecurity).filter(ChatSecurity.user_id == current_user.id).first()
+        chat_security = await db.scalar(select(ChatSecurity).where(ChatSecurity.user_id == current_user.id))
         
         if chat_security:
             chat_security.chat_password_hash = password_hash
@@ -100,7 +98,7 @@ async def set_password(
             )
             db.add(chat_security)
 
-        db.commit()
+        await db.commit()
 
         try:
             supabase.table("profiles").update({
@@ -113,8 +111,10 @@ async def set_password(
             "success": True,
             "message": "Chat password set successfully"
         }
+    except HTTPException:
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to set password: {str(e)}",
@@ -125,10 +125,10 @@ async def set_password(
 async def verify_password(
     req: VerifyPasswordRequest,
     current_user: User = Depends(security.get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     try:
-        chat_security = db.query(ChatSecurity).filter(ChatSecurity.user_id == current_user.id).first()
+        chat_security = await db.scalar(select(ChatSecurity).where(ChatSecurity.user_id == current_user.id))
         
         if not chat_security:
             raise HTTPException(
@@ -145,13 +145,13 @@ async def verify_password(
             }
 
         password_with_salt = req.password + chat_security.chat_password_salt
-        is_valid = pwd_context.verify(password_with_salt, chat_security.chat_password_hash)
+        is_valid = await security.verify_password(password_with_salt, chat_security.chat_password_hash)
 
         if is_valid:
             chat_security.failed_chat_password_attempts = 0
             chat_security.chat_locked_until = None
             chat_security.last_chat_access = datetime.utcnow()
-            db.commit()
+            await db.commit()
 
             chat_session_token = secrets.token_hex(32)
             expires_at = (datetime.utcnow() + timedelta(minutes=60)).isoformat()
@@ -173,7 +173,7 @@ async def verify_password(
 
             chat_security.failed_chat_password_attempts = new_attempts
             chat_security.chat_locked_until = lock_until
-            db.commit()
+            await db.commit()
 
             return {
                 "success": False,
@@ -185,7 +185,7 @@ async def verify_password(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to verify password: {str(e)}",
@@ -196,10 +196,10 @@ async def verify_password(
 async def change_password(
     req: ChangePasswordRequest,
     current_user: User = Depends(security.get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     try:
-        chat_security = db.query(ChatSecurity).filter(ChatSecurity.user_id == current_user.id).first()
+        chat_security = await db.scalar(select(ChatSecurity).where(ChatSecurity.user_id == current_user.id))
         
         if not chat_security:
             raise HTTPException(
@@ -208,7 +208,7 @@ async def change_password(
             )
 
         password_with_salt = req.current_password + chat_security.chat_password_salt
-        is_valid = pwd_context.verify(password_with_salt, chat_security.chat_password_hash)
+        is_valid = await security.verify_password(password_with_salt, chat_security.chat_password_hash)
 
         if not is_valid:
             return {
@@ -223,12 +223,12 @@ async def change_password(
             )
 
         new_salt = secrets.token_hex(16)
-        new_hash = pwd_context.hash(req.new_password + new_salt)
+        new_hash = await security.get_password_hash(req.new_password + new_salt)
 
         chat_security.chat_password_hash = new_hash
         chat_security.chat_password_salt = new_salt
         chat_security.chat_password_set_at = datetime.utcnow()
-        db.commit()
+        await db.commit()
 
         try:
             supabase.table("profiles").update({
@@ -244,7 +244,7 @@ async def change_password(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to change password: {str(e)}",
@@ -255,10 +255,10 @@ async def change_password(
 async def disable_security(
     req: DisableSecurityRequest,
     current_user: User = Depends(security.get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     try:
-        chat_security = db.query(ChatSecurity).filter(ChatSecurity.user_id == current_user.id).first()
+        chat_security = await db.scalar(select(ChatSecurity).where(ChatSecurity.user_id == current_user.id))
         
         if not chat_security:
             raise HTTPException(
@@ -267,7 +267,7 @@ async def disable_security(
             )
 
         password_with_salt = req.password + chat_security.chat_password_salt
-        is_valid = pwd_context.verify(password_with_salt, chat_security.chat_password_hash)
+        is_valid = await security.verify_password(password_with_salt, chat_security.chat_password_hash)
 
         if not is_valid:
             return {
@@ -282,7 +282,7 @@ async def disable_security(
         chat_security.chat_password_set_at = None
         chat_security.failed_chat_password_attempts = 0
         chat_security.chat_locked_until = None
-        db.commit()
+        await db.commit()
 
         try:
             supabase.table("profiles").update({
@@ -302,7 +302,7 @@ async def disable_security(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to disable security: {str(e)}",
@@ -312,10 +312,10 @@ async def disable_security(
 @router.get("/profile", response_model=ChatSecurityResponse)
 async def get_profile(
     current_user: User = Depends(security.get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     try:
-        chat_security = db.query(ChatSecurity).filter(ChatSecurity.user_id == current_user.id).first()
+        chat_security = await db.scalar(select(ChatSecurity).where(ChatSecurity.user_id == current_user.id))
         
         if not chat_security:
             raise HTTPException(
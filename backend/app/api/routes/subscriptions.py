@@ -1,10 +1,14 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Header
+from fastapi import APIRouter, HTTPException, Depends, status, Header, Query, Request, Response
 from pydantic import BaseModel
-from typing import Optional
-from app.db.queries import SubscriptionQueries, PaymentQueries, TokenQueries, BankSettingsQueries
+from typing import Awaitable, Optional
+from datetime import datetime
+from app.db.queries import SubscriptionQueries, PaymentQueries, TokenQueries, BankSettingsQueries, TokenPackQueries
 from app.security import verify_token
+from app.config import get_settings
+from app.utils.read_through_cache import CacheEntry, cached_json_response
 
 router = APIRouter(tags=["subscriptions"])
+settings = get_settings()
 
 
 async def get_token_from_header(authorization: Optional[str] = Header(None)) -> str:
@@ -51,10 +55,19 @@ class TokenBalance(BaseModel):
     available: int
 
 
+async def catalog_entry(load: Awaitable[CacheEntry]) -> CacheEntry:
+    """Cached catalog data; 503 only when Supabase is down and nothing (not even stale) is cached"""
+    try:
+        return await load
+    except Exception as e:
+        print(f"Error loading catalog: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Catalog temporarily unavailable")
+
+
 @router.get("/subscription-plans")
-async def get_subscription_plans():
-    plans = await SubscriptionQueries.get_plans(active_only=True)
-    return plans
+async def get_subscription_plans(request: Request):
+    entry = await catalog_entry(SubscriptionQueries.get_cached_plans())
+    return cached_json_response(request, entry, settings.CATALOG_CACHE_MAX_AGE_SECONDS)
 
 
 @router.get("/subscription-plans/{slug}")
@@ -156,22 +169,30 @@ async def get_token_balance(token: str = Depends(get_token_from_header)):
 
 
 @router.get("/tokens/transactions")
-async def get_token_transactions(token: str = Depends(get_token_from_header)):
+async def get_token_transactions(
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    token: str = Depends(get_token_from_header)
+):
     auth_data = await verify_token(token)
     user_id = auth_data["user_id"]
     
-    transactions = await TokenQueries.get_token_transactions(user_id)
+    transactions, next_cursor = await TokenQueries.get_token_transactions(user_id, limit, cursor, start, end)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return transactions
 
 
 @router.get("/bank-settings")
-async def get_bank_settings():
-    settings = await BankSettingsQueries.get_bank_settings()
-    return settings or {}
+async def get_bank_settings(request: Request):
+    entry = await catalog_entry(BankSettingsQueries.get_cached_bank_settings())
+    return cached_json_response(request, entry, settings.CATALOG_CACHE_MAX_AGE_SECONDS)
 
 
 @router.get("/token-packs")
-async def get_token_packs():
-    from app.core.supabase_client import supabase
-    result = supabase.table("token_packs").select("*").eq("is_active", True).execute()
-    return result.data or []
+async def get_token_packs(request: Request):
+    entry = await catalog_entry(TokenPackQueries.get_cached_token_packs())
+    return cached_json_response(request, entry, settings.CATALOG_CACHE_MAX_AGE_SECONDS)
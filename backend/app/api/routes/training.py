@@ -1,15 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile, Query, Form
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
 import os
 import uuid
 from datetime import datetime
-from app.database import get_db
+from app.database import get_async_db
 from app.models import User, TrainingDocument
 from app import schemas, security
 from app.config import get_settings
 from app.training.document_processor import DocumentProcessor
 from app.training.vector_store import VectorStore
+from app.ai_engine.prompt_builder import PromptBuilder
 from app.utils.checksum import ChecksumUtils
+from app.db.token_reservations import token_reservations
 
 settings = get_settings()
 router = APIRouter(prefix="/training", tags=["training"])
@@ -18,6 +22,15 @@ vector_store = VectorStore()
 
 ALLOWED_EXTENSIONS = {"pdf", "txt", "md", "json"}
 
+TRAINING_CHAT_INSTRUCTIONS = """You are an AI assistant that answers questions based ONLY on the provided training documents.
+        
+IMPORTANT RULES:
+1. ONLY use information from the training documents provided
+2. If the answer is not in the training documents, say "I couldn't find this information in your training documents"
+3. Always cite which document you're using
+4. Do not make up information or use general knowledge
+5. Be helpful but honest about the limitations of your training data"""
+
 
 def validate_file_extension(filename: str) -> str:
     if "." not in filename:
@@ -40,7 +53,7 @@ def validate_file_extension(filename: str) -> str:
 async def upload_document(
     file: UploadFile = File(...),
     current_user: User = Depends(security.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     if not file.filename:
         raise HTTPException(
@@ -106,8 +119,8 @@ async def upload_document(
     )
     
     db.add(db_document)
-    db.commit()
-    db.refresh(db_document)
+    await db.commit()
+    await db.refresh(db_document)
     
     return {
         "id": db_document.id,
@@ -126,7 +139,7 @@ async def upload_document_with_two_way_verification(
     file: UploadFile = File(...),
     client_checksum: str = Form(...),
     current_user: User = Depends(security.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     if not file.filename:
         raise HTTPException(
@@ -201,13 +214,13 @@ async def upload_document_with_two_way_verification(
     )
     
     db.add(db_document)
-    db.commit()
-    db.refresh(db_document)
+    await db.commit()
+    await db.refresh(db_document)
     
     if not verification_match:
         try:
             from sqlalchemy import text
-            db.execute(
+            await db.execute(
                 text("""
                     INSERT INTO security_events (user_id, event_type, resource_type, resource_id, description, severity, metadata)
                     VALUES (:user_id, :event_type, :resource_type, :resource_id, :description, :severity, :metadata)
@@ -226,7 +239,7 @@ async def upload_document_with_two_way_verification(
                     }
                 }
             )
-            db.commit()
+            await db.commit()
         except Exception as e:
             print(f"Failed to log security event: {str(e)}")
     
@@ -249,11 +262,13 @@ async def upload_document_with_two_way_verification(
 @router.get("/documents", response_model=list[schemas.TrainingDocumentResponse])
 async def get_documents(
     current_user: User = Depends(security.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    documents = db.query(TrainingDocument).filter(
-        TrainingDocument.user_id == current_user.id
-    ).order_by(TrainingDocument.created_at.desc()).all()
+    documents = (await db.scalars(
+        select(TrainingDocument).where(
+            TrainingDocument.user_id == current_user.id
+        ).order_by(TrainingDocument.created_at.desc())
+    )).all()
     
     return documents
 
@@ -262,12 +277,14 @@ async def get_documents(
 async def verify_document_integrity(
     source_name: str,
     current_user: User = Depends(security.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    document = db.query(TrainingDocument).filter(
-        TrainingDocument.source_name == source_name,
-        TrainingDocument.user_id == current_user.id
-    ).first()
+    document = await db.scalar(
+        select(TrainingDocument).where(
+            TrainingDocument.source_name == source_name,
+            TrainingDocument.user_id == current_user.id
+        )
+    )
     
     if not document:
         raise HTTPException(
@@ -304,7 +321,7 @@ async def verify_document_integrity(
     if not verified:
         try:
             from sqlalchemy import text
-            db.execute(
+            await db.execute(
                 text("""
                     INSERT INTO security_events (user_id, event_type, resource_type, resource_id, description, severity, metadata)
                     VALUES (:user_id, :event_type, :resource_type, :resource_id, :description, :severity, :metadata)
@@ -319,7 +336,7 @@ async def verify_document_integrity(
                     "metadata": {"expected": document.checksum_sha256, "computed": current_checksum}
                 }
             )
-            db.commit()
+            await db.commit()
         except Exception as e:
             print(f"Failed to log security event: {str(e)}")
     
@@ -335,12 +352,14 @@ async def verify_document_integrity(
 async def verify_two_way_document_integrity(
     source_name: str,
     current_user: User = Depends(security.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    document = db.query(TrainingDocument).filter(
-        TrainingDocument.source_name == source_name,
-        TrainingDocument.user_id == current_user.id
-    ).first()
+    document = await db.scalar(
+        select(TrainingDocument).where(
+            TrainingDocument.source_name == source_name,
+            TrainingDocument.user_id == current_user.id
+        )
+    )
     
     if not document:
         raise HTTPException(
@@ -377,7 +396,7 @@ async def verify_two_way_document_integrity(
     if not checksums_match:
         try:
             from sqlalchemy import text
-            db.execute(
+            await db.execute(
                 text("""
                     INSERT INTO security_events (user_id, event_type, resource_type, resource_id, description, severity, metadata)
                     VALUES (:user_id, :event_type, :resource_type, :resource_id, :description, :severity, :metadata)
@@ -397,7 +416,7 @@ async def verify_two_way_document_integrity(
                     }
                 }
             )
-            db.commit()
+            await db.commit()
         except Exception as e:
             print(f"Failed to log security event: {str(e)}")
     
@@ -417,12 +436,14 @@ async def verify_two_way_document_integrity(
 async def delete_document(
     source_name: str,
     current_user: User = Depends(security.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    document = db.query(TrainingDocument).filter(
-        TrainingDocument.source_name == source_name,
-        TrainingDocument.user_id == current_user.id
-    ).first()
+    document = await db.scalar(
+        select(TrainingDocument).where(
+            TrainingDocument.source_name == source_name,
+            TrainingDocument.user_id == current_user.id
+        )
+    )
     
     if not document:
         raise HTTPException(
@@ -432,8 +453,8 @@ async def delete_document(
     
     vector_store.delete_collection_by_source(current_user.id, source_name)
     
-    db.delete(document)
-    db.commit()
+    await db.delete(document)
+    await db.commit()
     
     return {"message": "Document deleted successfully"}
 
@@ -456,9 +477,9 @@ async def test_retrieval(
 async def training_chat(
     chat_request: schemas.TrainingChatRequest,
     current_user: User = Depends(security.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    from app.ai_engine.gemini import GeminiEngine
+    from app.ai_engine import get_llm_engine, LLMError
     from app.safety_filter import SafetyFilter
     
     is_safe, message_or_redirect = SafetyFilter.filter_query(chat_request.message)
@@ -469,9 +490,9 @@ async def training_chat(
             detail=message_or_redirect
         )
     
-    documents = db.query(TrainingDocument).filter(
-        TrainingDocument.user_id == current_user.id
-    ).all()
+    documents = (await db.scalars(
+        select(TrainingDocument).where(TrainingDocument.user_id == current_user.id)
+    )).all()
     
     if not documents:
         raise HTTPException(
@@ -479,11 +500,12 @@ async def training_chat(
             detail="No training documents found. Please upload documents first."
         )
     
-    retrieved_docs = vector_store.retrieve(current_user.id, chat_request.message, n_results=5)
-    
-    if not retrieved_docs:
-        doc_list = "\n".join([f"- {d.filename}" for d in documents])
-        ai_response = f"""I couldn't find relevant information about your query in your training documents.
+    with await token_reservations.reserve(current_user.id) as reservation:
+        retrieved_docs = await asyncio.to_thread(vector_store.retrieve, current_user.id, chat_request.message, 5)
+
+        if not retrieved_docs:
+            doc_list = "\n".join([f"- {d.filename}" for d in documents])
+            ai_response = f"""I couldn't find relevant information about your query in your training documents.
 
 **Your uploaded documents:**
 {doc_list}
@@ -494,56 +516,57 @@ Try asking questions about the topics covered in these documents. For example:
 - Explain [specific concept or topic] from your documents
 
 Feel free to rephrase your question or ask about specific topics from your training materials."""
-        sources = []
-    else:
-        context = "Answer the user's question based ONLY on the following training documents:\n\n"
-        sources = []
-        
-        for doc in retrieved_docs:
-            context += f"From '{doc.get('metadata', {}).get('filename', 'Unknown')}': {doc['content']}\n\n"
-            source_name = doc.get('source_name')
-            if source_name:
-                doc_record = db.query(TrainingDocument).filter(
-                    TrainingDocument.source_name == source_name
-                ).first()
-                if doc_record:
-                    sources.append({
-                        "filename": doc_record.filename,
-                        "source_name": doc_record.source_name
-                    })
-        
-        gemini_engine = GeminiEngine()
-        system_prompt = f"""You are an AI assistant that answers questions based ONLY on the provided training documents.
-        
-IMPORTANT RULES:
-1. ONLY use information from the training documents provided
-2. If the answer is not in the training documents, say "I couldn't find this information in your training documents"
-3. Always cite which document you're using
-4. Do not make up information or use general knowledge
-5. Be helpful but honest about the limitations of your training data
-
-{context}"""
-        
-        try:
-            ai_response = gemini_engine.send_message(chat_request.message, system_prompt)
-        except Exception as e:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Error generating response: {str(e)}"
+            sources = []
+            result = None
+        else:
+            prompt = PromptBuilder.build(
+                message=chat_request.message,
+                instructions=TRAINING_CHAT_INSTRUCTIONS,
+                docs=retrieved_docs,
+                context_header="Answer the user's question based ONLY on the following training documents:\n\n",
+                format_chunk=lambda doc: f"From '{doc.get('metadata', {}).get('filename', 'Unknown')}': {doc['content']}\n\n"
             )
-    
-    ai_response = SafetyFilter.add_educational_disclaimer(ai_response, chat_request.message)
-    
-    try:
-        from app.db.queries import TokenQueries
-        await TokenQueries.add_token_transaction(
-            user_id=current_user.id,
-            amount=1,
-            transaction_type="usage",
-            reason="Training chat message"
+            sources = []
+            documents_by_source = {d.source_name: d for d in documents}
+
+            for doc in prompt["documents"]:
+                source_name = doc.get('source_name')
+                if source_name:
+                    doc_record = documents_by_source.get(source_name)
+                    if doc_record:
+                        sources.append({
+                            "filename": doc_record.filename,
+                            "source_name": doc_record.source_name
+                        })
+
+            llm_engine = get_llm_engine()
+            system_prompt = f"""{TRAINING_CHAT_INSTRUCTIONS}
+
+{prompt["context"]}"""
+
+            try:
+                result = await llm_engine.generate_async(chat_request.message, system_prompt)
+                ai_response = result["text"]
+            except LLMError as e:
+                raise HTTPException(
+                    status_code=e.response_status,
+                    detail=f"Error generating response: {str(e)}",
+                    headers={"Retry-After": str(e.retry_after)} if e.retry_after else None
+                )
+            except Exception as e:
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"Error generating response: {str(e)}"
+                )
+
+        ai_response = SafetyFilter.add_educational_disclaimer(ai_response, chat_request.message)
+
+        reservation.settle(
+            response_text=result["text"] if result else ai_response,
+            reason="Training chat message",
+            input_tokens=result["input_tokens"] if result else None,
+            output_tokens=result["output_tokens"] if result else None
         )
-    except Exception as e:
-        print(f"Warning: Failed to deduct token: {str(e)}")
     
     return {
         "message_id": str(uuid.uuid4()),
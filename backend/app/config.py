@@ -9,14 +9,91 @@ class Settings(BaseSettings):
     
     GOOGLE_API_KEY: str
     GEMINI_MODEL: str = "gemini-2.5-flash-lite"
+    LLM_PROVIDER: str = "gemini"
+    
+    MOCK_LLM_SEED: int = 1337
+    MOCK_LLM_LATENCY_MS: float = 300.0
+    MOCK_LLM_LATENCY_JITTER_MS: float = 50.0
+    MOCK_LLM_TOKENS_PER_SECOND: float = 200.0
+    MOCK_LLM_RESPONSE_TOKENS: int = 120
+    MOCK_LLM_FAILURE_RATE: float = 0.0
+    MOCK_LLM_FAILURE_STATUS: int = 503
+    
+    PROMPT_TOKEN_BUDGET: int = 8000
+    CONTEXT_TOKEN_BUDGET: int = 2500
+    HISTORY_TOKEN_BUDGET: int = 4000
+    CONTEXT_DEDUP_THRESHOLD: float = 0.8
+    
+    LLM_COALESCING_ENABLED: bool = True
+    LLM_MAX_RETRIES: int = 3
+    LLM_RETRY_BASE_DELAY_MS: int = 200
+    LLM_RETRY_MAX_DELAY_MS: int = 5000
+    LLM_RETRY_BUDGET_RATIO: float = 0.2
+    LLM_CIRCUIT_FAILURE_THRESHOLD: int = 5
+    LLM_CIRCUIT_RESET_SECONDS: int = 30
+    LLM_HEDGE_ENABLED: bool = False
+    LLM_HEDGE_PERCENTILE: float = 0.95
+    LLM_HEDGE_MIN_SAMPLES: int = 50
     
     DATABASE_URL: str = "sqlite:///./cyber_scholar.db"
+    QUERY_PLAN_CHECK_ENABLED: bool = True
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    SQLITE_TUNING_ENABLED: bool = True
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_MMAP_SIZE: int = 268435456
+    SQLITE_CACHE_SIZE_KB: int = 65536
+    SQLITE_SERIALIZE_WRITES: bool = True
+    CHAT_WRITE_BEHIND_ENABLED: bool = False
+    CHAT_WRITE_BEHIND_FLUSH_MS: int = 200
+    CHAT_WRITE_BEHIND_MAX_BATCH: int = 500
+    CHAT_WRITE_BEHIND_MAX_PENDING: int = 5000
+    CHAT_ARCHIVE_ENABLED: bool = False
+    CHAT_ARCHIVE_AFTER_DAYS: int = 90
+    CHAT_ARCHIVE_DIR: str = "./chat_archive"
+    CHAT_ARCHIVE_COMPRESSION: str = "auto"
+    CHAT_ARCHIVE_INTERVAL_MINUTES: int = 60
+    CHAT_ARCHIVE_BATCH_SIZE: int = 100
+    CHAT_TRANSFER_BATCH_SIZE: int = 1000
     CHROMA_PERSIST_DIR: str = "./chroma_data"
+    CATALOG_CACHE_TTL_SECONDS: int = 300
+    CATALOG_CACHE_STALE_SECONDS: int = 3600
+    CATALOG_CACHE_MAX_AGE_SECONDS: int = 60
+    TOKEN_BALANCE_CACHE_TTL_SECONDS: int = 30
+    TOKEN_CONFIG_CACHE_TTL_SECONDS: int = 60
+    TOKEN_RESERVATION_RESPONSE_CHARS: int = 2000
+    TOKEN_RESERVATION_TIMEOUT_SECONDS: int = 300
+    TOKEN_SETTLEMENT_FLUSH_MS: int = 500
+    TOKEN_SETTLEMENT_MAX_BATCH: int = 200
+    TOKEN_SNAPSHOT_ENABLED: bool = True
+    TOKEN_SNAPSHOT_INTERVAL_MINUTES: int = 15
+    TOKEN_SNAPSHOT_LAG_SECONDS: int = 60
+    TOKEN_SNAPSHOT_BATCH_SIZE: int = 1000
+    TOKEN_RECONCILE_REPAIR: bool = False
+    BULK_ADMIN_MAX_TARGETS: int = 50000
+    USAGE_ROLLUP_ENABLED: bool = True
+    USAGE_ROLLUP_INTERVAL_MINUTES: int = 5
+    USAGE_ROLLUP_LAG_SECONDS: int = 120
+    USAGE_ROLLUP_BATCH_SIZE: int = 5000
+    PAYMENT_CONFIRM_RETRY_SECONDS: int = 30
+    PAYMENT_CONFIRM_MAX_ATTEMPTS: int = 10
     
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_QUEUE: int = 64
+    AUTH_USER_CACHE_TTL_SECONDS: int = 60
+    AUTH_USER_CACHE_MAX_SIZE: int = 10000
+    AUTH_TOKEN_CACHE_TTL_SECONDS: int = 300
+    AUTH_TOKEN_CACHE_MAX_SIZE: int = 10000
     
     UPLOAD_DIR: str = "./uploads"
     MAX_UPLOAD_SIZE: int = 50 * 1024 * 1024
@@ -24,6 +101,13 @@ class Settings(BaseSettings):
     SUPABASE_URL: str = ""
     SUPABASE_SERVICE_KEY: str = ""
     SUPABASE_JWT_SECRET: str = ""
+    SUPABASE_HTTP2: bool = True
+    SUPABASE_TIMEOUT_SECONDS: float = 10.0
+    SUPABASE_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    SUPABASE_MAX_CONNECTIONS: int = 20
+    SUPABASE_KEEPALIVE_CONNECTIONS: int = 10
+    SUPABASE_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+    SUPABASE_MAX_CONCURRENCY: int = 50
     ADMIN_PASSWORD: str = ""
     
     ALLOWED_ORIGINS: str = "http://localhost:3000,http://localhost:5173,http://localhost:8080,https://cyber-scholar-ai.vercel.app"
@@ -1,37 +1,675 @@
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+# Transaction types that spend tokens; mirrors apply_token_transaction in supabase/migrations
+DEBIT_TRANSACTION_TYPES = ("usage", "penalty")
+
+
 class MockSupabaseResponse:
     def __init__(self, data=None):
         self.data = data or []
 
 
-class MockSupabaseBuilder:
+class MockSupabaseStore:
+    """In-memory tables standing in for Supabase when it is not configured (local development, tests)"""
+
     def __init__(self):
+        self.tables: Dict[str, List[Dict]] = {}
+        self.lock = threading.RLock()
+
+    def rows(self, table: str) -> List[Dict]:
+        return self.tables.setdefault(table, [])
+
+    def insert(self, table: str, row: Dict) -> Dict:
+        row = {"id": str(uuid.uuid4()), "created_at": datetime.utcnow().isoformat(), **row}
+        self.rows(table).append(row)
+        return dict(row)
+
+    def find(self, table: str, **match) -> Optional[Dict]:
+        for row in self.rows(table):
+            if all(row.get(key) == value for key, value in match.items()):
+                return row
+        return None
+
+
+def matches_or(row: Dict, expression: str) -> bool:
+    """Subset of PostgREST or=() filters: col.eq.value and col.ilike.%pattern%"""
+    for clause in expression.split(","):
+        column, _, rest = clause.partition(".")
+        operator, _, value = rest.partition(".")
+        cell = row.get(column)
+        if operator == "eq" and str(cell) == value:
+            return True
+        if operator == "ilike" and cell is not None and value.strip("%").lower() in str(cell).lower():
+            return True
+    return False
+
+
+class MockSupabaseBuilder:
+    def __init__(self, store: MockSupabaseStore = None, table: str = None):
+        self._store = store
+        self._table = table
         self._data = []
-    
+        self._operation = "select"
+        self._payload = None
+        self._columns: Optional[List[str]] = None
+        self._filters: List[Callable[[Dict], bool]] = []
+        self._order: List[tuple] = []
+        self._offset = 0
+        self._limit: Optional[int] = None
+
     def select(self, *args, **kwargs):
+        columns = ",".join(args).replace(" ", "")
+        if columns and columns != "*":
+            self._columns = columns.split(",")
+        return self
+
+    def eq(self, column, value):
+        self._filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def neq(self, column, value):
+        self._filters.append(lambda row: row.get(column) != value)
+        return self
+
+    def gt(self, column, value):
+        self._filters.append(lambda row: row.get(column) is not None and row.get(column) > value)
         return self
-    
-    def eq(self, *args, **kwargs):
+
+    def gte(self, column, value):
+        self._filters.append(lambda row: row.get(column) is not None and row.get(column) >= value)
         return self
-    
-    def or_(self, *args, **kwargs):
+
+    def lt(self, column, value):
+        self._filters.append(lambda row: row.get(column) is not None and row.get(column) < value)
         return self
-    
-    def order(self, *args, **kwargs):
+
+    def lte(self, column, value):
+        self._filters.append(lambda row: row.get(column) is not None and row.get(column) <= value)
         return self
-    
+
+    def in_(self, column, values):
+        values = list(values)
+        self._filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def or_(self, expression, *args, **kwargs):
+        self._filters.append(lambda row: matches_or(row, expression))
+        return self
+
+    def order(self, column, desc=False, **kwargs):
+        self._order.append((column, desc))
+        return self
+
     def range(self, start, end):
+        self._offset, self._limit = start, end - start + 1
         return self
-    
+
+    def limit(self, count, **kwargs):
+        self._limit = count
+        return self
+
     def insert(self, data):
+        self._operation, self._payload = "insert", data
         return self
-    
+
     def update(self, data):
+        self._operation, self._payload = "update", data
         return self
-    
+
+    def delete(self):
+        self._operation = "delete"
+        return self
+
+    def execute(self):
+        if self._store is None:
+            return MockSupabaseResponse(self._data)
+
+        with self._store.lock:
+            if self._operation == "insert":
+                payload = self._payload if isinstance(self._payload, list) else [self._payload]
+                return MockSupabaseResponse([self._store.insert(self._table, row) for row in payload])
+
+            rows = [row for row in self._store.rows(self._table) if all(f(row) for f in self._filters)]
+            if self._operation == "update":
+                for row in rows:
+                    old = dict(row)
+                    row.update(self._payload)
+                    for trigger in UPDATE_TRIGGERS.get(self._table, []):
+                        trigger(self._store, old, row)
+                return MockSupabaseResponse([dict(row) for row in rows])
+            if self._operation == "delete":
+                self._store.tables[self._table] = [row for row in self._store.rows(self._table) if row not in rows]
+                return MockSupabaseResponse([dict(row) for row in rows])
+
+            for column, desc in reversed(self._order):
+                rows.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+            end = None if self._limit is None else self._offset + self._limit
+            rows = rows[self._offset:end]
+            if self._columns:
+                rows = [{column: row.get(column) for column in self._columns} for row in rows]
+            return MockSupabaseResponse([dict(row) for row in rows])
+
+
+RPC_FUNCTIONS: Dict[str, Callable[[MockSupabaseStore, Dict], Any]] = {}
+UPDATE_TRIGGERS: Dict[str, List[Callable[[MockSupabaseStore, Dict, Dict], None]]] = {}
+
+
+def register_rpc(name: str):
+    """Register a Python stand-in for a Postgres function so supabase.rpc(name) works without Supabase"""
+    def decorator(func):
+        RPC_FUNCTIONS[name] = func
+        return func
+    return decorator
+
+
+def register_update_trigger(table: str):
+    """Register a Python stand-in for an AFTER UPDATE row trigger, called with (store, old_row, new_row)"""
+    def decorator(func):
+        UPDATE_TRIGGERS.setdefault(table, []).append(func)
+        return func
+    return decorator
+
+
+@register_rpc("apply_token_transaction")
+def apply_token_transaction(store: MockSupabaseStore, params: Dict) -> Dict:
+    amount = params.get("p_amount")
+    if not isinstance(amount, int) or amount < 0:
+        raise ValueError("Token amount must be a non-negative integer")
+    profile = store.find("profiles", id=params["p_user_id"])
+    if profile is None:
+        raise ValueError(f"Profile {params['p_user_id']} not found")
+
+    total, used = profile.get("tokens_total") or 0, profile.get("tokens_used") or 0
+    if store.find("token_balance_snapshots", user_id=profile["id"]) is None:
+        store.rows("token_balance_snapshots").append(new_snapshot(profile["id"], total, used, datetime.utcnow().isoformat()))
+    balance_before = max(0, total - used)
+    if params["p_transaction_type"] in DEBIT_TRANSACTION_TYPES:
+        used += amount
+        profile["tokens_used"] = used
+    else:
+        total += amount
+        profile["tokens_total"] = total
+
+    return store.insert("token_transactions", {
+        "user_id": params["p_user_id"],
+        "amount": amount,
+        "transaction_type": params["p_transaction_type"],
+        "reason": params.get("p_reason"),
+        "balance_before": balance_before,
+        "balance_after": max(0, total - used),
+        "admin_notes": params.get("p_admin_notes"),
+        "input_tokens": params.get("p_input_tokens"),
+        "output_tokens": params.get("p_output_tokens"),
+    })
+
+
+@register_update_trigger("token_pack_requests")
+def handle_token_pack_confirmation(store: MockSupabaseStore, old: Dict, new: Dict):
+    if new.get("status") == "confirmed" and old.get("status") != "confirmed":
+        for subscription in store.rows("subscriptions"):
+            if subscription.get("user_id") == new["user_id"] and subscription.get("status") == "active":
+                subscription["tokens_total"] = (subscription.get("tokens_total") or 0) + new["tokens"]
+        apply_token_transaction(store, {
+            "p_user_id": new["user_id"],
+            "p_amount": new["tokens"],
+            "p_transaction_type": "token_pack_purchase",
+            "p_reason": "Token pack purchase",
+            "p_admin_notes": f"token_pack_request:{new['id']}",
+        })
+
+
+ZERO_UUID = "00000000-0000-0000-0000-000000000000"
+
+
+def new_snapshot(user_id: str, base_total: int, base_used: int, watermark_at: str, watermark_id: str = ZERO_UUID) -> Dict:
+    return {
+        "user_id": user_id,
+        "base_total": base_total,
+        "base_used": base_used,
+        "credits": 0,
+        "debits": 0,
+        "transaction_count": 0,
+        "watermark_at": watermark_at,
+        "watermark_id": watermark_id,
+        "updated_at": datetime.utcnow().isoformat(),
+    }
+
+
+def ledger_delta(store: MockSupabaseStore, snapshot: Dict, until: Optional[str] = None) -> Dict:
+    watermark = (snapshot["watermark_at"], snapshot["watermark_id"])
+    rows = sorted(
+        (row for row in store.rows("token_transactions")
+         if row["user_id"] == snapshot["user_id"]
+         and (row["created_at"], row["id"]) > watermark
+         and (until is None or row["created_at"] < until)
+         and row.get("transaction_type") != "allowance_reset"),
+        key=lambda row: (row["created_at"], row["id"])
+    )
+    return {
+        "credits": sum(r["amount"] for r in rows if r.get("transaction_type") not in DEBIT_TRANSACTION_TYPES),
+        "debits": sum(r["amount"] for r in rows if r.get("transaction_type") in DEBIT_TRANSACTION_TYPES),
+        "transaction_count": len(rows),
+        "last": rows[-1] if rows else None,
+    }
+
+
+@register_rpc("get_token_balance")
+def get_token_balance(store: MockSupabaseStore, params: Dict) -> List[Dict]:
+    snapshot = store.find("token_balance_snapshots", user_id=params["p_user_id"])
+    if snapshot is None:
+        profile = store.find("profiles", id=params["p_user_id"])
+        if profile is None:
+            return []
+        total, used = profile.get("tokens_total") or 0, profile.get("tokens_used") or 0
+        return [{"tokens_total": total, "tokens_used": used, "available": max(0, total - used),
+                 "snapshot_at": None, "unsnapshotted_transactions": 0}]
+
+    delta = ledger_delta(store, snapshot)
+    total = snapshot["base_total"] + snapshot["credits"] + delta["credits"]
+    used = snapshot["base_used"] + snapshot["debits"] + delta["debits"]
+    return [{"tokens_total": total, "tokens_used": used, "available": max(0, total - used),
+             "snapshot_at": snapshot["updated_at"], "unsnapshotted_transactions": delta["transaction_count"]}]
+
+
+@register_rpc("set_token_allowance")
+def set_token_allowance(store: MockSupabaseStore, params: Dict) -> Dict:
+    profile = store.find("profiles", id=params["p_user_id"])
+    if profile is None:
+        raise ValueError(f"Profile {params['p_user_id']} not found")
+
+    balance = get_token_balance(store, {"p_user_id": profile["id"]})[0]
+    total = params["p_tokens_total"]
+    used = params.get("p_tokens_used")
+    used = balance["tokens_used"] if used is None else used
+    profile["tokens_total"], profile["tokens_used"] = total, used
+
+    transaction = store.insert("token_transactions", {
+        "user_id": profile["id"],
+        "amount": total,
+        "transaction_type": "allowance_reset",
+        "reason": params.get("p_reason") or "Token allowance set",
+        "balance_before": balance["available"],
+        "balance_after": max(0, total - used),
+    })
+    snapshot = new_snapshot(profile["id"], total, used, transaction["created_at"], transaction["id"])
+    existing = store.find("token_balance_snapshots", user_id=profile["id"])
+    if existing is None:
+        store.rows("token_balance_snapshots").append(snapshot)
+    else:
+        existing.update(snapshot)
+    return transaction
+
+
+@register_rpc("snapshot_token_balances")
+def snapshot_token_balances(store: MockSupabaseStore, params: Dict) -> int:
+    cutoff = (datetime.utcnow() - timedelta(seconds=params.get("p_lag_seconds", 60))).isoformat()
+    folded = 0
+    for snapshot in store.rows("token_balance_snapshots"):
+        if folded >= params.get("p_limit", 1000):
+            break
+        delta = ledger_delta(store, snapshot, until=cutoff)
+        if delta["transaction_count"]:
+            snapshot["credits"] += delta["credits"]
+            snapshot["debits"] += delta["debits"]
+            snapshot["transaction_count"] += delta["transaction_count"]
+            snapshot["watermark_at"], snapshot["watermark_id"] = delta["last"]["created_at"], delta["last"]["id"]
+            snapshot["updated_at"] = datetime.utcnow().isoformat()
+            folded += 1
+    return folded
+
+
+@register_rpc("reconcile_token_balances")
+def reconcile_token_balances(store: MockSupabaseStore, params: Dict) -> List[Dict]:
+    drifted = []
+    for snapshot in store.rows("token_balance_snapshots"):
+        profile = store.find("profiles", id=snapshot["user_id"])
+        if profile is None:
+            continue
+        balance = get_token_balance(store, {"p_user_id": profile["id"]})[0]
+        if ((profile.get("tokens_total") or 0), (profile.get("tokens_used") or 0)) != (balance["tokens_total"], balance["tokens_used"]):
+            drifted.append({
+                "user_id": profile["id"],
+                "profile_total": profile.get("tokens_total") or 0,
+                "profile_used": profile.get("tokens_used") or 0,
+                "ledger_total": balance["tokens_total"],
+                "ledger_used": balance["tokens_used"],
+            })
+            if params.get("p_repair"):
+                profile["tokens_total"], profile["tokens_used"] = balance["tokens_total"], balance["tokens_used"]
+    return drifted[:params.get("p_limit", 1000)]
+
+
+@register_rpc("list_token_transactions")
+def list_token_transactions(store: MockSupabaseStore, params: Dict) -> List[Dict]:
+    before = (params["p_before_at"], params["p_before_id"]) if params.get("p_before_at") else None
+    rows = [
+        row for row in store.rows("token_transactions")
+        if row["user_id"] == params["p_user_id"]
+        and (before is None or (row["created_at"], row["id"]) < before)
+        and (not params.get("p_from") or row["created_at"] >= params["p_from"])
+        and (not params.get("p_to") or row["created_at"] < params["p_to"])
+    ]
+    rows.sort(key=lambda row: (row["created_at"], row["id"]), reverse=True)
+    return [dict(row) for row in rows[:min(max(params.get("p_limit", 50), 1), 500)]]
+
+
+@register_rpc("apply_token_transactions")
+def apply_token_transactions(store: MockSupabaseStore, params: Dict) -> List[Dict]:
+    applied = []
+    for entry in params.get("p_transactions") or []:
+        try:
+            applied.append(apply_token_transaction(store, {f"p_{key}": value for key, value in entry.items()}))
+        except ValueError:
+            continue
+    return applied
+
+
+@register_rpc("get_admin_stats")
+def get_admin_stats(store: MockSupabaseStore, params: Dict) -> Dict:
+    # Aggregated on the fly; Supabase reads the trigger-maintained admin_stats table instead
+    active = [s for s in store.rows("subscriptions") if s.get("status") == "active"]
+    active_subscriptions: Dict[str, int] = {}
+    for subscription in active:
+        plan = (subscription.get("plan_name") or "").lower().replace(" ", "_")
+        active_subscriptions[plan] = active_subscriptions.get(plan, 0) + 1
+    return {
+        "total_users": len(store.rows("profiles")),
+        "pending_payments": sum(1 for p in store.rows("payment_requests") if p.get("status") == "pending"),
+        "monthly_revenue": sum(s.get("price_paid") or 0 for s in active),
+        "total_revenue": sum(s.get("price_paid") or 0 for s in store.rows("subscriptions")),
+        "token_usage": sum(t.get("amount") or 0 for t in store.rows("token_transactions") if t.get("transaction_type") == "usage"),
+        "active_subscriptions": active_subscriptions,
+    }
+
+
+def parse_timestamp(value) -> datetime:
+    """Naive UTC datetime from an ISO string (aware or naive); -infinity sorts first"""
+    if not value or str(value).startswith("-infinity"):
+        return datetime.min
+    parsed = value if isinstance(value, datetime) else datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def bucket_start(bucket: str, at: datetime) -> datetime:
+    at = at.replace(minute=0, second=0, microsecond=0)
+    return at.replace(hour=0) if bucket == "day" else at
+
+
+def add_usage_rollup(store: MockSupabaseStore, occurred_at: datetime, user_id: str, metric: str, event_count: int, amount: int):
+    profile = store.find("profiles", id=user_id) or {}
+    for bucket in ("hour", "day"):
+        key = {"bucket": bucket, "bucket_start": bucket_start(bucket, occurred_at).isoformat(), "user_id": user_id, "metric": metric}
+        row = store.find("usage_rollups", **key)
+        if row is None:
+            row = {**key, "event_count": 0, "amount": 0}
+            store.rows("usage_rollups").append(row)
+        row["plan"] = profile.get("subscription_tier") or "free"
+        row["event_count"] += event_count
+        row["amount"] += amount
+
+
+@register_rpc("get_usage_rollup_watermark")
+def get_usage_rollup_watermark(store: MockSupabaseStore, params: Dict) -> Dict:
+    watermark = store.find("usage_rollup_watermarks", source=params["p_source"])
+    if watermark is None:
+        watermark = {"source": params["p_source"], "watermark_at": "-infinity", "watermark_id": ""}
+        store.rows("usage_rollup_watermarks").append(watermark)
+    return dict(watermark)
+
+
+@register_rpc("rollup_usage_source")
+def rollup_usage_source(store: MockSupabaseStore, params: Dict) -> int:
+    source = params["p_source"]
+    if source == "token_transactions":
+        events = [(row["created_at"], row["id"], row["user_id"], f"tokens:{row['transaction_type']}", row.get("amount") or 0)
+                  for row in store.rows("token_transactions")]
+    elif source == "payment_requests":
+        events = [(row["created_at"], row["id"], row["user_id"], "payments:requested", row.get("amount") or 0)
+                  for row in store.rows("payment_requests")]
+    elif source == "payment_confirmations":
+        events = [(row["admin_confirmed_at"], row["id"], row["user_id"], "payments:confirmed", row.get("amount") or 0)
+                  for row in store.rows("payment_requests") if row.get("status") == "confirmed" and row.get("admin_confirmed_at")]
+    else:
+        raise ValueError(f"Unknown usage source {source}")
+
+    get_usage_rollup_watermark(store, {"p_source": source})
+    watermark = store.find("usage_rollup_watermarks", source=source)
+    position = (parse_timestamp(watermark["watermark_at"]), watermark["watermark_id"])
+    cutoff = datetime.utcnow() - timedelta(seconds=params.get("p_lag_seconds", 120))
+    events = sorted(
+        (parse_timestamp(at), str(event_id), user_id, metric, amount)
+        for at, event_id, user_id, metric, amount in events
+        if (parse_timestamp(at), str(event_id)) > position and parse_timestamp(at) < cutoff
+    )[:params.get("p_limit", 5000)]
+    for occurred_at, _, user_id, metric, amount in events:
+        add_usage_rollup(store, occurred_at, user_id, metric, 1, amount)
+    if events:
+        watermark["watermark_at"], watermark["watermark_id"] = events[-1][0].isoformat(), events[-1][1]
+    return len(events)
+
+
+@register_rpc("merge_usage_rollups")
+def merge_usage_rollups(store: MockSupabaseStore, params: Dict) -> bool:
+    watermark = store.find("usage_rollup_watermarks", source=params["p_source"])
+    if watermark is None or (parse_timestamp(watermark["watermark_at"]), watermark["watermark_id"]) != (parse_timestamp(params["p_from_at"]), params["p_from_id"]):
+        return False
+    for row in params.get("p_rows") or []:
+        add_usage_rollup(store, parse_timestamp(row["bucket_start"]), row["user_id"], row["metric"], row["event_count"], row["amount"])
+    watermark["watermark_at"], watermark["watermark_id"] = params["p_watermark_at"], params["p_watermark_id"]
+    return True
+
+
+@register_rpc("get_usage_rollups")
+def get_usage_rollups(store: MockSupabaseStore, params: Dict) -> List[Dict]:
+    start, end = parse_timestamp(params["p_from"]), parse_timestamp(params["p_to"])
+    series: Dict[tuple, Dict] = {}
+    for row in store.rows("usage_rollups"):
+        if (row["bucket"] != params["p_bucket"]
+                or not start <= parse_timestamp(row["bucket_start"]) < end
+                or params.get("p_metric") not in (None, row["metric"])
+                or params.get("p_user_id") not in (None, row["user_id"])
+                or params.get("p_plan") not in (None, row["plan"])):
+            continue
+        group_key = {"user": row["user_id"], "plan": row["plan"]}.get(params.get("p_group_by", "plan"), "all")
+        key = (row["bucket_start"], group_key, row["metric"])
+        point = series.setdefault(key, {"bucket_start": row["bucket_start"], "group_key": group_key,
+                                        "metric": row["metric"], "event_count": 0, "amount": 0})
+        point["event_count"] += row["event_count"]
+        point["amount"] += row["amount"]
+    return [series[key] for key in sorted(series)]
+
+
+@register_rpc("search_profiles")
+def search_profiles(store: MockSupabaseStore, params: Dict) -> List[Dict]:
+    term = (params.get("p_search") or "").strip().lower()
+    before = (parse_timestamp(params["p_before_at"]), params["p_before_id"]) if params.get("p_before_at") else None
+    rows = [
+        row for row in store.rows("profiles")
+        if (not term or term in (row.get("email") or "").lower() or term in (row.get("username") or "").lower())
+        and params.get("p_tier") in (None, row.get("subscription_tier"))
+        and params.get("p_status") in (None, row.get("subscription_status"))
+        and (before is None or (parse_timestamp(row.get("created_at")), row["id"]) < before)
+    ]
+    rows.sort(key=lambda row: (parse_timestamp(row.get("created_at")), row["id"]), reverse=True)
+    return [dict(row) for row in rows[:min(max(params.get("p_limit", 50), 1), 201)]]
+
+
+@register_rpc("admin_bulk_operation")
+def admin_bulk_operation(store: MockSupabaseStore, params: Dict) -> List[Dict]:
+    operation = params["p_operation"]
+    if operation not in ("grant_tokens", "remove_tokens", "ban", "unban", "set_tier", "cancel_subscription"):
+        raise ValueError(f"Unknown bulk operation {operation}")
+    user_ids, user_filter = params.get("p_user_ids"), params.get("p_filter") or {}
+    options = params.get("p_params") or {}
+    if user_ids is None and not (user_filter.get("all") or set(user_filter) & {"tier", "status", "is_banned", "email_domain"}):
+        raise ValueError("Bulk operation needs user_ids or a filter")
+    if operation in ("grant_tokens", "remove_tokens") and not (options.get("amount") or 0) > 0:
+        raise ValueError("Token amount must be a positive integer")
+
+    targets = sorted(
+        (row for row in store.rows("profiles")
+         if (user_ids is None or row["id"] in user_ids)
+         and user_filter.get("tier") in (None, row.get("subscription_tier"))
+         and user_filter.get("status") in (None, row.get("subscription_status"))
+         and user_filter.get("is_banned") in (None, bool(row.get("is_banned")))
+         and (not user_filter.get("email_domain") or (row.get("email") or "").lower().endswith("@" + user_filter["email_domain"].lower()))),
+        key=lambda row: row["id"]
+    )
+    if len(targets) > params.get("p_max_targets", 50000):
+        raise ValueError(f"Bulk operation matches {len(targets)} users, more than the limit of {params['p_max_targets']}")
+
+    batch_id, skipped = str(uuid.uuid4()), set()
+    if not params.get("p_dry_run"):
+        now = datetime.utcnow().isoformat()
+        for profile in targets:
+            if operation in ("grant_tokens", "remove_tokens"):
+                apply_token_transaction(store, {
+                    "p_user_id": profile["id"],
+                    "p_amount": options["amount"],
+                    "p_transaction_type": "bonus" if operation == "grant_tokens" else "penalty",
+                    "p_reason": options.get("reason") or "Bulk admin adjustment",
+                    "p_admin_notes": options.get("notes"),
+                })
+            elif operation == "ban":
+                profile.update({"is_banned": True, "banned_at": now, "ban_reason": options.get("reason")})
+            elif operation == "unban":
+                profile.update({"is_banned": False, "banned_at": None, "ban_reason": None})
+            elif operation == "set_tier":
+                profile["subscription_tier"] = options["tier"]
+            elif operation == "cancel_subscription":
+                active = [s for s in store.rows("subscriptions") if s.get("user_id") == profile["id"] and s.get("status") == "active"]
+                for subscription in active:
+                    subscription.update({"status": "cancelled", "cancelled_at": now, "cancel_reason": options.get("reason"), "updated_at": now})
+                if not active:
+                    skipped.add(profile["id"])
+                    continue
+                profile["subscription_status"] = "cancelled"
+            store.insert("audit_log", {
+                "user_id": profile["id"],
+                "email_snapshot": profile.get("email"),
+                "event_type": f"admin_bulk_{operation}",
+                "event_category": "admin",
+                "description": f"Bulk {operation.replace('_', ' ')} by {params.get('p_actor', 'admin')}",
+                "metadata": {"batch_id": batch_id, "actor": params.get("p_actor"), "params": options, "filter": user_filter},
+            })
+
+    results = []
+    for profile in targets:
+        if params.get("p_dry_run"):
+            results.append({"user_id": profile["id"], "status": "matched", "detail": batch_id})
+        elif profile["id"] in skipped:
+            results.append({"user_id": profile["id"], "status": "skipped", "detail": "No active subscription"})
+        else:
+            results.append({"user_id": profile["id"], "status": "applied", "detail": batch_id})
+    found = {profile["id"] for profile in targets}
+    results += [{"user_id": user_id, "status": "not_found", "detail": "Profile not found"}
+                for user_id in user_ids or [] if user_id not in found]
+    return results
+
+
+@register_rpc("confirm_payment_request")
+def confirm_payment_request(store: MockSupabaseStore, params: Dict) -> Dict:
+    payment = store.find("payment_requests", id=params["p_payment_id"])
+    if payment is None:
+        return {"status": "not_found"}
+    if payment.get("status") == "confirmed":
+        subscription = store.find("subscriptions", payment_request_id=payment["id"])
+        return {"status": "already_confirmed", "payment": dict(payment),
+                "subscription": dict(subscription) if subscription else None}
+    if payment.get("status") in ("rejected", "expired"):
+        return {"status": "refused", "payment": dict(payment)}
+    plan = store.find("subscription_plans", id=payment.get("plan_id"))
+    if plan is None:
+        return {"status": "plan_not_found", "payment": dict(payment)}
+
+    now = datetime.utcnow()
+    subscription = store.insert("subscriptions", {
+        "user_id": payment["user_id"],
+        "plan_id": payment["plan_id"],
+        "plan_name": payment.get("plan_name"),
+        "billing_cycle": payment.get("billing_cycle"),
+        "price_paid": payment.get("amount"),
+        "tokens_total": plan["tokens_per_month"],
+        "tokens_used": 0,
+        "status": "active",
+        "started_at": now.isoformat(),
+        "expires_at": (now + timedelta(days=365 if payment.get("billing_cycle") == "yearly" else 30)).isoformat(),
+        "activated_by_admin": False,
+        "payment_request_id": payment["id"],
+    })
+    payment.update({"status": "confirmed", "admin_confirmed_at": now.isoformat(), "admin_notes": params.get("p_admin_notes"),
+                    "subscription_id": subscription["id"], "updated_at": now.isoformat()})
+    profile = store.find("profiles", id=payment["user_id"])
+    if profile is not None:
+        profile.update({"subscription_tier": plan.get("slug"), "subscription_status": "active", "subscription_id": subscription["id"]})
+        set_token_allowance(store, {"p_user_id": profile["id"], "p_tokens_total": plan["tokens_per_month"],
+                                    "p_reason": f"Payment confirmed: {payment.get('plan_name')}"})
+    return {"status": "confirmed", "payment": dict(payment), "subscription": subscription}
+
+
+class MockRpcCall:
+    def __init__(self, client: "MockSupabaseClient", fn_name: str, params: Optional[Dict]):
+        self._client = client
+        self._fn_name = fn_name
+        self._params = params or {}
+
     def execute(self):
-        return MockSupabaseResponse(self._data)
+        func = self._client.rpc_functions.get(self._fn_name)
+        if func is None:
+            return MockSupabaseResponse()
+        # One lock for the whole store: the stand-in for the function's row lock
+        with self._client.store.lock:
+            return MockSupabaseResponse(func(self._client.store, self._params))
 
 
 class MockSupabaseClient:
+    def __init__(self):
+        self.store = MockSupabaseStore()
+        self.rpc_functions = dict(RPC_FUNCTIONS)
+
     def table(self, table_name: str):
-        return MockSupabaseBuilder()
+        return MockSupabaseBuilder(self.store, table_name)
+
+    def rpc(self, fn_name: str, params: dict = None):
+        return MockRpcCall(self, fn_name, params)
+
+
+class AsyncMockQuery:
+    """Awaitable facade over a mock builder or rpc call, matching app.core.supabase_async"""
+
+    def __init__(self, query):
+        self._query = query
+
+    def __getattr__(self, name):
+        method = getattr(self._query, name)
+
+        def chain(*args, **kwargs):
+            method(*args, **kwargs)
+            return self
+        return chain
+
+    async def execute(self, timeout: Optional[float] = None):
+        return self._query.execute()
+
+
+class AsyncMockSupabaseClient:
+    def __init__(self, client: MockSupabaseClient = None):
+        self.client = client or MockSupabaseClient()
+        self.store = self.client.store
+
+    def table(self, table_name: str):
+        return AsyncMockQuery(self.client.table(table_name))
+
+    def rpc(self, fn_name: str, params: dict = None):
+        return AsyncMockQuery(self.client.rpc(fn_name, params))
+
+    async def aclose(self):
+        pass
+
+    def stats(self) -> Dict:
+        return {"mock": True}
@@ -0,0 +1,254 @@
+import asyncio
+import importlib.util
+import logging
+from typing import Any, Dict, List, Optional
+import httpx
+from app.config import get_settings
+from app.core.mock_supabase import MockSupabaseClient, AsyncMockSupabaseClient
+from app.core.supabase_client import supabase
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class SupabaseRequestError(Exception):
+    """PostgREST answered with an error status"""
+
+    def __init__(self, status_code: int, payload: Any):
+        self.status_code = status_code
+        self.payload = payload
+        message = payload.get("message") if isinstance(payload, dict) else payload
+        super().__init__(f"Supabase request failed ({status_code}): {message}")
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Whether a failed call may succeed if repeated: transport errors, timeouts and 5xx/408/429 answers"""
+    if isinstance(error, SupabaseRequestError):
+        return error.status_code >= 500 or error.status_code in (408, 429)
+    return isinstance(error, (httpx.TransportError, asyncio.TimeoutError))
+
+
+class SupabaseResponse:
+    def __init__(self, data=None):
+        self.data = data
+
+
+def format_value(value) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if value is None:
+        return "null"
+    return str(value)
+
+
+class AsyncQueryBuilder:
+    """Async counterpart of the supabase-py table builder, for the subset of PostgREST the backend uses"""
+
+    def __init__(self, client: "AsyncSupabaseClient", table: str):
+        self._client = client
+        self._table = table
+        self._method = "GET"
+        self._params: List[tuple] = []
+        self._order: List[str] = []
+        self._json = None
+        self._prefer: List[str] = []
+
+    def select(self, *columns):
+        self._params.append(("select", ",".join(columns).replace(" ", "") or "*"))
+        return self
+
+    def _filter(self, column: str, operator: str, value):
+        self._params.append((column, f"{operator}.{format_value(value)}"))
+        return self
+
+    def eq(self, column, value):
+        return self._filter(column, "eq", value)
+
+    def neq(self, column, value):
+        return self._filter(column, "neq", value)
+
+    def gt(self, column, value):
+        return self._filter(column, "gt", value)
+
+    def gte(self, column, value):
+        return self._filter(column, "gte", value)
+
+    def lt(self, column, value):
+        return self._filter(column, "lt", value)
+
+    def lte(self, column, value):
+        return self._filter(column, "lte", value)
+
+    def in_(self, column, values):
+        return self._filter(column, "in", f"({','.join(format_value(v) for v in values)})")
+
+    def or_(self, expression: str):
+        self._params.append(("or", f"({expression})"))
+        return self
+
+    def order(self, column, desc=False):
+        self._order.append(f"{column}.{'desc' if desc else 'asc'}")
+        return self
+
+    def limit(self, count: int):
+        self._params.append(("limit", str(count)))
+        return self
+
+    def range(self, start: int, end: int):
+        self._params.extend([("offset", str(start)), ("limit", str(end - start + 1))])
+        return self
+
+    def insert(self, data):
+        self._method, self._json = "POST", data
+        self._prefer.append("return=representation")
+        return self
+
+    def update(self, data):
+        self._method, self._json = "PATCH", data
+        self._prefer.append("return=representation")
+        return self
+
+    def delete(self):
+        self._method = "DELETE"
+        self._prefer.append("return=representation")
+        return self
+
+    async def execute(self, timeout: Optional[float] = None) -> SupabaseResponse:
+        params = list(self._params)
+        if self._order:
+            params.append(("order", ",".join(self._order)))
+        headers = {"Prefer": ",".join(self._prefer)} if self._prefer else None
+        return await self._client.request(self._method, f"/{self._table}", params=params,
+                                          json=self._json, headers=headers, timeout=timeout)
+
+
+class AsyncRpcCall:
+    def __init__(self, client: "AsyncSupabaseClient", fn_name: str, params: Optional[Dict]):
+        self._client = client
+        self._fn_name = fn_name
+        self._params = params or {}
+
+    async def execute(self, timeout: Optional[float] = None) -> SupabaseResponse:
+        return await self._client.request("POST", f"/rpc/{self._fn_name}", json=self._params, timeout=timeout)
+
+
+class AsyncSupabaseClient:
+    """Non-blocking PostgREST client over one pooled httpx.AsyncClient.
+
+    Connections are kept alive (and multiplexed over HTTP/2 when h2 is
+    installed), every call has a timeout, and at most
+    SUPABASE_MAX_CONCURRENCY requests are in flight at once so a burst cannot
+    exhaust the pool or PostgREST.
+    """
+
+    def __init__(self, url: str, key: str):
+        self.base_url = f"{url.rstrip('/')}/rest/v1"
+        self.headers = {
+            "apikey": key,
+            "Authorization": f"Bearer {key}",
+            "Accept": "application/json",
+            "Content-Type": "application/json",
+        }
+        self.http2 = settings.SUPABASE_HTTP2 and importlib.util.find_spec("h2") is not None
+        if settings.SUPABASE_HTTP2 and not self.http2:
+            logger.warning("h2 is not installed, Supabase requests will use HTTP/1.1")
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def _ensure_client(self) -> httpx.AsyncClient:
+        # Pools are bound to the event loop that opened them (scripts run several asyncio.run calls)
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            stale = self._client
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                http2=self.http2,
+                timeout=httpx.Timeout(settings.SUPABASE_TIMEOUT_SECONDS, connect=settings.SUPABASE_CONNECT_TIMEOUT_SECONDS),
+                limits=httpx.Limits(
+                    max_connections=settings.SUPABASE_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.SUPABASE_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=settings.SUPABASE_KEEPALIVE_EXPIRY_SECONDS,
+                ),
+            )
+            self._semaphore = asyncio.Semaphore(settings.SUPABASE_MAX_CONCURRENCY)
+            self._loop = loop
+            if stale is not None:
+                await self._close_stale(stale)
+        return self._client
+
+    @staticmethod
+    async def _close_stale(client: httpx.AsyncClient):
+        """Close a pool opened on an earlier event loop so its sockets are not leaked"""
+        try:
+            await client.aclose()
+        except Exception as e:
+            # Its loop may already be closed; the sockets are dropped with the pool either way
+            logger.debug(f"Closing stale Supabase pool failed: {str(e)}")
+
+    @staticmethod
+    def _decode(response: httpx.Response) -> Any:
+        """JSON body, or the raw text when a proxy or gateway answered with something else"""
+        if not response.content:
+            return None
+        try:
+            return response.json()
+        except ValueError:
+            return response.text[:500]
+
+    def table(self, table_name: str) -> AsyncQueryBuilder:
+        return AsyncQueryBuilder(self, table_name)
+
+    def rpc(self, fn_name: str, params: dict = None) -> AsyncRpcCall:
+        return AsyncRpcCall(self, fn_name, params)
+
+    async def request(self, method: str, path: str, params=None, json=None, headers=None,
+                      timeout: Optional[float] = None) -> SupabaseResponse:
+        client = await self._ensure_client()
+        timeout = timeout if timeout is not None else settings.SUPABASE_TIMEOUT_SECONDS
+        await asyncio.wait_for(self._semaphore.acquire(), timeout=timeout)
+        self.in_flight += 1
+        self.requests += 1
+        try:
+            response = await client.request(method, path, params=params, json=json, headers=headers, timeout=timeout)
+        except httpx.HTTPError:
+            self.errors += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+        # Status first: a 502/503 from a gateway usually carries an HTML body
+        if response.status_code >= 400:
+            self.errors += 1
+            raise SupabaseRequestError(response.status_code, self._decode(response))
+        try:
+            data = response.json() if response.content else None
+        except ValueError:
+            self.errors += 1
+            raise SupabaseRequestError(response.status_code, f"Invalid JSON body: {response.text[:500]}")
+        return SupabaseResponse(data)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> Dict:
+        return {
+            "http2": self.http2,
+            "requests": self.requests,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+        }
+
+
+# Share the mock's in-memory store so routes on the sync client and queries on this one see the same data
+if isinstance(supabase, MockSupabaseClient):
+    supabase_async = AsyncMockSupabaseClient(supabase)
+else:
+    supabase_async = AsyncSupabaseClient(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_KEY)
@@ -1,18 +1,76 @@
 from sqlalchemy import create_engine, event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, Session
 from app.config import get_settings
 from app.models import Base
+from app.db.migrations import run_migrations
+from app.db.query_plans import check_query_plans
+from app.db.sqlite import SerializedAsyncSession, apply_sqlite_pragmas
 import os
 
 settings = get_settings()
 
-engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {}
-)
+
+def to_async_url(url: str) -> str:
+    """Swap the sync driver in DATABASE_URL for its asyncio counterpart"""
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql+asyncpg://", 1)
+    if url.startswith("postgresql://") or url.startswith("postgresql+psycopg2://"):
+        return "postgresql+asyncpg://" + url.split("://", 1)[1]
+    return url
+
+
+def is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+
+def engine_options(url: str, is_async: bool = False) -> dict:
+    if is_sqlite(url):
+        options = {
+            "connect_args": {
+                "check_same_thread": False,
+                "timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000,
+            },
+            "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        }
+        if ":memory:" not in url and url.rstrip("/") not in ("sqlite:", "sqlite+aiosqlite:"):
+            options["pool_size"] = settings.DB_POOL_SIZE
+            options["max_overflow"] = settings.DB_MAX_OVERFLOW
+            options["pool_timeout"] = settings.DB_POOL_TIMEOUT
+            if is_async:
+                # aiosqlite defaults to NullPool, which reopens the file and reruns the PRAGMAs per checkout
+                options["poolclass"] = AsyncAdaptedQueuePool
+        return options
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+engine = create_engine(settings.DATABASE_URL, **engine_options(settings.DATABASE_URL))
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(to_async_url(settings.DATABASE_URL), **engine_options(settings.DATABASE_URL, is_async=True))
+
+if is_sqlite(settings.DATABASE_URL):
+    # Registered before the first connection is opened so every pooled connection gets the PRAGMAs
+    event.listen(engine, "connect", apply_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", apply_sqlite_pragmas)
+
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    class_=SerializedAsyncSession if is_sqlite(settings.DATABASE_URL) and settings.SQLITE_SERIALIZE_WRITES else AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 
 def get_db() -> Session:
     db = SessionLocal()
@@ -22,12 +80,13 @@ def get_db() -> Session:
         db.close()
 
 
+async def get_async_db() -> AsyncSession:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 def init_db():
     Base.metadata.create_all(bind=engine)
-    
-    if "sqlite" in settings.DATABASE_URL:
-        @event.listens_for(engine, "connect")
-        def set_sqlite_pragma(dbapi_connection, connection_record):
-            cursor = dbapi_connection.cursor()
-            cursor.execute("PRAGMA foreign_keys=ON")
-            cursor.close()
+    run_migrations(engine)
+    if settings.QUERY_PLAN_CHECK_ENABLED:
+        check_query_plans(engine)
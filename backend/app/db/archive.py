@@ -0,0 +1,215 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import get_settings
+from app.database import AsyncSessionLocal
+from app.db.write_behind import chat_write_buffer
+from app.models import ChatMessage, ChatSession
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class ChatArchiveError(RuntimeError):
+    """An archived session's blob is missing or unreadable"""
+
+
+class ChatArchiver:
+    """Move idle chat sessions' messages into compressed per-session blobs and bring them back on demand"""
+
+    def __init__(self, archive_dir: str = None):
+        self.archive_dir = archive_dir or settings.CHAT_ARCHIVE_DIR
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def codec() -> Tuple[str, Callable[[bytes], bytes]]:
+        """Extension and compressor for new blobs: zstd when installed (or requested), gzip otherwise"""
+        choice = settings.CHAT_ARCHIVE_COMPRESSION.lower()
+        if choice in ("auto", "zstd") and zstandard is not None:
+            return ".json.zst", zstandard.ZstdCompressor(level=10).compress
+        if choice == "zstd":
+            logger.warning("zstandard is not installed, archiving chat sessions with gzip")
+        return ".json.gz", lambda data: gzip.compress(data, compresslevel=6)
+
+    @staticmethod
+    def decompress(path: str, data: bytes) -> bytes:
+        if path.endswith(".zst"):
+            if zstandard is None:
+                raise RuntimeError(f"zstandard is required to read {path}")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    def blob_path(self, user_id: str, session_id: str) -> str:
+        extension, _ = self.codec()
+        return os.path.join(self.archive_dir, user_id, f"{session_id}{extension}")
+
+    def write_blob(self, path: str, messages: List[Dict]):
+        _, compress = self.codec()
+        payload = json.dumps(messages, separators=(",", ":")).encode("utf-8")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(compress(payload))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def read_blob(self, path: str) -> List[Dict]:
+        with open(path, "rb") as f:
+            messages = json.loads(self.decompress(path, f.read()))
+        for message in messages:
+            for key in ("created_at", "ingested_at"):
+                message[key] = datetime.fromisoformat(message[key]) if message.get(key) else None
+            # Keep rehydrated rows behind the rollup watermark; blobs written before ingested_at lack it
+            message["ingested_at"] = message["ingested_at"] or message["created_at"]
+        return messages
+
+    @staticmethod
+    def remove_blob(path: Optional[str]):
+        if path and os.path.exists(path):
+            os.remove(path)
+
+    async def archive_session(self, db: AsyncSession, user_id: str, session_id: str, cutoff: datetime) -> bool:
+        """Write a session's messages to cold storage and drop them from chat_messages"""
+        messages = (await db.execute(
+            select(ChatMessage.id, ChatMessage.role, ChatMessage.content, ChatMessage.created_at, ChatMessage.ingested_at).where(
+                ChatMessage.session_id == session_id
+            ).order_by(ChatMessage.created_at, ChatMessage.id)
+        )).all()
+        rows = [
+            {
+                "id": m.id, "role": m.role, "content": m.content,
+                "created_at": m.created_at.isoformat() if m.created_at else None,
+                "ingested_at": m.ingested_at.isoformat() if m.ingested_at else None,
+            }
+            for m in messages
+        ]
+        path = self.blob_path(user_id, session_id)
+        await asyncio.to_thread(self.write_blob, path, rows)
+
+        # Guarded on updated_at so a session that became active again stays hot
+        result = await db.execute(
+            update(ChatSession).where(
+                ChatSession.id == session_id,
+                ChatSession.archived_at.is_(None),
+                ChatSession.updated_at < cutoff
+            ).values(
+                archived_at=datetime.utcnow(),
+                archive_path=path,
+                archived_message_count=len(rows),
+                updated_at=ChatSession.updated_at
+            )
+        )
+        if result.rowcount != 1:
+            await db.rollback()
+            await asyncio.to_thread(self.remove_blob, path)
+            return False
+
+        await db.execute(delete(ChatMessage).where(ChatMessage.id.in_([m.id for m in messages])))
+        await db.commit()
+        return True
+
+    async def rehydrate(self, db: AsyncSession, session: ChatSession) -> ChatSession:
+        """Move an archived session's messages back into chat_messages.
+
+        Raises ChatArchiveError and leaves the session archived when its blob cannot be read.
+        """
+        if not session.archived_at:
+            return session
+
+        path = session.archive_path
+        try:
+            rows = await asyncio.to_thread(self.read_blob, path)
+        except Exception as e:
+            await db.rollback()
+            await db.refresh(session)
+            if not session.archived_at:
+                # Another request rehydrated it and removed the blob first
+                return session
+            logger.error(f"Failed to read archive for chat session {session.id} at {path}: {str(e)}")
+            raise ChatArchiveError(f"Archived messages for chat session {session.id} are unavailable") from e
+
+        result = await db.execute(
+            update(ChatSession).where(
+                ChatSession.id == session.id,
+                ChatSession.archived_at.is_not(None)
+            ).values(
+                archived_at=None,
+                archive_path=None,
+                archived_message_count=None,
+                updated_at=ChatSession.updated_at
+            )
+        )
+        if result.rowcount == 1:
+            if rows:
+                await db.execute(insert(ChatMessage), [{**row, "session_id": session.id} for row in rows])
+            await db.commit()
+            await asyncio.to_thread(self.remove_blob, path)
+            session.archived_at = None
+            session.archive_path = None
+            session.archived_message_count = None
+        else:
+            # Another request rehydrated it first
+            await db.rollback()
+            await db.refresh(session)
+        return session
+
+    async def archive_idle_sessions(self, session_factory=None) -> int:
+        """Archive up to CHAT_ARCHIVE_BATCH_SIZE sessions idle for CHAT_ARCHIVE_AFTER_DAYS"""
+        await chat_write_buffer.flush()
+        cutoff = datetime.utcnow() - timedelta(days=settings.CHAT_ARCHIVE_AFTER_DAYS)
+        archived = 0
+        async with (session_factory or AsyncSessionLocal)() as db:
+            sessions = (await db.execute(
+                select(ChatSession.user_id, ChatSession.id).where(
+                    ChatSession.archived_at.is_(None),
+                    ChatSession.updated_at < cutoff
+                ).order_by(ChatSession.updated_at).limit(settings.CHAT_ARCHIVE_BATCH_SIZE)
+            )).all()
+            for user_id, session_id in sessions:
+                try:
+                    if await self.archive_session(db, user_id, session_id, cutoff):
+                        archived += 1
+                except Exception as e:
+                    await db.rollback()
+                    logger.error(f"Failed to archive chat session {session_id}: {str(e)}")
+        return archived
+
+    async def _run(self):
+        while True:
+            try:
+                archived = await self.archive_idle_sessions()
+                if archived:
+                    logger.info(f"Archived {archived} idle chat sessions")
+                if archived == settings.CHAT_ARCHIVE_BATCH_SIZE:
+                    continue
+            except Exception as e:
+                logger.error(f"Chat archiver run failed: {str(e)}")
+            await asyncio.sleep(settings.CHAT_ARCHIVE_INTERVAL_MINUTES * 60)
+
+    def start(self):
+        if settings.CHAT_ARCHIVE_ENABLED and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+chat_archiver = ChatArchiver()
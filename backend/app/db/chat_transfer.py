@@ -0,0 +1,194 @@
+import asyncio
+import json
+import os
+import uuid
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import get_settings
+from app.database import AsyncSessionLocal
+from app.db.archive import chat_archiver
+from app.db.write_behind import chat_write_buffer
+from app.models import ChatMessage, ChatSession
+
+settings = get_settings()
+
+EXPORT_FORMAT_VERSION = 1
+MESSAGE_ROLES = {"user", "assistant"}
+
+
+class ChatImportError(ValueError):
+    def __init__(self, line_number: int, message: str):
+        super().__init__(f"Line {line_number}: {message}")
+        self.line_number = line_number
+
+
+def ndjson_line(record: Dict) -> bytes:
+    return (json.dumps(record, default=lambda value: value.isoformat(), ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def parse_timestamp(value) -> Optional[datetime]:
+    if not value:
+        return None
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00")).replace(tzinfo=None)
+
+
+class ChatTransfer:
+    """Stream a user's chat history out as NDJSON and bulk-load such files back in.
+
+    Every line is one JSON object tagged with "type": an "export" header,
+    then each "session" followed by its "message" lines in order.
+    """
+
+    @staticmethod
+    async def export_ndjson(user_id: str) -> AsyncIterator[bytes]:
+        """Yield the export line by line from a server-side cursor, never holding more than one batch"""
+        await chat_write_buffer.flush_if_pending(user_id)
+        yield ndjson_line({
+            "type": "export",
+            "version": EXPORT_FORMAT_VERSION,
+            "user_id": user_id,
+            "exported_at": datetime.utcnow(),
+        })
+
+        query = select(
+            ChatSession.id.label("session_id"),
+            ChatSession.title,
+            ChatSession.created_at.label("session_created_at"),
+            ChatSession.updated_at,
+            ChatSession.archive_path,
+            ChatMessage.id.label("message_id"),
+            ChatMessage.role,
+            ChatMessage.content,
+            ChatMessage.created_at,
+        ).outerjoin(ChatMessage, ChatMessage.session_id == ChatSession.id).where(
+            ChatSession.user_id == user_id
+        ).order_by(
+            ChatSession.created_at, ChatSession.id, ChatMessage.created_at, ChatMessage.id
+        ).execution_options(yield_per=settings.CHAT_TRANSFER_BATCH_SIZE)
+
+        async with AsyncSessionLocal() as db:
+            current_session = None
+            result = await db.stream(query)
+            async for row in result:
+                if row.session_id != current_session:
+                    current_session = row.session_id
+                    yield ndjson_line({
+                        "type": "session",
+                        "id": row.session_id,
+                        "title": row.title,
+                        "created_at": row.session_created_at,
+                        "updated_at": row.updated_at,
+                    })
+                    if row.archive_path and os.path.exists(row.archive_path):
+                        for message in await asyncio.to_thread(chat_archiver.read_blob, row.archive_path):
+                            yield ndjson_line({
+                                "type": "message",
+                                "id": message["id"],
+                                "session_id": row.session_id,
+                                "role": message["role"],
+                                "content": message["content"],
+                                "created_at": message["created_at"],
+                            })
+                if row.message_id:
+                    yield ndjson_line({
+                        "type": "message",
+                        "id": row.message_id,
+                        "session_id": row.session_id,
+                        "role": row.role,
+                        "content": row.content,
+                        "created_at": row.created_at,
+                    })
+
+    @staticmethod
+    async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        buffer = b""
+        async for chunk in chunks:
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                yield line
+        if buffer:
+            yield buffer
+
+    @staticmethod
+    async def parse_ndjson(user_id: str, chunks: AsyncIterator[bytes]) -> Tuple[List[Dict], List[Dict]]:
+        """Validate a whole NDJSON upload into session and message rows with fresh ids, touching no database"""
+        session_ids: Dict[str, str] = {}
+        sessions: List[Dict] = []
+        messages: List[Dict] = []
+
+        line_number = 0
+        try:
+            async for raw in ChatTransfer.iter_lines(chunks):
+                line_number += 1
+                if not raw.strip():
+                    continue
+                try:
+                    record = json.loads(raw)
+                except ValueError:
+                    raise ChatImportError(line_number, "invalid JSON")
+                if not isinstance(record, dict):
+                    raise ChatImportError(line_number, "expected a JSON object")
+
+                kind = record.get("type")
+                if kind == "export":
+                    version = record.get("version", EXPORT_FORMAT_VERSION)
+                    if not isinstance(version, int) or isinstance(version, bool) or version > EXPORT_FORMAT_VERSION:
+                        raise ChatImportError(line_number, f"unsupported export version {version!r}")
+                elif kind == "session":
+                    if not record.get("id"):
+                        raise ChatImportError(line_number, "session without an id")
+                    new_id = str(uuid.uuid4())
+                    session_ids[str(record["id"])] = new_id
+                    created_at = parse_timestamp(record.get("created_at")) or datetime.utcnow()
+                    sessions.append({
+                        "id": new_id,
+                        "user_id": user_id,
+                        "title": str(record.get("title") or "New Chat")[:255],
+                        "created_at": created_at,
+                        "updated_at": parse_timestamp(record.get("updated_at")) or created_at,
+                    })
+                elif kind == "message":
+                    session_id = session_ids.get(str(record.get("session_id")))
+                    if session_id is None:
+                        raise ChatImportError(line_number, "message before its session")
+                    if record.get("role") not in MESSAGE_ROLES or not isinstance(record.get("content"), str):
+                        raise ChatImportError(line_number, "message needs a user/assistant role and string content")
+                    messages.append({
+                        "id": str(uuid.uuid4()),
+                        "session_id": session_id,
+                        "role": record["role"],
+                        "content": record["content"],
+                        "created_at": parse_timestamp(record.get("created_at")) or datetime.utcnow(),
+                    })
+                else:
+                    raise ChatImportError(line_number, f"unknown record type {kind!r}")
+        except ChatImportError:
+            raise
+        except ValueError as e:
+            raise ChatImportError(line_number, str(e))
+
+        return sessions, messages
+
+    @staticmethod
+    async def import_ndjson(db: AsyncSession, user_id: str, chunks: AsyncIterator[bytes]) -> Dict:
+        """Parse the whole upload first, then insert it in executemany batches in one short transaction.
+
+        Nothing is written while the body is still arriving, so a slow upload
+        never holds the database write lock.
+        """
+        sessions, messages = await ChatTransfer.parse_ndjson(user_id, chunks)
+        batch_size = settings.CHAT_TRANSFER_BATCH_SIZE
+        try:
+            for start in range(0, len(sessions), batch_size):
+                await db.execute(insert(ChatSession), sessions[start:start + batch_size])
+            for start in range(0, len(messages), batch_size):
+                await db.execute(insert(ChatMessage), messages[start:start + batch_size])
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+
+        return {"sessions_imported": len(sessions), "messages_imported": len(messages)}
@@ -0,0 +1,110 @@
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, List
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    upgrade: Callable[[Connection], None]
+
+
+def create_index(conn: Connection, name: str, table: str, columns: List[str]):
+    conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+
+
+def add_column(conn: Connection, table: str, column: str, ddl: str):
+    """ALTER TABLE ADD COLUMN unless create_all already made the column on a fresh database"""
+    existing = {c["name"] for c in inspect(conn).get_columns(table)}
+    if column not in existing:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def add_hot_path_indexes(conn: Connection):
+    create_index(conn, "ix_chat_sessions_user_updated", "chat_sessions", ["user_id", "updated_at", "id"])
+    create_index(conn, "ix_chat_messages_session_created", "chat_messages", ["session_id", "created_at", "id"])
+    create_index(conn, "ix_training_documents_user_created", "training_documents", ["user_id", "created_at"])
+    create_index(conn, "ix_training_documents_user_source", "training_documents", ["user_id", "source_name"])
+
+
+def add_chat_archive_columns(conn: Connection):
+    add_column(conn, "chat_sessions", "archived_at", "TIMESTAMP")
+    add_column(conn, "chat_sessions", "archive_path", "VARCHAR")
+    add_column(conn, "chat_sessions", "archived_message_count", "INTEGER")
+
+
+def add_chat_message_search_index(conn: Connection):
+    """FTS5 on SQLite, a generated tsvector column with a GIN index on Postgres"""
+    if conn.dialect.name == "sqlite":
+        conn.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS chat_messages_fts USING fts5("
+            "content, content='chat_messages', content_rowid='rowid', tokenize='porter unicode61')"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS chat_messages_fts_ai AFTER INSERT ON chat_messages BEGIN "
+            "INSERT INTO chat_messages_fts(rowid, content) VALUES (new.rowid, new.content); END"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS chat_messages_fts_ad AFTER DELETE ON chat_messages BEGIN "
+            "INSERT INTO chat_messages_fts(chat_messages_fts, rowid, content) VALUES ('delete', old.rowid, old.content); END"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS chat_messages_fts_au AFTER UPDATE OF content ON chat_messages BEGIN "
+            "INSERT INTO chat_messages_fts(chat_messages_fts, rowid, content) VALUES ('delete', old.rowid, old.content); "
+            "INSERT INTO chat_messages_fts(rowid, content) VALUES (new.rowid, new.content); END"
+        ))
+        conn.execute(text("INSERT INTO chat_messages_fts(chat_messages_fts) VALUES ('rebuild')"))
+    elif conn.dialect.name == "postgresql":
+        conn.execute(text(
+            "ALTER TABLE chat_messages ADD COLUMN IF NOT EXISTS content_tsv tsvector "
+            "GENERATED ALWAYS AS (to_tsvector('english', content)) STORED"
+        ))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_chat_messages_content_tsv ON chat_messages USING GIN (content_tsv)"))
+
+
+def add_chat_message_created_index(conn: Connection):
+    create_index(conn, "ix_chat_messages_created", "chat_messages", ["created_at", "id"])
+
+
+def add_chat_message_ingested_at(conn: Connection):
+    """Rollups scan by arrival order; existing rows arrived by the time they were created (or are already folded)"""
+    add_column(conn, "chat_messages", "ingested_at", "TIMESTAMP")
+    conn.execute(text("UPDATE chat_messages SET ingested_at = created_at WHERE ingested_at IS NULL"))
+    create_index(conn, "ix_chat_messages_ingested", "chat_messages", ["ingested_at", "id"])
+    conn.execute(text("DROP INDEX IF EXISTS ix_chat_messages_created"))
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "Indexes for per-user session, message and training document lookups", add_hot_path_indexes),
+    Migration(2, "Cold storage columns for archived chat sessions", add_chat_archive_columns),
+    Migration(3, "Full-text search index over chat message content", add_chat_message_search_index),
+    Migration(4, "Index for rolling up chat messages by creation time", add_chat_message_created_index),
+    Migration(5, "Arrival time for chat messages so rollups count imported history", add_chat_message_ingested_at),
+]
+
+
+def run_migrations(engine: Engine):
+    """Apply every migration newer than the highest version recorded in schema_migrations"""
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, description VARCHAR NOT NULL, applied_at TIMESTAMP NOT NULL)"
+        ))
+        applied = {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+    for migration in sorted(MIGRATIONS, key=lambda m: m.version):
+        if migration.version in applied:
+            continue
+        with engine.begin() as conn:
+            migration.upgrade(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, description, applied_at) VALUES (:v, :d, :t)"),
+                {"v": migration.version, "d": migration.description, "t": datetime.utcnow()}
+            )
+        logger.info(f"Applied migration {migration.version}: {migration.description}")
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from sqlalchemy import func, select
+from app.config import get_settings
+from app.core.supabase_async import is_transient_error
+from app.db.queries import PaymentQueries
+from app.models import PaymentConfirmationJob
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Outcomes that settle a job; anything else (refused, plan_not_found, not_found) fails it for an admin to look at
+SETTLED_OUTCOMES = ("confirmed", "already_confirmed")
+MAX_BACKOFF_SECONDS = 3600
+BATCH_SIZE = 100
+
+
+class PaymentConfirmationQueue:
+    """Durable retry queue for payment confirmations that failed on the way to Supabase.
+
+    Jobs live in the local database, so a confirmation accepted while
+    Supabase was unreachable survives a restart. The worker repeats the
+    confirm_payment_request call with exponential backoff starting at
+    PAYMENT_CONFIRM_RETRY_SECONDS; the call is idempotent on the payment id,
+    so a retry after a lost response cannot create a second subscription.
+    """
+
+    def __init__(self, session_factory=None):
+        self.session_factory = session_factory
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.last_run: Dict = {}
+
+    def _factory(self):
+        if self.session_factory is None:
+            from app.database import AsyncSessionLocal
+            self.session_factory = AsyncSessionLocal
+        return self.session_factory
+
+    @staticmethod
+    def backoff(attempts: int) -> timedelta:
+        return timedelta(seconds=min(settings.PAYMENT_CONFIRM_RETRY_SECONDS * 2 ** max(attempts - 1, 0), MAX_BACKOFF_SECONDS))
+
+    async def enqueue(self, payment_id: str, admin_notes: Optional[str] = None, error: Optional[str] = None) -> PaymentConfirmationJob:
+        """Queue (or re-arm) the confirmation of a payment; one job per payment"""
+        async with self._factory()() as db:
+            job = (await db.execute(
+                select(PaymentConfirmationJob).where(PaymentConfirmationJob.payment_id == payment_id)
+            )).scalar_one_or_none()
+            if job is None:
+                job = PaymentConfirmationJob(payment_id=payment_id)
+                db.add(job)
+            job.admin_notes = admin_notes
+            job.status = "pending"
+            job.attempts = 1 if error else 0
+            job.last_error = error
+            job.next_attempt_at = datetime.utcnow() + (self.backoff(1) if error else timedelta(0))
+            job.completed_at = None
+            await db.commit()
+            await db.refresh(job)
+
+        if self._wakeup is not None and not error:
+            self._wakeup.set()
+        return job
+
+    async def deliver(self, job: PaymentConfirmationJob) -> str:
+        """Attempt one queued confirmation and record the result on the job"""
+        job.attempts = (job.attempts or 0) + 1
+        try:
+            outcome = (await PaymentQueries.confirm_payment(job.payment_id, job.admin_notes))["status"]
+        except Exception as e:
+            job.last_error = str(e) or type(e).__name__
+            if is_transient_error(e) and job.attempts < settings.PAYMENT_CONFIRM_MAX_ATTEMPTS:
+                job.next_attempt_at = datetime.utcnow() + self.backoff(job.attempts)
+                return "retry"
+            job.status = "failed"
+            logger.error(f"Giving up on confirming payment {job.payment_id} after {job.attempts} attempts: {job.last_error}")
+            return "failed"
+
+        job.completed_at = datetime.utcnow()
+        if outcome in SETTLED_OUTCOMES:
+            job.status, job.last_error = "done", None
+            return "done"
+        job.status, job.last_error = "failed", outcome
+        logger.warning(f"Queued confirmation of payment {job.payment_id} was not applied: {outcome}")
+        return "failed"
+
+    async def run_once(self) -> Dict:
+        counts = {"done": 0, "retry": 0, "failed": 0}
+        async with self._factory()() as db:
+            jobs = (await db.execute(
+                select(PaymentConfirmationJob)
+                .where(PaymentConfirmationJob.status == "pending", PaymentConfirmationJob.next_attempt_at <= datetime.utcnow())
+                .order_by(PaymentConfirmationJob.next_attempt_at)
+                .limit(BATCH_SIZE)
+            )).scalars().all()
+            for job in jobs:
+                counts[await self.deliver(job)] += 1
+                await db.commit()
+        self.last_run = counts
+        return counts
+
+    async def pending_count(self) -> int:
+        async with self._factory()() as db:
+            return (await db.execute(
+                select(func.count()).select_from(PaymentConfirmationJob).where(PaymentConfirmationJob.status == "pending")
+            )).scalar_one()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.PAYMENT_CONFIRM_RETRY_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Payment confirmation retry run failed: {str(e)}")
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._wakeup.set()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+payment_confirmation_queue = PaymentConfirmationQueue()
@@ -1,25 +1,45 @@
-from app.core.supabase_client import supabase
+from app.core.supabase_async import supabase_async as supabase
+from app.security import invalidate_user
+from app.config import get_settings
+from app.utils.pagination import CursorPagination
+from app.utils.ttl_cache import TTLCache
+from app.utils.read_through_cache import ReadThroughCache, CacheEntry
 from fastapi import HTTPException, status
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Optional, List, Dict, Any
+import math
+
+settings = get_settings()
+
+# Plans, token packs, bank settings and token config only change through the admin endpoints, which invalidate them
+catalog_cache = ReadThroughCache(ttl=settings.CATALOG_CACHE_TTL_SECONDS, stale_ttl=settings.CATALOG_CACHE_STALE_SECONDS)
 
 
 class SubscriptionQueries:
+    @staticmethod
+    async def load_plans(active_only=True):
+        query = supabase.table("subscription_plans").select("*")
+        if active_only:
+            query = query.eq("is_active", True)
+        result = await query.order("sort_order").execute()
+        return result.data or []
+
     @staticmethod
     async def get_plans(active_only=True):
         try:
-            query = supabase.table("subscription_plans").select("*")
-            if active_only:
-                query = query.eq("is_active", True)
-            result = query.order("sort_order").execute()
-            return result.data
+            return await SubscriptionQueries.load_plans(active_only)
         except Exception:
             return []
 
+    @staticmethod
+    async def get_cached_plans() -> CacheEntry:
+        # The loader raises, so an outage keeps serving the last good (stale) catalog instead of caching []
+        return await catalog_cache.get("plans", lambda: SubscriptionQueries.load_plans(active_only=True))
+
     @staticmethod
     async def get_plan_by_id(plan_id: str):
         try:
-            result = supabase.table("subscription_plans").select("*").eq("id", plan_id).execute()
+            result = await supabase.table("subscription_plans").select("*").eq("id", plan_id).execute()
             if not result.data:
                 raise HTTPException(status_code=404, detail="Plan not found")
             return result.data[0]
@@ -31,7 +51,7 @@ class SubscriptionQueries:
     @staticmethod
     async def get_plan_by_slug(slug: str):
         try:
-            result = supabase.table("subscription_plans").select("*").eq("slug", slug).execute()
+            result = await supabase.table("subscription_plans").select("*").eq("slug", slug).execute()
             if not result.data:
                 raise HTTPException(status_code=404, detail="Plan not found")
             return result.data[0]
@@ -43,7 +63,7 @@ class SubscriptionQueries:
     @staticmethod
     async def get_user_subscription(user_id: str):
         try:
-            result = supabase.table("subscriptions").select("*").eq("user_id", user_id).eq("status", "active").order("created_at", desc=True).limit(1).execute()
+            result = await supabase.table("subscriptions").select("*").eq("user_id", user_id).eq("status", "active").order("created_at", desc=True).limit(1).execute()
             if result.data:
                 return result.data[0]
             return None
@@ -53,7 +73,7 @@ class SubscriptionQueries:
     @staticmethod
     async def get_subscription_history(user_id: str):
         try:
-            result = supabase.table("subscriptions").select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
+            result = await supabase.table("subscriptions").select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
             return result.data
         except Exception:
             return []
@@ -61,7 +81,7 @@ class SubscriptionQueries:
     @staticmethod
     async def get_subscription_by_id(subscription_id: str):
         try:
-            result = supabase.table("subscriptions").select("*").eq("id", subscription_id).execute()
+            result = await supabase.table("subscriptions").select("*").eq("id", subscription_id).execute()
             if not result.data:
                 raise HTTPException(status_code=404, detail="Subscription not found")
             return result.data[0]
@@ -74,7 +94,7 @@ class SubscriptionQueries:
     async def create_subscription(user_id: str, plan_id: str, plan_name: str, billing_cycle: str, price_paid: int, tokens_total: int):
         try:
             expires_at = datetime.utcnow() + (timedelta(days=365) if billing_cycle == "yearly" else timedelta(days=30))
-            result = supabase.table("subscriptions").insert({
+            result = await supabase.table("subscriptions").insert({
                 "user_id": user_id,
                 "plan_id": plan_id,
                 "plan_name": plan_name,
@@ -95,7 +115,7 @@ class SubscriptionQueries:
     async def update_subscription(subscription_id: str, data: Dict):
         try:
             data["updated_at"] = datetime.utcnow().isoformat()
-            result = supabase.table("subscriptions").update(data).eq("id", subscription_id).execute()
+            result = await supabase.table("subscriptions").update(data).eq("id", subscription_id).execute()
             return result.data[0] if result.data else None
         except Exception:
             return None
@@ -113,16 +133,16 @@ class PaymentQueries:
     @staticmethod
     async def create_payment_request(user_id: str, plan_id: str, plan_name: str, billing_cycle: str, amount: int):
         try:
-            profile_check = supabase.table("profiles").select("id").eq("id", user_id).execute()
+            profile_check = await supabase.table("profiles").select("id").eq("id", user_id).execute()
             if not profile_check.data:
-                supabase.table("profiles").insert({
+                await supabase.table("profiles").insert({
                     "id": user_id,
                     "email": f"user-{user_id}@app.local",
                     "full_name": "User"
                 }).execute()
             
             expires_at = datetime.utcnow() + timedelta(days=7)
-            result = supabase.table("payment_requests").insert({
+            result = await supabase.table("payment_requests").insert({
                 "user_id": user_id,
                 "plan_id": plan_id,
                 "plan_name": plan_name,
@@ -142,7 +162,7 @@ class PaymentQueries:
     @staticmethod
     async def get_payment_request(payment_id: str):
         try:
-            result = supabase.table("payment_requests").select("*").eq("id", payment_id).execute()
+            result = await supabase.table("payment_requests").select("*").eq("id", payment_id).execute()
             if not result.data:
                 raise HTTPException(status_code=404, detail="Payment request not found")
             return result.data[0]
@@ -154,7 +174,7 @@ class PaymentQueries:
     @staticmethod
     async def get_user_payment_requests(user_id: str):
         try:
-            result = supabase.table("payment_requests").select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
+            result = await supabase.table("payment_requests").select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
             return result.data if result.data else []
         except Exception as e:
             print(f"Error fetching payment requests: {str(e)}")
@@ -164,7 +184,7 @@ class PaymentQueries:
     async def update_payment_request(payment_id: str, data: Dict):
         try:
             data["updated_at"] = datetime.utcnow().isoformat()
-            result = supabase.table("payment_requests").update(data).eq("id", payment_id).execute()
+            result = await supabase.table("payment_requests").update(data).eq("id", payment_id).execute()
             return result.data[0] if result.data else None
         except Exception:
             return None
@@ -180,18 +200,27 @@ class PaymentQueries:
     @staticmethod
     async def get_pending_payments():
         try:
-            result = supabase.table("payment_requests").select("*").eq("status", "pending").order("created_at").execute()
+            result = await supabase.table("payment_requests").select("*").eq("status", "pending").order("created_at").execute()
             return result.data
         except Exception:
             return []
 
     @staticmethod
-    async def confirm_payment(payment_id: str, admin_notes: Optional[str] = None):
-        return await PaymentQueries.update_payment_request(payment_id, {
-            "status": "confirmed",
-            "admin_confirmed_at": datetime.utcnow().isoformat(),
-            "admin_notes": admin_notes,
-        })
+    async def confirm_payment(payment_id: str, admin_notes: Optional[str] = None) -> Dict:
+        """Confirm a payment, create its subscription and set the allowance in one transaction (confirm_payment_request).
+
+        Safe to repeat: a confirmed payment returns status already_confirmed with
+        its existing subscription. Transport errors are raised for the caller to retry.
+        """
+        result = await supabase.rpc("confirm_payment_request", {
+            "p_payment_id": payment_id,
+            "p_admin_notes": admin_notes,
+        }).execute()
+        outcome = result.data or {"status": "not_found"}
+        if outcome["status"] == "confirmed":
+            invalidate_user(outcome["payment"]["user_id"])
+            TokenQueries.balance_cache.invalidate(outcome["payment"]["user_id"])
+        return outcome
 
     @staticmethod
     async def reject_payment(payment_id: str, rejection_reason: str):
@@ -202,23 +231,66 @@ class PaymentQueries:
 
 
 class TokenQueries:
+    # Last known available balance per user, refreshed from every applied transaction
+    balance_cache = TTLCache(maxsize=10000, ttl=settings.TOKEN_BALANCE_CACHE_TTL_SECONDS)
+
+    DEFAULT_TOKEN_CONFIG = {
+        "cost_per_message": 1.0,
+        "cost_per_character_response": 0.0,
+        "enabled_per_message": True,
+        "enabled_per_character": False
+    }
+
+    @staticmethod
+    async def load_token_config():
+        result = await supabase.rpc("get_token_config").execute()
+        if result.data and len(result.data) > 0:
+            return result.data[0]
+        return dict(TokenQueries.DEFAULT_TOKEN_CONFIG)
+
+    @staticmethod
+    async def get_token_config():
+        try:
+            return await TokenQueries.load_token_config()
+        except Exception as e:
+            print(f"Error fetching token config: {str(e)}")
+            return dict(TokenQueries.DEFAULT_TOKEN_CONFIG)
+
+    @staticmethod
+    async def get_cached_token_config() -> CacheEntry:
+        return await catalog_cache.get("token_config", TokenQueries.load_token_config, ttl=settings.TOKEN_CONFIG_CACHE_TTL_SECONDS)
+
+    @staticmethod
+    def calculate_usage_cost(config: Dict, response_text: str) -> int:
+        """Mirror of the deduct_chat_tokens pricing: per-message plus per-character of the response"""
+        cost = 0.0
+        if config.get("enabled_per_message"):
+            cost += float(config.get("cost_per_message") or 0)
+        if config.get("enabled_per_character"):
+            cost += len(response_text or "") * float(config.get("cost_per_character_response") or 0)
+        return math.ceil(cost)
+
+    @staticmethod
+    async def get_ledger_balance(user_id: str) -> Optional[Dict]:
+        """Balance from the latest snapshot plus the ledger since; None when the profile does not exist"""
+        result = await supabase.rpc("get_token_balance", {"p_user_id": user_id}).execute()
+        rows = result.data if isinstance(result.data, list) else [result.data] if result.data else []
+        return rows[0] if rows else None
+
     @staticmethod
     async def get_user_tokens(user_id: str):
         try:
-            result = supabase.table("profiles").select("tokens_total, tokens_used").eq("id", user_id).execute()
-            if not result.data:
+            balance = await TokenQueries.get_ledger_balance(user_id)
+            if not balance:
                 return {
                     "total": 0,
                     "used": 0,
                     "available": 0
                 }
-            user = result.data[0]
-            total = user.get("tokens_total") or 0
-            used = user.get("tokens_used") or 0
             return {
-                "total": total,
-                "used": used,
-                "available": max(0, total - used)
+                "total": balance["tokens_total"],
+                "used": balance["tokens_used"],
+                "available": balance["available"]
             }
         except HTTPException:
             raise
@@ -230,86 +302,205 @@ class TokenQueries:
             }
 
     @staticmethod
-    async def get_token_transactions(user_id: str):
+    async def get_available_balance(user_id: str) -> Optional[int]:
+        """Available tokens, or None when the balance cannot be determined"""
         try:
-            result = supabase.table("token_transactions").select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
-            return result.data
+            balance = await TokenQueries.get_ledger_balance(user_id)
+            return balance["available"] if balance else None
         except Exception:
-            return []
+            return None
 
     @staticmethod
-    async def add_token_transaction(user_id: str, amount: int, transaction_type: str, reason: str, admin_notes: Optional[str] = None):
-        try:
-            tokens = await TokenQueries.get_user_tokens(user_id)
-            balance_before = tokens["available"]
-            balance_after = balance_before - amount if transaction_type == "usage" else balance_before + amount
+    async def get_cached_balance(user_id: str) -> Optional[int]:
+        balance = TokenQueries.balance_cache.get(user_id)
+        if balance is None:
+            balance = await TokenQueries.get_available_balance(user_id)
+            if balance is not None:
+                TokenQueries.balance_cache.set(user_id, balance)
+        return balance
 
-            result = supabase.table("token_transactions").insert({
-                "user_id": user_id,
-                "amount": amount,
-                "transaction_type": transaction_type,
-                "reason": reason,
-                "balance_before": balance_before,
-                "balance_after": max(0, balance_after),
-                "admin_notes": admin_notes,
+    @staticmethod
+    async def get_token_transactions(user_id: str, limit: int = 50, cursor: Optional[str] = None,
+                                     start: Optional[datetime] = None, end: Optional[datetime] = None):
+        """Newest-first page of the ledger within [start, end) and the cursor for the next page"""
+        position = CursorPagination.decode(cursor)
+        try:
+            result = await supabase.rpc("list_token_transactions", {
+                "p_user_id": user_id,
+                "p_limit": limit + 1,
+                "p_before_at": position[0].isoformat() if position else None,
+                "p_before_id": position[1] if position else None,
+                "p_from": start.isoformat() if start else None,
+                "p_to": end.isoformat() if end else None,
             }).execute()
+            rows = result.data or []
+        except Exception:
+            return [], None
 
-            if transaction_type == "usage":
-                supabase.table("profiles").update({"tokens_used": tokens["used"] + amount}).eq("id", user_id).execute()
-            else:
-                supabase.table("profiles").update({"tokens_total": tokens["total"] + amount}).eq("id", user_id).execute()
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = CursorPagination.encode(datetime.fromisoformat(last["created_at"]), last["id"])
+        return rows[:limit], next_cursor
 
-            return result.data[0] if result.data else None
+    @staticmethod
+    async def add_token_transaction(user_id: str, amount: int, transaction_type: str, reason: str, admin_notes: Optional[str] = None, input_tokens: Optional[int] = None, output_tokens: Optional[int] = None):
+        """Move the balance and log the transaction in one atomic apply_token_transaction call.
+
+        usage and penalty spend tokens (tokens_used), any other type grants them (tokens_total).
+        Returns the transaction row, whose balance_after is the new available balance.
+        """
+        try:
+            result = await supabase.rpc("apply_token_transaction", {
+                "p_user_id": user_id,
+                "p_amount": amount,
+                "p_transaction_type": transaction_type,
+                "p_reason": reason,
+                "p_admin_notes": admin_notes,
+                "p_input_tokens": input_tokens,
+                "p_output_tokens": output_tokens,
+            }).execute()
+            transaction = result.data[0] if isinstance(result.data, list) and result.data else result.data or None
+            if transaction:
+                TokenQueries.balance_cache.set(user_id, transaction["balance_after"])
+            return transaction
         except HTTPException:
             raise
-        except Exception:
+        except Exception as e:
+            print(f"Error applying token transaction: {str(e)}")
             return None
 
+    @staticmethod
+    async def apply_token_transactions(entries: List[Dict]) -> List[Dict]:
+        """Apply many transactions in one apply_token_transactions call.
+
+        Entries that cannot be applied (e.g. unknown profile) are skipped and
+        missing from the result; transport errors are raised so callers can retry.
+        """
+        # Same lock order in every batch, so concurrent workers cannot deadlock on profile rows
+        entries = sorted(entries, key=lambda entry: entry["user_id"])
+        result = await supabase.rpc("apply_token_transactions", {"p_transactions": entries}).execute()
+        transactions = result.data or []
+        for transaction in transactions:
+            TokenQueries.balance_cache.set(transaction["user_id"], transaction["balance_after"])
+        return transactions
+
+    @staticmethod
+    async def set_token_allowance(user_id: str, tokens_total: int, tokens_used: Optional[int] = None, reason: str = "Token allowance set"):
+        """Set an absolute allowance (plan activation); tokens_used=None keeps the current usage"""
+        try:
+            result = await supabase.rpc("set_token_allowance", {
+                "p_user_id": user_id,
+                "p_tokens_total": tokens_total,
+                "p_tokens_used": tokens_used,
+                "p_reason": reason,
+            }).execute()
+            transaction = result.data[0] if isinstance(result.data, list) and result.data else result.data or None
+            TokenQueries.balance_cache.invalidate(user_id)
+            return transaction
+        except Exception as e:
+            print(f"Error setting token allowance: {str(e)}")
+            return None
+
+    @staticmethod
+    async def snapshot_balances(lag_seconds: int, limit: int) -> int:
+        result = await supabase.rpc("snapshot_token_balances", {"p_lag_seconds": lag_seconds, "p_limit": limit}).execute()
+        return result.data if isinstance(result.data, int) else 0
+
+    @staticmethod
+    async def reconcile_balances(repair: bool = False, limit: int = 1000) -> List[Dict]:
+        """Profiles whose tokens_total/tokens_used disagree with the ledger"""
+        result = await supabase.rpc("reconcile_token_balances", {"p_repair": repair, "p_limit": limit}).execute()
+        drifted = result.data or []
+        if repair:
+            for row in drifted:
+                TokenQueries.balance_cache.invalidate(row["user_id"])
+        return drifted
+
 
 class BankSettingsQueries:
+    @staticmethod
+    async def load_bank_settings():
+        result = await supabase.table("bank_settings").select("*").limit(1).execute()
+        return result.data[0] if result.data else None
+
     @staticmethod
     async def get_bank_settings():
         try:
-            result = supabase.table("bank_settings").select("*").limit(1).execute()
-            return result.data[0] if result.data else None
+            return await BankSettingsQueries.load_bank_settings()
         except Exception:
             return None
 
+    @staticmethod
+    async def get_cached_bank_settings() -> CacheEntry:
+        async def load():
+            return await BankSettingsQueries.load_bank_settings() or {}
+        return await catalog_cache.get("bank_settings", load)
+
     @staticmethod
     async def update_bank_settings(data: Dict):
         try:
             existing = await BankSettingsQueries.get_bank_settings()
             if existing:
-                result = supabase.table("bank_settings").update(data).eq("id", existing["id"]).execute()
+                result = await supabase.table("bank_settings").update(data).eq("id", existing["id"]).execute()
             else:
-                result = supabase.table("bank_settings").insert(data).execute()
+                result = await supabase.table("bank_settings").insert(data).execute()
             return result.data[0] if result.data else None
         except Exception:
             return None
 
 
-class AdminQueries:
+class TokenPackQueries:
     @staticmethod
-    async def get_all_users(search: Optional[str] = None, tier: Optional[str] = None, status: Optional[str] = None, limit: int = 50, offset: int = 0):
+    async def load_token_packs(active_only=True):
+        query = supabase.table("token_packs").select("*")
+        if active_only:
+            query = query.eq("is_active", True)
+        result = await query.execute()
+        return result.data or []
+
+    @staticmethod
+    async def get_token_packs(active_only=True):
         try:
-            query = supabase.table("profiles").select("*")
-            
-            if search:
-                query = query.or_(f"email.ilike.%{search}%,username.ilike.%{search}%")
-            if tier:
-                query = query.eq("subscription_tier", tier)
-            if status:
-                query = query.eq("subscription_status", status)
-            
-            result = query.order("created_at", desc=True).range(offset, offset + limit - 1).execute()
-            return result.data
+            return await TokenPackQueries.load_token_packs(active_only)
         except Exception:
             return []
 
+    @staticmethod
+    async def get_cached_token_packs() -> CacheEntry:
+        return await catalog_cache.get("token_packs", TokenPackQueries.load_token_packs)
+
+
+class AdminQueries:
+    @staticmethod
+    async def get_all_users(search: Optional[str] = None, tier: Optional[str] = None, status: Optional[str] = None,
+                            limit: int = 50, cursor: Optional[str] = None):
+        """Newest-first page of profiles (trigram-indexed search) and the cursor for the next page"""
+        position = CursorPagination.decode(cursor)
+        try:
+            result = await supabase.rpc("search_profiles", {
+                "p_search": search,
+                "p_tier": tier,
+                "p_status": status,
+                "p_before_at": position[0].isoformat() if position else None,
+                "p_before_id": position[1] if position else None,
+                "p_limit": limit + 1,
+            }).execute()
+            rows = result.data or []
+        except Exception as e:
+            print(f"Error searching users: {str(e)}")
+            return [], None
+
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = CursorPagination.encode(datetime.fromisoformat(last["created_at"]), last["id"])
+        return rows[:limit], next_cursor
+
     @staticmethod
     async def get_user(user_id: str):
         try:
-            result = supabase.table("profiles").select("*").eq("id", user_id).execute()
+            result = await supabase.table("profiles").select("*").eq("id", user_id).execute()
             if not result.data:
                 raise HTTPException(status_code=404, detail="User not found")
             return result.data[0]
@@ -321,10 +512,39 @@ class AdminQueries:
     @staticmethod
     async def update_user(user_id: str, data: Dict):
         try:
-            result = supabase.table("profiles").update(data).eq("id", user_id).execute()
-            return result.data[0] if result.data else None
+            result = await supabase.table("profiles").update(data).eq("id", user_id).execute()
         except Exception:
             return None
+        # Covers bans and plan changes too. Dropped only once the write has landed: a read between an
+        # earlier invalidation and the write would re-cache the old profile (ban flag included) for the TTL
+        invalidate_user(user_id)
+        TokenQueries.balance_cache.invalidate(user_id)
+        return result.data[0] if result.data else None
+
+    @staticmethod
+    async def bulk_operation(operation: str, user_ids: Optional[List[str]], user_filter: Optional[Dict],
+                             params: Dict, actor: str = "admin", dry_run: bool = False) -> List[Dict]:
+        """Apply one admin operation to many users in a single transaction (admin_bulk_operation).
+
+        Returns one {user_id, status, detail} row per target: applied, skipped,
+        not_found, or matched for a dry run. Errors are raised; nothing is applied then.
+        """
+        result = await supabase.rpc("admin_bulk_operation", {
+            "p_operation": operation,
+            "p_user_ids": user_ids,
+            "p_filter": user_filter,
+            "p_params": params,
+            "p_actor": actor,
+            "p_dry_run": dry_run,
+            "p_max_targets": settings.BULK_ADMIN_MAX_TARGETS,
+        }).execute()
+        rows = result.data or []
+        if not dry_run:
+            for row in rows:
+                if row["status"] == "applied":
+                    invalidate_user(row["user_id"])
+                    TokenQueries.balance_cache.invalidate(row["user_id"])
+        return rows
 
     @staticmethod
     async def ban_user(user_id: str, reason: str):
@@ -352,55 +572,33 @@ class AdminQueries:
             if status:
                 query = query.eq("status", status)
             
-            result = query.order("created_at", desc=True).range(offset, offset + limit - 1).execute()
+            result = await query.order("created_at", desc=True).range(offset, offset + limit - 1).execute()
             return result.data
         except Exception:
             return []
 
     @staticmethod
     async def get_admin_stats():
+        """Dashboard totals from the trigger-maintained admin_stats counters (constant time)"""
+        stats = {
+            "total_users": 0,
+            "active_subscriptions": {"starter": 0, "pro": 0, "pro_plus": 0, "enterprise": 0},
+            "pending_payments": 0,
+            "monthly_revenue": 0,
+            "total_revenue": 0,
+            "token_usage": 0
+        }
         try:
-            users_result = supabase.table("profiles").select("count").execute()
-            total_users = len(users_result.data) if users_result.data else 0
-
-            subscriptions_result = supabase.table("subscriptions").select("*").eq("status", "active").execute()
-            active_subs = subscriptions_result.data or []
-            
-            tier_counts = {"starter": 0, "pro": 0, "pro_plus": 0, "enterprise": 0}
-            monthly_revenue = 0
-            
-            for sub in active_subs:
-                plan_name = sub.get("plan_name", "").lower().replace(" ", "_")
-                if plan_name in tier_counts:
-                    tier_counts[plan_name] += 1
-                monthly_revenue += sub.get("price_paid", 0)
-
-            payments_result = supabase.table("payment_requests").select("*").eq("status", "pending").execute()
-            pending_payments = len(payments_result.data) if payments_result.data else 0
-
-            token_transactions = supabase.table("token_transactions").select("amount").eq("transaction_type", "usage").execute()
-            token_usage = sum(t.get("amount", 0) for t in (token_transactions.data or []))
-
-            all_subs = supabase.table("subscriptions").select("price_paid").execute()
-            total_revenue = sum(s.get("price_paid", 0) for s in (all_subs.data or []))
-
-            return {
-                "total_users": total_users,
-                "active_subscriptions": tier_counts,
-                "pending_payments": pending_payments,
-                "monthly_revenue": monthly_revenue,
-                "total_revenue": total_revenue,
-                "token_usage": token_usage
-            }
-        except Exception:
-            return {
-                "total_users": 0,
-                "active_subscriptions": {"starter": 0, "pro": 0, "pro_plus": 0, "enterprise": 0},
-                "pending_payments": 0,
-                "monthly_revenue": 0,
-                "total_revenue": 0,
-                "token_usage": 0
-            }
+            result = await supabase.rpc("get_admin_stats").execute()
+            data = result.data[0] if isinstance(result.data, list) and result.data else result.data or {}
+            for key in ("total_users", "pending_payments", "monthly_revenue", "total_revenue", "token_usage"):
+                stats[key] = data.get(key) or 0
+            for plan, count in (data.get("active_subscriptions") or {}).items():
+                if plan in stats["active_subscriptions"]:
+                    stats["active_subscriptions"][plan] = count
+        except Exception as e:
+            print(f"Error fetching admin stats: {str(e)}")
+        return stats
 
     @staticmethod
     async def get_all_payments(status: Optional[str] = None, user_id: Optional[str] = None, limit: int = 50, offset: int = 0):
@@ -412,7 +610,67 @@ class AdminQueries:
             if user_id:
                 query = query.eq("user_id", user_id)
             
-            result = query.order("created_at", desc=True).range(offset, offset + limit - 1).execute()
+            result = await query.order("created_at", desc=True).range(offset, offset + limit - 1).execute()
             return result.data
         except Exception:
             return []
+
+
+class AnalyticsQueries:
+    ROLLUP_SOURCES = ("token_transactions", "payment_requests", "payment_confirmations")
+    DEFAULT_RANGE = {"hour": timedelta(days=2), "day": timedelta(days=30)}
+    MAX_RANGE = {"hour": timedelta(days=31), "day": timedelta(days=366)}
+
+    @staticmethod
+    def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+        if value is None or value.tzinfo is None:
+            return value
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+    @staticmethod
+    def utc_iso(value: datetime) -> str:
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc).isoformat()
+
+    @staticmethod
+    async def rollup_source(source: str, lag_seconds: int, limit: int) -> int:
+        """Fold the next events of a Supabase-side source into the rollups; returns how many"""
+        result = await supabase.rpc("rollup_usage_source", {
+            "p_source": source,
+            "p_lag_seconds": lag_seconds,
+            "p_limit": limit,
+        }).execute()
+        return result.data if isinstance(result.data, int) else 0
+
+    @staticmethod
+    async def get_watermark(source: str) -> Dict:
+        result = await supabase.rpc("get_usage_rollup_watermark", {"p_source": source}).execute()
+        return result.data[0] if isinstance(result.data, list) else result.data
+
+    @staticmethod
+    async def merge_rollups(source: str, rows: List[Dict], from_watermark: Dict, watermark_at: datetime, watermark_id: str) -> bool:
+        """Merge hourly rows aggregated here; False when another worker already moved the watermark"""
+        result = await supabase.rpc("merge_usage_rollups", {
+            "p_source": source,
+            "p_rows": rows,
+            "p_from_at": from_watermark["watermark_at"],
+            "p_from_id": from_watermark["watermark_id"],
+            "p_watermark_at": AnalyticsQueries.utc_iso(watermark_at),
+            "p_watermark_id": watermark_id,
+        }).execute()
+        return result.data is True or result.data == [True]
+
+    @staticmethod
+    async def get_usage(bucket: str, start: datetime, end: datetime, group_by: str = "plan",
+                        metric: Optional[str] = None, user_id: Optional[str] = None, plan: Optional[str] = None) -> List[Dict]:
+        result = await supabase.rpc("get_usage_rollups", {
+            "p_bucket": bucket,
+            "p_from": AnalyticsQueries.utc_iso(start),
+            "p_to": AnalyticsQueries.utc_iso(end),
+            "p_group_by": group_by,
+            "p_metric": metric,
+            "p_user_id": user_id,
+            "p_plan": plan,
+        }).execute()
+        return result.data or []
@@ -0,0 +1,65 @@
+import logging
+import re
+from typing import Dict, List
+from sqlalchemy import select
+from sqlalchemy.engine import Connection, Engine
+from app.models import ChatMessage, ChatSecurity, ChatSession, TrainingDocument, User
+
+logger = logging.getLogger(__name__)
+
+PROBE = "query-plan-probe"
+
+HOT_QUERIES = {
+    "chat sessions by user": select(ChatSession).where(
+        ChatSession.user_id == PROBE
+    ).order_by(ChatSession.updated_at.desc(), ChatSession.id.desc()).limit(20),
+    "chat messages by session": select(ChatMessage).where(
+        ChatMessage.session_id == PROBE
+    ).order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc()).limit(50),
+    "training documents by user": select(TrainingDocument).where(
+        TrainingDocument.user_id == PROBE
+    ).order_by(TrainingDocument.created_at.desc()),
+    "training document by source": select(TrainingDocument).where(
+        TrainingDocument.source_name == PROBE,
+        TrainingDocument.user_id == PROBE
+    ),
+    "chat security by user": select(ChatSecurity).where(ChatSecurity.user_id == PROBE),
+    "user by email": select(User).where(User.email == PROBE),
+}
+
+# A bare "SCAN <table>" (older SQLite: "SCAN TABLE <table>"); anything USING an index is fine
+SQLITE_FULL_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)$")
+POSTGRES_FULL_SCAN = re.compile(r"Seq Scan on (\w+)")
+
+
+def explain(conn: Connection, statement) -> List[str]:
+    sql = str(statement.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+    if conn.dialect.name == "sqlite":
+        return [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+    # Tiny tables are always cheaper to scan, so ask whether an index path exists at all
+    conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+    return [row[0] for row in conn.exec_driver_sql(f"EXPLAIN {sql}")]
+
+
+def full_scans(dialect: str, plan: List[str]) -> List[str]:
+    pattern = SQLITE_FULL_SCAN if dialect == "sqlite" else POSTGRES_FULL_SCAN
+    return [match.group(1) for line in plan for match in [pattern.search(line.strip())] if match]
+
+
+def check_query_plans(engine: Engine) -> Dict[str, List[str]]:
+    """EXPLAIN each hot query and warn about any that would scan a whole table"""
+    problems = {}
+    try:
+        with engine.connect() as conn:
+            for name, statement in HOT_QUERIES.items():
+                transaction = conn.begin()
+                try:
+                    scanned = full_scans(conn.dialect.name, explain(conn, statement))
+                finally:
+                    transaction.rollback()
+                if scanned:
+                    problems[name] = scanned
+                    logger.warning(f"Query plan check: '{name}' does a full scan of {', '.join(scanned)}")
+    except Exception as e:
+        logger.warning(f"Query plan check skipped: {str(e)}")
+    return problems
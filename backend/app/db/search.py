@@ -0,0 +1,151 @@
+import logging
+import re
+from typing import Dict, List, Optional
+from sqlalchemy import func, literal_column, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import ChatMessage, ChatSession
+
+logger = logging.getLogger(__name__)
+
+SNIPPET_TOKENS = 16
+HIGHLIGHT_START = "**"
+HIGHLIGHT_END = "**"
+ELLIPSIS = "…"
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+class ChatSearch:
+    """Ranked full-text search over a user's chat messages.
+
+    SQLite uses the chat_messages_fts FTS5 table kept in sync by triggers
+    (migration 3); rowids of chat_messages can change on VACUUM, so run
+    rebuild() afterwards. Postgres uses the generated content_tsv column.
+    Archived sessions are not searchable until they are rehydrated.
+    """
+
+    _fts_available: Dict[str, bool] = {}
+
+    @staticmethod
+    def tokens(query: str) -> List[str]:
+        return TOKEN_PATTERN.findall(query.lower())[:16]
+
+    @staticmethod
+    def fts5_query(query: str) -> Optional[str]:
+        """Quote every term so user input can never be parsed as FTS5 syntax; the last term is a prefix"""
+        terms = ChatSearch.tokens(query)
+        if not terms:
+            return None
+        quoted = [f'"{term}"' for term in terms]
+        quoted[-1] += "*"
+        return " ".join(quoted)
+
+    @staticmethod
+    async def fts_available(db: AsyncSession) -> bool:
+        dialect = db.bind.dialect.name
+        if dialect not in ChatSearch._fts_available:
+            if dialect == "sqlite":
+                found = await db.scalar(text("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'chat_messages_fts'"))
+            elif dialect == "postgresql":
+                found = await db.scalar(text(
+                    "SELECT column_name FROM information_schema.columns "
+                    "WHERE table_name = 'chat_messages' AND column_name = 'content_tsv'"
+                ))
+            else:
+                found = None
+            ChatSearch._fts_available[dialect] = bool(found)
+            if not found:
+                logger.warning("Chat search index missing, falling back to a LIKE scan")
+        return ChatSearch._fts_available[dialect]
+
+    @staticmethod
+    async def search(db: AsyncSession, user_id: str, query: str, limit: int, offset: int) -> List[Dict]:
+        """Best matches first; fetches one extra row so callers can tell whether another page exists"""
+        if not ChatSearch.tokens(query):
+            return []
+
+        if not await ChatSearch.fts_available(db):
+            return await ChatSearch._search_like(db, user_id, query, limit, offset)
+        if db.bind.dialect.name == "sqlite":
+            return await ChatSearch._search_sqlite(db, user_id, query, limit, offset)
+        return await ChatSearch._search_postgres(db, user_id, query, limit, offset)
+
+    @staticmethod
+    async def _search_sqlite(db: AsyncSession, user_id: str, query: str, limit: int, offset: int) -> List[Dict]:
+        rows = await db.execute(
+            text(
+                "SELECT m.id AS message_id, m.session_id, s.title AS session_title, m.role, m.created_at, "
+                "snippet(chat_messages_fts, 0, :start, :end, :ellipsis, :tokens) AS snippet, "
+                "bm25(chat_messages_fts) AS rank "
+                "FROM chat_messages_fts "
+                "JOIN chat_messages m ON m.rowid = chat_messages_fts.rowid "
+                "JOIN chat_sessions s ON s.id = m.session_id "
+                "WHERE chat_messages_fts MATCH :match AND s.user_id = :user_id "
+                "ORDER BY rank LIMIT :limit OFFSET :offset"
+            ).columns(created_at=ChatMessage.created_at.type),
+            {
+                "match": ChatSearch.fts5_query(query),
+                "user_id": user_id,
+                "start": HIGHLIGHT_START,
+                "end": HIGHLIGHT_END,
+                "ellipsis": ELLIPSIS,
+                "tokens": SNIPPET_TOKENS,
+                "limit": limit + 1,
+                "offset": offset,
+            }
+        )
+        # bm25() is lower-is-better; expose a higher-is-better score
+        return [{**row._asdict(), "rank": -row.rank} for row in rows]
+
+    @staticmethod
+    async def _search_postgres(db: AsyncSession, user_id: str, query: str, limit: int, offset: int) -> List[Dict]:
+        ts_query = func.websearch_to_tsquery("english", query)
+        tsv = literal_column("chat_messages.content_tsv")
+        rank = func.ts_rank_cd(tsv, ts_query)
+        options = f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}, MaxWords={SNIPPET_TOKENS}, MinWords=5, FragmentDelimiter={ELLIPSIS}"
+        rows = await db.execute(
+            select(
+                ChatMessage.id.label("message_id"),
+                ChatMessage.session_id,
+                ChatSession.title.label("session_title"),
+                ChatMessage.role,
+                ChatMessage.created_at,
+                func.ts_headline("english", ChatMessage.content, ts_query, options).label("snippet"),
+                rank.label("rank"),
+            ).join(ChatSession, ChatSession.id == ChatMessage.session_id).where(
+                tsv.op("@@")(ts_query),
+                ChatSession.user_id == user_id
+            ).order_by(rank.desc()).limit(limit + 1).offset(offset)
+        )
+        return [row._asdict() for row in rows]
+
+    @staticmethod
+    async def _search_like(db: AsyncSession, user_id: str, query: str, limit: int, offset: int) -> List[Dict]:
+        terms = ChatSearch.tokens(query)
+        pattern = "%" + "%".join(term.replace("%", r"\%").replace("_", r"\_") for term in terms) + "%"
+        rows = await db.execute(
+            select(ChatMessage, ChatSession.title).join(ChatSession, ChatSession.id == ChatMessage.session_id).where(
+                ChatSession.user_id == user_id,
+                func.lower(ChatMessage.content).like(pattern, escape="\\")
+            ).order_by(ChatMessage.created_at.desc()).limit(limit + 1).offset(offset)
+        )
+        results = []
+        for message, title in rows:
+            position = message.content.lower().find(terms[0])
+            start = max(0, position - 60)
+            snippet = message.content[start:start + 160]
+            results.append({
+                "message_id": message.id,
+                "session_id": message.session_id,
+                "session_title": title,
+                "role": message.role,
+                "created_at": message.created_at,
+                "snippet": (ELLIPSIS if start else "") + snippet,
+                "rank": 0.0,
+            })
+        return results
+
+    @staticmethod
+    async def rebuild(db: AsyncSession):
+        if db.bind.dialect.name == "sqlite" and await ChatSearch.fts_available(db):
+            await db.execute(text("INSERT INTO chat_messages_fts(chat_messages_fts) VALUES ('rebuild')"))
+            await db.commit()
@@ -0,0 +1,109 @@
+import asyncio
+import weakref
+from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.sql.elements import TextClause
+from app.config import get_settings
+
+settings = get_settings()
+
+_write_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = weakref.WeakKeyDictionary()
+
+
+def sqlite_pragmas(tuned: bool = None) -> List[str]:
+    """PRAGMAs run on every new SQLite connection; the performance profile is SQLITE_TUNING_ENABLED"""
+    tuned = settings.SQLITE_TUNING_ENABLED if tuned is None else tuned
+    pragmas = ["PRAGMA foreign_keys=ON"]
+    if tuned:
+        pragmas += [
+            f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}",
+            f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}",
+            f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}",
+            f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}",
+            f"PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE_KB}",
+            "PRAGMA temp_store=MEMORY",
+        ]
+    return pragmas
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in sqlite_pragmas():
+        cursor.execute(pragma)
+    cursor.close()
+
+
+def write_lock() -> asyncio.Lock:
+    """One lock per event loop so concurrent commits queue here instead of on the database file"""
+    loop = asyncio.get_running_loop()
+    lock = _write_locks.get(loop)
+    if lock is None:
+        lock = _write_locks[loop] = asyncio.Lock()
+    return lock
+
+
+def is_write_statement(statement) -> bool:
+    """INSERT/UPDATE/DELETE, as Core constructs or raw text, which open SQLite's write transaction"""
+    if isinstance(statement, UpdateBase):
+        return True
+    if isinstance(statement, TextClause):
+        words = statement.text.split(None, 1)
+        return bool(words) and words[0].upper() in ("INSERT", "UPDATE", "DELETE", "REPLACE")
+    return False
+
+
+class SerializedAsyncSession(AsyncSession):
+    """AsyncSession that holds the SQLite write lock for the whole of its write transaction.
+
+    SQLite takes its file write lock at the first INSERT/UPDATE/DELETE, which
+    for Core statements is execute() time, not commit. So the lock is taken
+    before the first write statement or flush (or at commit, for ORM changes
+    that are only flushed there) and held until commit, rollback or close.
+    Sessions then queue here instead of timing out on "database is locked".
+    """
+
+    _held_write_lock: Optional[asyncio.Lock] = None
+
+    async def _acquire_write_lock(self):
+        if self._held_write_lock is None:
+            lock = write_lock()
+            await lock.acquire()
+            self._held_write_lock = lock
+
+    def _release_write_lock(self):
+        lock, self._held_write_lock = self._held_write_lock, None
+        if lock is not None:
+            lock.release()
+
+    async def execute(self, statement, *args, **kwargs):
+        if is_write_statement(statement):
+            await self._acquire_write_lock()
+        return await super().execute(statement, *args, **kwargs)
+
+    async def flush(self, objects=None) -> None:
+        if self.new or self.dirty or self.deleted:
+            await self._acquire_write_lock()
+        await super().flush(objects)
+
+    async def commit(self) -> None:
+        if self._held_write_lock is None and not (self.new or self.dirty or self.deleted):
+            await super().commit()
+            return
+        await self._acquire_write_lock()
+        try:
+            await super().commit()
+        finally:
+            self._release_write_lock()
+
+    async def rollback(self) -> None:
+        try:
+            await super().rollback()
+        finally:
+            self._release_write_lock()
+
+    async def close(self) -> None:
+        try:
+            await super().close()
+        finally:
+            self._release_write_lock()
@@ -0,0 +1,59 @@
+import asyncio
+import logging
+from typing import Dict, Optional
+from app.config import get_settings
+from app.db.queries import TokenQueries
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class TokenLedgerJob:
+    """Periodically folds token_transactions into balance snapshots and reconciles profiles.
+
+    Balance reads cost the snapshot plus the transactions since the last fold,
+    so the fold interval (TOKEN_SNAPSHOT_INTERVAL_MINUTES) bounds that work.
+    Profiles that drift from the ledger are logged, and rewritten from it when
+    TOKEN_RECONCILE_REPAIR is set.
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.last_run: Dict = {}
+
+    async def run_once(self) -> Dict:
+        folded = await TokenQueries.snapshot_balances(settings.TOKEN_SNAPSHOT_LAG_SECONDS, settings.TOKEN_SNAPSHOT_BATCH_SIZE)
+        drifted = await TokenQueries.reconcile_balances(repair=settings.TOKEN_RECONCILE_REPAIR, limit=settings.TOKEN_SNAPSHOT_BATCH_SIZE)
+        for row in drifted:
+            logger.warning(
+                f"Token balance drift for user {row['user_id']}: profile {row['profile_total']}/{row['profile_used']}, "
+                f"ledger {row['ledger_total']}/{row['ledger_used']}" + (" (repaired)" if settings.TOKEN_RECONCILE_REPAIR else "")
+            )
+        self.last_run = {"snapshots_folded": folded, "drifted_profiles": len(drifted), "repaired": settings.TOKEN_RECONCILE_REPAIR}
+        return self.last_run
+
+    async def _run(self):
+        while True:
+            try:
+                result = await self.run_once()
+                if result["snapshots_folded"] == settings.TOKEN_SNAPSHOT_BATCH_SIZE:
+                    continue
+            except Exception as e:
+                logger.error(f"Token ledger snapshot run failed: {str(e)}")
+            await asyncio.sleep(settings.TOKEN_SNAPSHOT_INTERVAL_MINUTES * 60)
+
+    def start(self):
+        if settings.TOKEN_SNAPSHOT_ENABLED and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+token_ledger_job = TokenLedgerJob()
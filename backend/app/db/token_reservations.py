@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import math
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Awaitable, Dict, List, Optional, Tuple
+from fastapi import HTTPException, status
+from app.config import get_settings
+from app.db.queries import TokenQueries, catalog_cache
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class Reservation:
+    """Tokens held for one LLM call until it is settled or released"""
+
+    def __init__(self, book: "TokenReservations", user_id: str, amount: int):
+        self.id = str(uuid.uuid4())
+        self.book = book
+        self.user_id = user_id
+        self.amount = amount
+        self.created_at = time.monotonic()
+        self.done = False
+
+    def __enter__(self) -> "Reservation":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Whatever ended the block before settle (an error, a cancelled request), the hold goes back
+        self.release()
+
+    def release(self):
+        """Give the held tokens back without charging (the call failed)"""
+        self.book.release(self)
+
+    def settle(self, response_text: str, reason: str, input_tokens: Optional[int] = None, output_tokens: Optional[int] = None):
+        """Charge the actual cost of the response through the settlement queue"""
+        self.book.settle(self, response_text, reason, input_tokens, output_tokens)
+
+
+class TokenReservations:
+    """Pre-flight balance checks for LLM calls with batched, asynchronous settlement.
+
+    reserve() checks cached balance - held reservations - unsettled charges,
+    so the hot path is in memory once the balance is cached. Settled charges
+    are written every TOKEN_SETTLEMENT_FLUSH_MS through one
+    apply_token_transactions call, and on shutdown. Reservations that are
+    neither settled nor released expire after TOKEN_RESERVATION_TIMEOUT_SECONDS.
+    """
+
+    def __init__(self, flush_interval_ms: int = None, max_batch: int = None):
+        self.flush_interval = (flush_interval_ms if flush_interval_ms is not None else settings.TOKEN_SETTLEMENT_FLUSH_MS) / 1000
+        self.max_batch = max_batch or settings.TOKEN_SETTLEMENT_MAX_BATCH
+        self.held: Dict[str, Dict[str, Reservation]] = defaultdict(dict)
+        self.unsettled: Dict[str, int] = defaultdict(int)
+        self.queue: List[Dict] = []
+        self.flushes = 0
+        self.settled = 0
+        self.dropped = 0
+        self.rejected = 0
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._flush_lock = asyncio.Lock()
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def token_config(self) -> Dict:
+        try:
+            return (await TokenQueries.get_cached_token_config()).value
+        except Exception as e:
+            # Sizing a hold is not worth refusing service over; the defaults are used but never cached
+            logger.warning(f"Token config unavailable, reserving with defaults: {str(e)}")
+            return catalog_cache.peek("token_config") or dict(TokenQueries.DEFAULT_TOKEN_CONFIG)
+
+    def estimate(self, config: Dict) -> int:
+        """Cost of an average response, used to size reservations"""
+        cost = 0.0
+        if config.get("enabled_per_message"):
+            cost += float(config.get("cost_per_message") or 0)
+        if config.get("enabled_per_character"):
+            cost += settings.TOKEN_RESERVATION_RESPONSE_CHARS * float(config.get("cost_per_character_response") or 0)
+        return math.ceil(cost)
+
+    def held_amount(self, user_id: str) -> int:
+        cutoff = time.monotonic() - settings.TOKEN_RESERVATION_TIMEOUT_SECONDS
+        held = self.held.get(user_id, {})
+        for reservation in [r for r in held.values() if r.created_at < cutoff]:
+            logger.warning(f"Token reservation {reservation.id} for user {user_id} expired without settling")
+            self.release(reservation)
+        return sum(r.amount for r in held.values())
+
+    async def reserve(self, user_id: str) -> Reservation:
+        """Hold the estimated cost of one call, or raise 402 when the balance cannot cover it"""
+        config = await self.token_config()
+        balance = await TokenQueries.get_cached_balance(user_id)
+        amount = self.estimate(config)
+
+        # An unknown balance (billing backend unreachable) is not a reason to refuse service
+        if balance is not None:
+            available = balance - self.held_amount(user_id) - self.unsettled.get(user_id, 0)
+            if available <= 0 or available < amount:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_402_PAYMENT_REQUIRED,
+                    detail="Insufficient token balance"
+                )
+
+        reservation = Reservation(self, user_id, amount)
+        self.held[user_id][reservation.id] = reservation
+        return reservation
+
+    async def reserve_during(self, user_id: str, work: Awaitable) -> Tuple[Reservation, Any]:
+        """Reserve while work runs, so a balance lookup is not added to the request's critical path.
+
+        Raises 402 once work has finished if the balance cannot cover the call;
+        if work fails, a hold that was already taken is released.
+        """
+        reserving = asyncio.ensure_future(self.reserve(user_id))
+        try:
+            result = await work
+            return await reserving, result
+        except BaseException:
+            reserving.cancel()
+            reserving.add_done_callback(self._release_abandoned)
+            raise
+
+    @staticmethod
+    def _release_abandoned(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is None:
+            task.result().release()
+
+    def release(self, reservation: Reservation):
+        if reservation.done:
+            return
+        reservation.done = True
+        held = self.held.get(reservation.user_id)
+        if held is not None:
+            held.pop(reservation.id, None)
+            if not held:
+                del self.held[reservation.user_id]
+
+    def settle(self, reservation: Reservation, response_text: str, reason: str,
+               input_tokens: Optional[int] = None, output_tokens: Optional[int] = None):
+        if reservation.done:
+            return
+        self.release(reservation)
+        config = catalog_cache.peek("token_config") or dict(TokenQueries.DEFAULT_TOKEN_CONFIG)
+        amount = TokenQueries.calculate_usage_cost(config, response_text)
+        if amount <= 0:
+            return
+
+        self._ensure_started()
+        self.unsettled[reservation.user_id] += amount
+        self.queue.append({
+            "user_id": reservation.user_id,
+            "amount": amount,
+            "transaction_type": "usage",
+            "reason": reason,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+        })
+        if len(self.queue) >= self.max_batch:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Token settlement failed, will retry: {str(e)}")
+
+    async def flush(self):
+        if self._flush_lock is None:
+            self._ensure_started()
+        async with self._flush_lock:
+            while self.queue:
+                batch, self.queue = self.queue[:self.max_batch], self.queue[self.max_batch:]
+                try:
+                    transactions = await TokenQueries.apply_token_transactions(batch)
+                except Exception:
+                    # Billing backend unavailable: keep the charges (and their holds on the balance) for the next flush
+                    self.queue[:0] = batch
+                    raise
+
+                applied = defaultdict(int)
+                for transaction in transactions:
+                    applied[transaction["user_id"]] += 1
+                for entry in batch:
+                    user_id = entry["user_id"]
+                    self.unsettled[user_id] -= entry["amount"]
+                    if self.unsettled[user_id] <= 0:
+                        del self.unsettled[user_id]
+                    if applied[user_id] > 0:
+                        applied[user_id] -= 1
+                        self.settled += 1
+                    else:
+                        self.dropped += 1
+                        logger.error(f"Dropping unsettleable token charge of {entry['amount']} for user {user_id}")
+                self.flushes += 1
+
+    async def stop(self):
+        """Stop the settlement loop and write out every queued charge"""
+        if self._task is not None:
+            async with self._flush_lock:
+                self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.queue:
+            await self.flush()
+
+    def stats(self) -> Dict:
+        return {
+            "held_reservations": sum(len(held) for held in self.held.values()),
+            "queued_charges": len(self.queue),
+            "flushes": self.flushes,
+            "settled": self.settled,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+        }
+
+
+token_reservations = TokenReservations()
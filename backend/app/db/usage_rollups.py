@@ -0,0 +1,119 @@
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+from sqlalchemy import func, select, tuple_
+from app.config import get_settings
+from app.database import AsyncSessionLocal
+from app.db.queries import AnalyticsQueries
+from app.models import ChatMessage, ChatSession
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+def parse_watermark(value: Optional[str]) -> Optional[datetime]:
+    """Supabase timestamptz as a naive UTC datetime (the local DB's convention); None for -infinity"""
+    if not value or value.startswith("-infinity"):
+        return None
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+class UsageRollupJob:
+    """Periodically folds new usage events into the hourly/daily usage_rollups tables.
+
+    Token transactions and payments are rolled up inside Supabase
+    (rollup_usage_source). Chat messages live in the local database, so they
+    are aggregated here per hour, user and role and merged together with the
+    new watermark. Only events older than USAGE_ROLLUP_LAG_SECONDS are
+    folded, so rows from transactions still in flight are not skipped.
+
+    The chat watermark follows ingested_at, not created_at: imported chats
+    keep their original timestamps, which are already behind the watermark.
+    They are still bucketed by created_at, so they land in their own hours.
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.last_run: Dict = {}
+
+    async def rollup_chat_messages(self) -> int:
+        watermark = await AnalyticsQueries.get_watermark("chat_messages")
+        position = parse_watermark(watermark["watermark_at"])
+        cutoff = datetime.utcnow() - timedelta(seconds=settings.USAGE_ROLLUP_LAG_SECONDS)
+
+        query = select(
+            ChatMessage.id, ChatMessage.created_at, ChatMessage.ingested_at, ChatMessage.role,
+            func.length(ChatMessage.content).label("characters"), ChatSession.user_id
+        ).join(ChatSession, ChatSession.id == ChatMessage.session_id).where(ChatMessage.ingested_at < cutoff)
+        if position is not None:
+            query = query.where(tuple_(ChatMessage.ingested_at, ChatMessage.id) > (position, watermark["watermark_id"]))
+        query = query.order_by(ChatMessage.ingested_at, ChatMessage.id).limit(settings.USAGE_ROLLUP_BATCH_SIZE)
+
+        async with AsyncSessionLocal() as db:
+            messages = (await db.execute(query)).all()
+        if not messages:
+            return 0
+
+        buckets = defaultdict(lambda: [0, 0])
+        for message in messages:
+            hour = message.created_at.replace(minute=0, second=0, microsecond=0)
+            bucket = buckets[(hour, message.user_id, f"chat:{message.role}")]
+            bucket[0] += 1
+            bucket[1] += message.characters or 0
+        rows = [
+            {
+                "bucket_start": AnalyticsQueries.utc_iso(hour),
+                "user_id": user_id,
+                "metric": metric,
+                "event_count": count,
+                "amount": characters,
+            }
+            for (hour, user_id, metric), (count, characters) in buckets.items()
+        ]
+
+        last = messages[-1]
+        if not await AnalyticsQueries.merge_rollups("chat_messages", rows, watermark, last.ingested_at, last.id):
+            logger.info("Chat message rollup skipped: another worker advanced the watermark")
+            return 0
+        return len(messages)
+
+    async def run_once(self) -> Dict:
+        folded = {}
+        for source in AnalyticsQueries.ROLLUP_SOURCES:
+            folded[source] = await AnalyticsQueries.rollup_source(
+                source, settings.USAGE_ROLLUP_LAG_SECONDS, settings.USAGE_ROLLUP_BATCH_SIZE
+            )
+        folded["chat_messages"] = await self.rollup_chat_messages()
+        self.last_run = folded
+        return folded
+
+    async def _run(self):
+        while True:
+            try:
+                folded = await self.run_once()
+                if max(folded.values()) == settings.USAGE_ROLLUP_BATCH_SIZE:
+                    continue
+            except Exception as e:
+                logger.error(f"Usage rollup run failed: {str(e)}")
+            await asyncio.sleep(settings.USAGE_ROLLUP_INTERVAL_MINUTES * 60)
+
+    def start(self):
+        if settings.USAGE_ROLLUP_ENABLED and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+usage_rollup_job = UsageRollupJob()
@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Set
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+from app.config import get_settings
+from app.models import ChatMessage, ChatSession
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+def to_row(obj) -> Dict:
+    """Column values of an unsaved ORM object, leaving unset columns to their defaults"""
+    values = {attr.key: getattr(obj, attr.key) for attr in obj.__mapper__.column_attrs}
+    return {key: value for key, value in values.items() if value is not None}
+
+
+class ChatWriteBuffer:
+    """Write-behind queue that turns per-request chat inserts into periodic bulk inserts.
+
+    Rows are flushed every CHAT_WRITE_BEHIND_FLUSH_MS, as soon as
+    CHAT_WRITE_BEHIND_MAX_BATCH messages are queued, and on shutdown, so at
+    most one flush interval of writes is at risk if the process dies.
+    Requests block on a flush once CHAT_WRITE_BEHIND_MAX_PENDING is reached.
+    """
+
+    def __init__(self, session_factory=None, flush_interval_ms: int = None, max_batch: int = None, max_pending: int = None):
+        self.session_factory = session_factory
+        self.flush_interval = (flush_interval_ms if flush_interval_ms is not None else settings.CHAT_WRITE_BEHIND_FLUSH_MS) / 1000
+        self.max_batch = max_batch or settings.CHAT_WRITE_BEHIND_MAX_BATCH
+        self.max_pending = max_pending or settings.CHAT_WRITE_BEHIND_MAX_PENDING
+        self.sessions: List[Dict] = []
+        self.messages: List[Dict] = []
+        self.touches: Dict[str, Dict] = {}
+        self.pending_users: Set[str] = set()
+        # Users whose rows are in the flush running now; reads wait for its commit
+        self.flushing_users: Set[str] = set()
+        self.flushes = 0
+        self.rows_written = 0
+        self.last_flush_ms: Optional[float] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return settings.CHAT_WRITE_BEHIND_ENABLED
+
+    @property
+    def pending(self) -> int:
+        return len(self.sessions) + len(self.messages) + len(self.touches)
+
+    def _factory(self):
+        if self.session_factory is None:
+            from app.database import AsyncSessionLocal
+            self.session_factory = AsyncSessionLocal
+        return self.session_factory
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._flush_lock = asyncio.Lock()
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def enqueue(self, user_id: str, new_session: Optional[ChatSession] = None,
+                      messages: Optional[List[ChatMessage]] = None, touch: Optional[Dict] = None):
+        """Queue a new session, its latest activity timestamp and new messages for the next flush"""
+        self._ensure_started()
+        if new_session is not None:
+            self.sessions.append(to_row(new_session))
+        if touch is not None:
+            self.touches[touch["id"]] = touch
+        self.messages.extend(to_row(message) for message in messages or [])
+        self.pending_users.add(user_id)
+
+        if len(self.messages) >= self.max_pending:
+            await self.flush()
+        elif len(self.messages) >= self.max_batch:
+            self._wakeup.set()
+
+    async def flush_if_pending(self, user_id: str, db=None):
+        """Make a user's queued writes visible before reading them back.
+
+        The caller's session is committed first so it hands its pooled
+        connection back instead of holding it while the flush waits for one.
+        """
+        if user_id in self.pending_users or user_id in self.flushing_users:
+            if db is not None and db.in_transaction():
+                await db.commit()
+            await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Chat write-behind flush failed, will retry: {str(e)}")
+
+    async def flush(self):
+        if self._flush_lock is None:
+            self._ensure_started()
+        async with self._flush_lock:
+            if not self.pending:
+                return
+            sessions, messages, touches = self.sessions, self.messages, list(self.touches.values())
+            self.sessions, self.messages, self.touches = [], [], {}
+            self.flushing_users, self.pending_users = self.pending_users, set()
+            queued = len(sessions) + len(messages) + len(touches)
+
+            start = time.perf_counter()
+            written = False
+            try:
+                try:
+                    await self._write(sessions, messages, touches)
+                except IntegrityError as e:
+                    logger.warning(f"Bulk chat insert rejected, retrying row by row: {str(e)}")
+                    await self._write_rows(sessions, messages, touches)
+                written = True
+            finally:
+                if not written:
+                    # Database unavailable: put whatever was not written back in order and let the next flush retry
+                    self.sessions[:0], self.messages[:0] = sessions, messages
+                    for touch in touches:
+                        self.touches.setdefault(touch["id"], touch)
+                    self.pending_users |= self.flushing_users
+                self.flushing_users = set()
+
+            self.flushes += 1
+            self.rows_written += queued
+            self.last_flush_ms = round((time.perf_counter() - start) * 1000, 1)
+
+    async def _write(self, sessions: List[Dict], messages: List[Dict], touches: List[Dict]):
+        async with self._factory()() as db:
+            if sessions:
+                await db.execute(insert(ChatSession), sessions)
+            if messages:
+                await db.execute(insert(ChatMessage), messages)
+            if touches:
+                await db.execute(update(ChatSession), touches)
+            await db.commit()
+
+    async def _write_rows(self, sessions: List[Dict], messages: List[Dict], touches: List[Dict]):
+        """Isolate rows that can never be written (e.g. their session was deleted) so they stop blocking the queue.
+
+        Rows are removed from the lists as they are settled, so on any other
+        error the lists hold exactly what still has to be written.
+        """
+        for position, rows in enumerate((sessions, messages, touches)):
+            while rows:
+                batch = ([], [], [])
+                batch[position].append(rows[0])
+                try:
+                    await self._write(*batch)
+                except IntegrityError as e:
+                    logger.error(f"Dropping unwritable chat row {rows[0].get('id')}: {str(e)}")
+                rows.pop(0)
+
+    async def stop(self):
+        """Stop the flusher and write out everything still queued"""
+        if self._task is not None:
+            # Cancel between flushes, never in the middle of one
+            async with self._flush_lock:
+                self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.pending:
+            await self.flush()
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "pending_rows": self.pending,
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+
+chat_write_buffer = ChatWriteBuffer()
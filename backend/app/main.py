@@ -4,7 +4,16 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.responses import JSONResponse
 from app.config import get_settings
-from app.database import init_db
+from app.database import init_db, async_engine
+from app.db.write_behind import chat_write_buffer
+from app.db.archive import chat_archiver
+from app.db.token_reservations import token_reservations
+from app.db.token_ledger import token_ledger_job
+from app.db.usage_rollups import usage_rollup_job
+from app.db.payment_confirmations import payment_confirmation_queue
+from app.security import password_hasher
+from app.core.supabase_async import supabase_async
+from app.db.queries import catalog_cache
 from app.api.routes import auth, chat, training, modules, subscriptions, admin, chat_security
 from app.security_middleware import RateLimitMiddleware, SecurityHeadersMiddleware, RequestLoggingMiddleware
 import logging
@@ -71,9 +80,26 @@ async def validation_exception_handler(request, exc):
 @app.on_event("startup")
 async def startup_event():
     init_db()
+    chat_archiver.start()
+    token_ledger_job.start()
+    usage_rollup_job.start()
+    payment_confirmation_queue.start()
     logger.info(f"Application started in {settings.ENVIRONMENT} mode")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await chat_archiver.stop()
+    await token_ledger_job.stop()
+    await usage_rollup_job.stop()
+    await payment_confirmation_queue.stop()
+    await chat_write_buffer.stop()
+    await token_reservations.stop()
+    await async_engine.dispose()
+    await supabase_async.aclose()
+    password_hasher.shutdown()
+
+
 app.include_router(auth.router, prefix=settings.API_V1_STR)
 app.include_router(chat.router, prefix=settings.API_V1_STR)
 app.include_router(training.router, prefix=settings.API_V1_STR)
@@ -94,7 +120,12 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "password_hashing": password_hasher.stats(),
+        "supabase": supabase_async.stats(),
+        "catalog_cache": catalog_cache.stats(),
+    }
 
 
 if __name__ == "__main__":
@@ -62,6 +62,49 @@ class ChatSessionResponse(BaseModel):
         from_attributes = True
 
 
+class ChatMessagePage(BaseModel):
+    items: List[ChatMessageResponse]
+    next_cursor: Optional[str] = None
+
+
+class ChatSessionSummary(BaseModel):
+    id: str
+    title: str
+    created_at: datetime
+    updated_at: datetime
+    message_count: int
+    last_message_preview: Optional[str] = None
+    archived: bool = False
+
+
+class ChatSessionSummaryPage(BaseModel):
+    items: List[ChatSessionSummary]
+    next_cursor: Optional[str] = None
+
+
+class ChatSearchResult(BaseModel):
+    message_id: str
+    session_id: str
+    session_title: Optional[str] = None
+    role: str
+    snippet: str
+    created_at: datetime
+    rank: float
+
+
+class ChatSearchPage(BaseModel):
+    query: str
+    items: List[ChatSearchResult]
+    limit: int
+    offset: int
+    has_more: bool
+
+
+class ChatImportResponse(BaseModel):
+    sessions_imported: int
+    messages_imported: int
+
+
 class ChatRequest(BaseModel):
     message: str
     session_id: Optional[str] = None
@@ -1,3 +1,7 @@
+import asyncio
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
@@ -6,22 +10,91 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer
 from fastapi.security.http import HTTPAuthorizationCredentials
 from app.config import get_settings
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
 from app.models import User
-from app.database import get_db
+from app.database import get_async_db
+from app.utils.ttl_cache import TTLCache
 
 settings = get_settings()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
 security = HTTPBearer()
 
+# Detached User rows and verified JWT payloads, so authenticated requests skip the lookup and signature check
+user_cache = TTLCache(settings.AUTH_USER_CACHE_MAX_SIZE, settings.AUTH_USER_CACHE_TTL_SECONDS)
+token_cache = TTLCache(settings.AUTH_TOKEN_CACHE_MAX_SIZE, settings.AUTH_TOKEN_CACHE_TTL_SECONDS)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
 
+class PasswordHasher:
+    """Runs bcrypt on its own small thread pool so a login burst cannot block the event loop.
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    At most PASSWORD_HASH_WORKERS hashes run at once and PASSWORD_HASH_MAX_QUEUE
+    more may wait; beyond that callers get a 503 instead of piling up.
+    """
+
+    def __init__(self, workers: int = None, max_queue: int = None):
+        self.workers = workers or settings.PASSWORD_HASH_WORKERS
+        self.max_queue = max_queue if max_queue is not None else settings.PASSWORD_HASH_MAX_QUEUE
+        self.in_flight = 0
+        self.peak_queue_depth = 0
+        self.rejected = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self.in_flight - self.workers)
+
+    async def run(self, func, *args):
+        if self.in_flight >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many authentication requests, please retry shortly",
+                headers={"Retry-After": "1"},
+            )
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+
+        self.in_flight += 1
+        self.peak_queue_depth = max(self.peak_queue_depth, self.queue_depth)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self.in_flight -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self.run(pwd_context.hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self.run(pwd_context.verify, plain_password, hashed_password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "rounds": settings.BCRYPT_ROUNDS,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "peak_queue_depth": self.peak_queue_depth,
+            "rejected": self.rejected,
+        }
+
+
+password_hasher = PasswordHasher()
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await password_hasher.verify(plain_password, hashed_password)
+
+
+async def get_password_hash(password: str) -> str:
+    return await password_hasher.hash(password)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -37,16 +110,37 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
 
 
 def decode_token(token: str) -> dict:
+    key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    payload = token_cache.get(key)
+    if payload is not None:
+        return payload
+
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        return payload
     except JWTError:
         return None
 
+    # Never serve a cached payload past the token's own expiry
+    expires_in = payload["exp"] - time.time() if isinstance(payload.get("exp"), (int, float)) else None
+    token_cache.set(key, payload, ttl=expires_in)
+    return payload
+
+
+def detached_copy(user: User) -> User:
+    """Snapshot of a user's columns that no session owns, so a rollback elsewhere cannot expire it"""
+    copy = User(**{attr.key: getattr(user, attr.key) for attr in User.__mapper__.column_attrs})
+    make_transient_to_detached(copy)
+    return copy
+
+
+def invalidate_user(user_id: str):
+    """Drop a cached user after it is updated, banned or deleted"""
+    user_cache.invalidate(user_id)
+
 
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> User:
     token = credentials.credentials
     payload = decode_token(token)
@@ -65,13 +159,19 @@ async def get_current_user(
             detail="Invalid authentication credentials",
         )
     
-    user = db.query(User).filter(User.id == user_id).first()
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        # Attach a per-request copy without a SELECT; the cached instance stays detached
+        return await db.merge(cached, load=False)
+
+    user = await db.scalar(select(User).where(User.id == user_id))
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials",
         )
-    
+
+    user_cache.set(user_id, detached_copy(user))
     return user
 
 
@@ -0,0 +1,36 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+from fastapi import HTTPException, status
+
+
+class CursorPagination:
+    """Opaque keyset cursors over a (timestamp, id) sort key"""
+
+    @staticmethod
+    def encode(timestamp: datetime, row_id: str) -> str:
+        payload = json.dumps([timestamp.isoformat(), row_id])
+        return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+    @staticmethod
+    def decode(cursor: Optional[str]) -> Optional[Tuple[datetime, str]]:
+        if not cursor:
+            return None
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            timestamp, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+            return datetime.fromisoformat(timestamp), str(row_id)
+        except Exception:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid pagination cursor"
+            )
+
+    @staticmethod
+    def next_cursor(rows: list, limit: int, timestamp_attr: str, id_attr: str = "id") -> Optional[str]:
+        """Cursor for the page after rows, given that limit + 1 rows were fetched"""
+        if len(rows) <= limit:
+            return None
+        last = rows[limit - 1]
+        return CursorPagination.encode(getattr(last, timestamp_attr), getattr(last, id_attr))
@@ -0,0 +1,114 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+
+class CacheEntry:
+    def __init__(self, value: Any, ttl: float):
+        self.value = value
+        self.body = json.dumps(jsonable_encoder(value), separators=(",", ":"), sort_keys=True).encode("utf-8")
+        self.etag = f'"{hashlib.sha256(self.body).hexdigest()[:32]}"'
+        self.fetched_at = time.monotonic()
+        self.expires_at = self.fetched_at + ttl
+
+    def is_fresh(self) -> bool:
+        return time.monotonic() < self.expires_at
+
+
+class ReadThroughCache:
+    """Async read-through cache for rarely-changing reference data.
+
+    Fresh entries are served from memory. Past their TTL, entries are still
+    served for up to stale_ttl seconds while one background task reloads
+    them; a failed reload keeps the stale value. Misses are single-flight:
+    concurrent callers wait for one load. Invalidation is per process, so
+    other workers converge within the TTL.
+    """
+
+    def __init__(self, ttl: float, stale_ttl: float):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._entries: Dict[Hashable, CacheEntry] = {}
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._refreshing: Dict[Hashable, asyncio.Task] = {}
+        self._generations: Dict[Hashable, int] = {}
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]], ttl: Optional[float] = None) -> CacheEntry:
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.is_fresh():
+                self.hits += 1
+                return entry
+            if time.monotonic() < entry.expires_at + self.stale_ttl:
+                self.stale_hits += 1
+                self._revalidate(key, loader, ttl)
+                return entry
+
+        self.misses += 1
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.is_fresh():
+                return entry
+            return await self._load(key, loader, ttl)
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Cached value regardless of age, without loading"""
+        entry = self._entries.get(key)
+        return entry.value if entry is not None else default
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]], ttl: Optional[float]) -> CacheEntry:
+        generation = self._generations.get(key, 0)
+        entry = CacheEntry(await loader(), self.ttl if ttl is None else ttl)
+        # An admin write landed while loading: the value may predate it, so hand it out but do not keep it
+        if self._generations.get(key, 0) == generation:
+            self._entries[key] = entry
+        return entry
+
+    def _revalidate(self, key: Hashable, loader: Callable[[], Awaitable[Any]], ttl: Optional[float]):
+        task = self._refreshing.get(key)
+        if task is not None and not task.done():
+            return
+
+        async def refresh():
+            try:
+                await self._load(key, loader, ttl)
+            except Exception as e:
+                logger.warning(f"Refreshing cached {key} failed, serving stale data: {str(e)}")
+            finally:
+                self._refreshing.pop(key, None)
+
+        self._refreshing[key] = asyncio.create_task(refresh())
+
+    def invalidate(self, key: Hashable):
+        self._generations[key] = self._generations.get(key, 0) + 1
+        self._entries.pop(key, None)
+
+    def clear(self):
+        for key in list(self._entries):
+            self.invalidate(key)
+
+    def stats(self) -> Dict:
+        return {"size": len(self._entries), "hits": self.hits, "stale_hits": self.stale_hits, "misses": self.misses}
+
+
+def cached_json_response(request: Request, entry: CacheEntry, max_age: int, public: bool = True) -> Response:
+    """Serve a cache entry with ETag/Cache-Control, or 304 when the client already has it"""
+    headers = {
+        "ETag": entry.etag,
+        "Cache-Control": f"{'public' if public else 'private'}, max-age={max_age}, stale-while-revalidate={max_age * 5}",
+    }
+    if entry.etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type=JSONResponse.media_type, headers=headers)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Login-storm benchmark: how much does a burst of bcrypt logins slow down chat traffic?
+
+Runs the app in-process against a scratch SQLite database. Chat-side latency is
+sampled with authenticated GET /chat/sessions requests, first on an idle server
+and then while a burst of logins is in flight:
+
+    python benchmark_auth.py --rounds 12 --logins 100 --login-concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+WORK_DIR = tempfile.mkdtemp(prefix="cyberscholar-bench-")
+
+
+def configure(args):
+    os.environ.setdefault("LLM_PROVIDER", "mock")
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret-key")
+    os.environ.setdefault("ADMIN_PASSWORD", "benchmark")
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(WORK_DIR, 'bench.db')}")
+    os.environ.setdefault("UPLOAD_DIR", os.path.join(WORK_DIR, "uploads"))
+    os.environ.setdefault("CHROMA_PERSIST_DIR", os.path.join(WORK_DIR, "chroma"))
+    os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    os.environ["PASSWORD_HASH_WORKERS"] = str(args.workers)
+    os.environ["PASSWORD_HASH_MAX_QUEUE"] = str(args.logins)
+    sys.path.insert(0, os.path.dirname(__file__))
+
+
+API = "/api/v1"
+PASSWORD = "Bench-Passw0rd!"
+
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    return (
+        f"{len(latencies)} requests | p50 {statistics.median(latencies) * 1000:.1f} ms | "
+        f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f} ms | max {latencies[-1] * 1000:.1f} ms"
+    )
+
+
+async def probe(client, headers, stop: asyncio.Event, concurrency: int):
+    """Authenticated chat reads issued back to back until stop is set"""
+    latencies = []
+
+    async def worker():
+        while not stop.is_set():
+            start = time.perf_counter()
+            response = await client.get(f"{API}/chat/sessions", headers=headers)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return latencies
+
+
+async def login_storm(client, emails, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(email):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post(f"{API}/auth/login", json={"email": email, "password": PASSWORD})
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(emails[i % len(emails)]) for i in range(len(emails))])
+    return latencies, errors, time.perf_counter() - start
+
+
+async def main(args):
+    import httpx
+    from app.main import app
+    from app.database import init_db, async_engine
+    from app.security import password_hasher, pwd_context
+
+    start = time.perf_counter()
+    pwd_context.hash(PASSWORD)
+    print(f"bcrypt rounds={args.rounds}: {(time.perf_counter() - start) * 1000:.0f} ms per hash, {args.workers} hashing threads")
+
+    init_db()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+        emails = []
+        headers = None
+        for i in range(args.users):
+            response = await client.post(f"{API}/auth/register", json={
+                "email": f"login{i}@example.com",
+                "username": f"login_user_{i}",
+                "password": PASSWORD,
+            })
+            response.raise_for_status()
+            emails.append(f"login{i}@example.com")
+            headers = headers or {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        stop = asyncio.Event()
+        task = asyncio.create_task(probe(client, headers, stop, args.probe_concurrency))
+        await asyncio.sleep(args.idle_seconds)
+        stop.set()
+        print(f"chat reads, idle:        {summarize(await task)}")
+
+        stop = asyncio.Event()
+        task = asyncio.create_task(probe(client, headers, stop, args.probe_concurrency))
+        logins, errors, elapsed = await login_storm(client, (emails * args.logins)[:args.logins], args.login_concurrency)
+        stop.set()
+        print(f"chat reads, login storm: {summarize(await task)}")
+        print(f"logins: {summarize(logins)} | {errors} errors | {len(logins) / elapsed:.1f} logins/s")
+        print(f"password hashing: {password_hasher.stats()}")
+
+    password_hasher.shutdown()
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure chat latency during a burst of bcrypt logins")
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--login-concurrency", type=int, default=50)
+    parser.add_argument("--probe-concurrency", type=int, default=4)
+    parser.add_argument("--idle-seconds", type=float, default=2.0)
+    args = parser.parse_args()
+    configure(args)
+    asyncio.run(main(args))
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Offline throughput benchmark for /chat/message and /training/chat.
+
+Runs the FastAPI app in-process against the mock LLM backend and a scratch
+SQLite database, so results are reproducible and need no network access:
+
+    python benchmark_chat.py --requests 200 --concurrency 20 --distinct-prompts 10
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+WORK_DIR = tempfile.mkdtemp(prefix="cyberscholar-bench-")
+os.environ.setdefault("LLM_PROVIDER", "mock")
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key")
+os.environ.setdefault("ADMIN_PASSWORD", "benchmark")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(WORK_DIR, 'bench.db')}")
+os.environ.setdefault("UPLOAD_DIR", os.path.join(WORK_DIR, "uploads"))
+os.environ.setdefault("CHROMA_PERSIST_DIR", os.path.join(WORK_DIR, "chroma"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import httpx
+from app.main import app
+from app.database import init_db, async_engine
+from app.db.write_behind import chat_write_buffer
+
+API = "/api/v1"
+TRAINING_TEXT = " ".join(
+    f"Section {i}: nmap service enumeration, firewall evasion defenses and patch management in an authorized lab."
+    for i in range(200)
+)
+
+
+async def create_user(client: httpx.AsyncClient, index: int = 0) -> dict:
+    response = await client.post(f"{API}/auth/register", json={
+        "email": f"bench{index}@example.com",
+        "username": f"bench_user_{index}",
+        "password": "Bench-Passw0rd!",
+    })
+    response.raise_for_status()
+    token = response.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    upload = await client.post(
+        f"{API}/training/upload",
+        headers=headers,
+        files={"file": ("notes.txt", TRAINING_TEXT.encode("utf-8"), "text/plain")},
+    )
+    upload.raise_for_status()
+    return headers
+
+
+async def run_endpoint(client, users, endpoint, total, concurrency, distinct_prompts):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(i):
+        nonlocal errors
+        message = f"Explain nmap port scanning in a lab, exercise {i % distinct_prompts}"
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post(f"{API}{endpoint}", headers=users[i % len(users)], json={"message": message})
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(total)])
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "endpoint": endpoint,
+        "requests": total,
+        "errors": errors,
+        "throughput_rps": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+async def main(args):
+    init_db()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        users = [await create_user(client, i) for i in range(args.users)]
+        endpoints = ["/chat/message", "/training/chat"] if args.endpoint == "both" else [args.endpoint]
+        for endpoint in endpoints:
+            result = await run_endpoint(client, users, endpoint, args.requests, args.concurrency, args.distinct_prompts)
+            print(
+                f"{result['endpoint']:<16} {result['requests']} requests, {result['errors']} errors | "
+                f"{result['throughput_rps']:.1f} req/s | p50 {result['p50_ms']:.0f} ms | "
+                f"p95 {result['p95_ms']:.0f} ms | p99 {result['p99_ms']:.0f} ms"
+            )
+    if chat_write_buffer.enabled:
+        await chat_write_buffer.stop()
+        print(f"write-behind: {chat_write_buffer.stats()}")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark chat endpoints against the mock LLM backend")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--distinct-prompts", type=int, default=200)
+    parser.add_argument("--users", type=int, default=1)
+    parser.add_argument("--endpoint", choices=["/chat/message", "/training/chat", "both"], default="both")
+    asyncio.run(main(parser.parse_args()))
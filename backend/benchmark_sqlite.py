@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Chat insert throughput on SQLite with and without the performance profile.
+
+Each writer repeatedly adds a user/assistant message pair to its own chat
+session and commits, which is the write pattern of POST /chat/message:
+
+    python benchmark_sqlite.py --writers 10 --messages 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key")
+os.environ.setdefault("ADMIN_PASSWORD", "benchmark")
+sys.path.insert(0, os.path.dirname(__file__))
+
+from sqlalchemy import event, func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from app.config import get_settings
+from app.db.sqlite import SerializedAsyncSession, sqlite_pragmas
+from app.models import Base, ChatMessage, ChatSession, User
+
+settings = get_settings()
+
+
+def make_engine(path: str, tuned: bool):
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{path}",
+        connect_args={"timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000} if tuned else {},
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+    )
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in sqlite_pragmas(tuned):
+            cursor.execute(pragma)
+        cursor.close()
+
+    return engine
+
+
+async def run(tuned: bool, writers: int, messages: int) -> dict:
+    path = os.path.join(tempfile.mkdtemp(prefix="cyberscholar-sqlite-"), "bench.db")
+    engine = make_engine(path, tuned)
+    sessions = async_sessionmaker(
+        engine,
+        class_=SerializedAsyncSession if tuned else AsyncSession,
+        autoflush=False,
+        expire_on_commit=False
+    )
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with sessions() as db:
+        user = User(email="bench@example.com", username="bench", hashed_password="x")
+        db.add(user)
+        await db.commit()
+
+    errors = 0
+
+    async def commit(objects):
+        nonlocal errors
+        async with sessions() as db:
+            db.add_all(objects)
+            try:
+                await db.commit()
+            except OperationalError:
+                await db.rollback()
+                errors += 1
+
+    async def writer():
+        session_id = str(uuid.uuid4())
+        await commit([ChatSession(id=session_id, user_id=user.id)])
+        for i in range(messages):
+            now = datetime.utcnow()
+            await commit([
+                ChatMessage(id=str(uuid.uuid4()), session_id=session_id, role="user", content=f"question {i}", created_at=now),
+                ChatMessage(id=str(uuid.uuid4()), session_id=session_id, role="assistant", content="answer " * 100, created_at=now),
+            ])
+
+    start = time.perf_counter()
+    await asyncio.gather(*[writer() for _ in range(writers)])
+    elapsed = time.perf_counter() - start
+
+    async with sessions() as db:
+        stored = await db.scalar(select(func.count(ChatMessage.id)))
+    await engine.dispose()
+
+    return {"profile": "tuned" if tuned else "default", "stored": stored, "errors": errors, "messages_per_second": stored / elapsed}
+
+
+async def main(args):
+    for tuned in (False, True):
+        result = await run(tuned, args.writers, args.messages)
+        print(
+            f"{result['profile']:<8} {result['stored']} messages stored, {result['errors']} 'database is locked' errors | "
+            f"{result['messages_per_second']:.0f} msg/s"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare SQLite chat insert throughput with and without tuning")
+    parser.add_argument("--writers", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Test script for NDJSON chat import parsing
+"""
+import sys
+import os
+import asyncio
+import json
+sys.path.insert(0, os.path.dirname(__file__))
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("ADMIN_PASSWORD", "test-admin-password")
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+
+from app.db.chat_transfer import ChatImportError, ChatTransfer
+
+
+def upload(*records, chunk_size=7):
+    body = "".join(json.dumps(record) + "\n" for record in records).encode("utf-8")
+
+    async def chunks():
+        for start in range(0, len(body), chunk_size):
+            yield body[start:start + chunk_size]
+    return chunks()
+
+
+def parse(*records):
+    return asyncio.run(ChatTransfer.parse_ndjson("user-1", upload(*records)))
+
+
+def test_parse_assigns_fresh_ids():
+    """Test sessions and messages split across chunks are parsed with new ids and linked"""
+    print("=" * 60)
+    print("TEST 1: Parse Export")
+    print("=" * 60)
+
+    sessions, messages = parse(
+        {"type": "export", "version": 1},
+        {"type": "session", "id": "old-session", "title": "Recon", "created_at": "2025-01-01T10:00:00Z"},
+        {"type": "message", "session_id": "old-session", "role": "user", "content": "hi", "created_at": "2025-01-01T10:00:01Z"},
+        {"type": "message", "session_id": "old-session", "role": "assistant", "content": "hello"},
+    )
+    print(f"Sessions: {len(sessions)}, messages: {len(messages)}")
+
+    assert len(sessions) == 1 and len(messages) == 2
+    assert sessions[0]["id"] != "old-session" and sessions[0]["user_id"] == "user-1"
+    assert all(message["session_id"] == sessions[0]["id"] for message in messages), "Messages not linked to the new session!"
+    print("✓ PASSED\n")
+    return True
+
+
+def test_bad_records_are_import_errors():
+    """Test malformed versions and orphan messages raise ChatImportError with the line number"""
+    print("=" * 60)
+    print("TEST 2: Invalid Records")
+    print("=" * 60)
+
+    cases = [
+        ([{"type": "export", "version": "2"}], 1),
+        ([{"type": "export", "version": 99}], 1),
+        ([{"type": "export", "version": 1}, {"type": "message", "session_id": "x", "role": "user", "content": "hi"}], 2),
+        ([{"type": "session", "id": "s", "created_at": "yesterday"}], 1),
+    ]
+    for records, line_number in cases:
+        try:
+            parse(*records)
+        except ChatImportError as e:
+            print(f"Rejected: {e}")
+            assert e.line_number == line_number, "Wrong line number reported!"
+        else:
+            raise AssertionError(f"{records} was accepted!")
+    print("✓ PASSED\n")
+    return True
+
+
+def main():
+    print("\n" + "=" * 60)
+    print("CHAT TRANSFER TEST SUITE")
+    print("=" * 60 + "\n")
+
+    tests = [
+        ("Parse Export", test_parse_assigns_fresh_ids),
+        ("Invalid Records", test_bad_records_are_import_errors),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            if test_func():
+                passed += 1
+        except Exception as e:
+            print(f"✗ FAILED: {str(e)}\n")
+            failed += 1
+
+    print("=" * 60)
+    print("TEST SUMMARY")
+    print("=" * 60)
+    print(f"Passed: {passed}/{len(tests)}")
+    print(f"Failed: {failed}/{len(tests)}")
+    print("=" * 60 + "\n")
+
+    return failed == 0
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
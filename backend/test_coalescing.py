@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Test script for coalescing identical in-flight LLM calls
+"""
+import sys
+import os
+import asyncio
+sys.path.insert(0, os.path.dirname(__file__))
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("ADMIN_PASSWORD", "test-admin-password")
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+
+from app.ai_engine.coalescing import SingleFlight
+
+
+def test_identical_calls_share_one_upstream_call():
+    """Test concurrent callers with the same key await one call and different keys do not"""
+    print("=" * 60)
+    print("TEST 1: Coalesce Identical Calls")
+    print("=" * 60)
+
+    flight = SingleFlight()
+    calls = []
+
+    async def upstream(prompt):
+        calls.append(prompt)
+        await asyncio.sleep(0.01)
+        return {"text": f"answer to {prompt}"}
+
+    async def scenario():
+        same = SingleFlight.make_key("model", "what is nmap", None, [])
+        other = SingleFlight.make_key("model", "what is burp", None, [])
+        results = await asyncio.gather(
+            *[flight.do(same, lambda: upstream("what is nmap")) for _ in range(5)],
+            flight.do(other, lambda: upstream("what is burp")),
+        )
+        return results, flight.stats()
+
+    results, stats = asyncio.run(scenario())
+    print(f"Upstream calls: {calls}, stats: {stats}")
+
+    assert sorted(calls) == ["what is burp", "what is nmap"], "Identical prompts were not coalesced!"
+    assert all(result == {"text": "answer to what is nmap"} for result in results[:5])
+    assert stats == {"in_flight": 0, "upstream_calls": 2, "coalesced_calls": 4}
+    print("✓ PASSED\n")
+    return True
+
+
+def test_failure_is_shared_then_forgotten():
+    """Test every waiter sees a shared failure and the next call with the key goes upstream again"""
+    print("=" * 60)
+    print("TEST 2: Shared Failure")
+    print("=" * 60)
+
+    flight = SingleFlight()
+    attempts = []
+
+    async def flaky():
+        attempts.append(len(attempts))
+        await asyncio.sleep(0.01)
+        if len(attempts) == 1:
+            raise RuntimeError("upstream unavailable")
+        return "ok"
+
+    async def scenario():
+        key = SingleFlight.make_key("model", "prompt")
+        first = await asyncio.gather(*[flight.do(key, flaky) for _ in range(3)], return_exceptions=True)
+        second = await flight.do(key, flaky)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    print(f"First round: {first}, retry: {second}")
+
+    assert all(isinstance(result, RuntimeError) for result in first), "A waiter missed the failure!"
+    assert second == "ok" and len(attempts) == 2, "Failed call was not forgotten!"
+    print("✓ PASSED\n")
+    return True
+
+
+def test_cancelled_caller_does_not_cancel_shared_call():
+    """Test a caller going away does not cancel the call other waiters are sharing"""
+    print("=" * 60)
+    print("TEST 3: Cancelled Caller")
+    print("=" * 60)
+
+    flight = SingleFlight()
+
+    async def upstream():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def scenario():
+        key = SingleFlight.make_key("model", "prompt")
+        leaving = asyncio.ensure_future(flight.do(key, upstream))
+        staying = asyncio.ensure_future(flight.do(key, upstream))
+        await asyncio.sleep(0)
+        leaving.cancel()
+        return await staying, leaving.cancelled()
+
+    result, cancelled = asyncio.run(scenario())
+    print(f"Remaining caller got: {result}")
+
+    assert cancelled
+    assert result == "done", "Shared call was cancelled with the first caller!"
+    print("✓ PASSED\n")
+    return True
+
+
+def main():
+    print("\n" + "=" * 60)
+    print("COALESCING TEST SUITE")
+    print("=" * 60 + "\n")
+
+    tests = [
+        ("Coalesce Identical Calls", test_identical_calls_share_one_upstream_call),
+        ("Shared Failure", test_failure_is_shared_then_forgotten),
+        ("Cancelled Caller", test_cancelled_caller_does_not_cancel_shared_call),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            if test_func():
+                passed += 1
+        except Exception as e:
+            print(f"✗ FAILED: {str(e)}\n")
+            failed += 1
+
+    print("=" * 60)
+    print("TEST SUMMARY")
+    print("=" * 60)
+    print(f"Passed: {passed}/{len(tests)}")
+    print(f"Failed: {failed}/{len(tests)}")
+    print("=" * 60 + "\n")
+
+    return failed == 0
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
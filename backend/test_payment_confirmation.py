@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Test script for transactional payment confirmation and its retry queue against the in-memory Supabase stand-in
+"""
+import sys
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+sys.path.insert(0, os.path.dirname(__file__))
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("ADMIN_PASSWORD", "test-admin-password")
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+
+import httpx
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+from app.core.mock_supabase import MockSupabaseClient, AsyncMockSupabaseClient
+from app.db import queries
+from app.db.queries import PaymentQueries
+from app.db.payment_confirmations import PaymentConfirmationQueue
+from app.models import Base, PaymentConfirmationJob
+
+
+def fresh_client(payment_status="pending"):
+    client = MockSupabaseClient()
+    client.table("profiles").insert({"id": "user-1", "tokens_total": 10, "tokens_used": 4}).execute()
+    client.table("subscription_plans").insert({"id": "plan-1", "slug": "pro", "tokens_per_month": 500}).execute()
+    client.table("payment_requests").insert({
+        "id": "payment-1", "user_id": "user-1", "plan_id": "plan-1", "plan_name": "Pro",
+        "billing_cycle": "monthly", "amount": 20, "status": payment_status,
+    }).execute()
+    queries.supabase = AsyncMockSupabaseClient(client)
+    return client
+
+
+def rows(client, table):
+    return client.table(table).select("*").execute().data
+
+
+async def local_engine():
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    return engine
+
+
+def test_confirm_applies_everything():
+    """Test one call confirms the payment, creates the subscription, upgrades the profile and sets the allowance"""
+    print("=" * 60)
+    print("TEST 1: Confirmation")
+    print("=" * 60)
+
+    client = fresh_client()
+    result = asyncio.run(PaymentQueries.confirm_payment("payment-1", "Checked bank statement"))
+    print(f"Result: {result['status']}, subscription {result['subscription']['id']}")
+
+    profile = rows(client, "profiles")[0]
+    assert result["status"] == "confirmed", "Payment was not confirmed!"
+    assert result["payment"]["status"] == "confirmed" and result["payment"]["admin_notes"] == "Checked bank statement"
+    assert result["subscription"]["payment_request_id"] == "payment-1", "Subscription is not linked to the payment!"
+    assert profile["subscription_tier"] == "pro" and profile["subscription_id"] == result["subscription"]["id"]
+    assert profile["tokens_total"] == 500, "Allowance was not set!"
+    print("✓ PASSED\n")
+    return True
+
+
+def test_repeat_is_idempotent():
+    """Test confirming twice returns the first result without a second subscription or allowance"""
+    print("=" * 60)
+    print("TEST 2: Repeated Confirmation")
+    print("=" * 60)
+
+    client = fresh_client()
+    first = asyncio.run(PaymentQueries.confirm_payment("payment-1"))
+    second = asyncio.run(PaymentQueries.confirm_payment("payment-1"))
+    print(f"Second call: {second['status']}")
+
+    allowances = [t for t in rows(client, "token_transactions") if t["transaction_type"] == "allowance_reset"]
+    assert second["status"] == "already_confirmed", "Repeat was not recognised!"
+    assert second["subscription"]["id"] == first["subscription"]["id"], "Repeat returned a different subscription!"
+    assert len(rows(client, "subscriptions")) == 1, "Repeat created another subscription!"
+    assert len(allowances) == 1, "Repeat reset the allowance again!"
+    print("✓ PASSED\n")
+    return True
+
+
+def test_concurrent_confirms_create_one_subscription():
+    """Test racing confirmations of one payment create exactly one subscription"""
+    print("=" * 60)
+    print("TEST 3: Concurrent Confirmations")
+    print("=" * 60)
+
+    client = fresh_client()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        outcomes = list(pool.map(lambda _: asyncio.run(PaymentQueries.confirm_payment("payment-1"))["status"], range(8)))
+    print(f"Outcomes: {outcomes}")
+
+    assert outcomes.count("confirmed") == 1, "More than one call confirmed the payment!"
+    assert len(rows(client, "subscriptions")) == 1, "Concurrent confirmations created several subscriptions!"
+    print("✓ PASSED\n")
+    return True
+
+
+def test_rejected_and_unknown_payments():
+    """Test rejected payments are refused and unknown payments report not_found, changing nothing"""
+    print("=" * 60)
+    print("TEST 4: Refused Confirmations")
+    print("=" * 60)
+
+    client = fresh_client(payment_status="rejected")
+    refused = asyncio.run(PaymentQueries.confirm_payment("payment-1"))
+    missing = asyncio.run(PaymentQueries.confirm_payment("payment-404"))
+    print(f"Rejected: {refused['status']}, unknown: {missing['status']}")
+
+    assert refused["status"] == "refused" and missing["status"] == "not_found"
+    assert not rows(client, "subscriptions"), "A refused payment created a subscription!"
+    assert rows(client, "profiles")[0]["tokens_total"] == 10, "A refused payment changed the allowance!"
+    print("✓ PASSED\n")
+    return True
+
+
+def test_queue_retries_until_delivered():
+    """Test a queued confirmation backs off on transport errors, then is delivered exactly once"""
+    print("=" * 60)
+    print("TEST 5: Retry Queue")
+    print("=" * 60)
+
+    client = fresh_client()
+    mock = queries.supabase
+
+    class Unreachable:
+        def rpc(self, fn_name, params=None):
+            raise httpx.ConnectError("Supabase unreachable")
+
+    async def scenario():
+        engine = await local_engine()
+        queue = PaymentConfirmationQueue(session_factory=async_sessionmaker(engine, expire_on_commit=False))
+        queries.supabase = Unreachable()
+        job = await queue.enqueue("payment-1", "Queued while offline")
+        failed = await queue.run_once()
+        async with queue.session_factory() as db:
+            job = await db.get(PaymentConfirmationJob, job.id)
+            assert job.attempts == 1 and job.next_attempt_at > job.created_at, "Retry was not backed off!"
+            job.next_attempt_at = job.created_at
+            await db.commit()
+        queries.supabase = mock
+        delivered = await queue.run_once()
+        again = await queue.run_once()
+        pending = await queue.pending_count()
+        await engine.dispose()
+        return failed, delivered, again, pending
+
+    failed, delivered, again, pending = asyncio.run(scenario())
+    print(f"Offline run: {failed}, online run: {delivered}, next run: {again}")
+
+    assert failed == {"done": 0, "retry": 1, "failed": 0}, "Transport error was not retried!"
+    assert delivered["done"] == 1 and again == {"done": 0, "retry": 0, "failed": 0}, "Job was not delivered once!"
+    assert pending == 0, "Delivered job is still pending!"
+    assert rows(client, "payment_requests")[0]["admin_notes"] == "Queued while offline"
+    assert len(rows(client, "subscriptions")) == 1, "Retry created more than one subscription!"
+    print("✓ PASSED\n")
+    return True
+
+
+def main():
+    print("\n" + "=" * 60)
+    print("PAYMENT CONFIRMATION TEST SUITE")
+    print("=" * 60 + "\n")
+
+    tests = [
+        ("Confirmation", test_confirm_applies_everything),
+        ("Repeated Confirmation", test_repeat_is_idempotent),
+        ("Concurrent Confirmations", test_concurrent_confirms_create_one_subscription),
+        ("Refused Confirmations", test_rejected_and_unknown_payments),
+        ("Retry Queue", test_queue_retries_until_delivered),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            if test_func():
+                passed += 1
+        except Exception as e:
+            print(f"✗ FAILED: {str(e)}\n")
+            failed += 1
+
+    print("=" * 60)
+    print("TEST SUMMARY")
+    print("=" * 60)
+    print(f"Passed: {passed}/{len(tests)}")
+    print(f"Failed: {failed}/{len(tests)}")
+    print("=" * 60 + "\n")
+
+    return failed == 0
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Test script to validate prompt budgeting and token accounting
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ.setdefault("ADMIN_PASSWORD", "test")
+
+from app.ai_engine.prompt_builder import PromptBuilder
+from app.db.queries import TokenQueries
+
+
+def test_estimate_tokens():
+    """Test token estimation"""
+    assert PromptBuilder.estimate_tokens("") == 0
+    assert PromptBuilder.estimate_tokens("abcd") == 1
+    assert PromptBuilder.estimate_tokens("abcde") == 2
+    return True
+
+
+def test_fit_context_ranks_and_respects_budget():
+    """Test that the best-scoring chunks are kept within the budget"""
+    docs = [
+        {"content": "low " * 100, "distance": 0.9},
+        {"content": "high " * 100, "distance": 0.1},
+        {"content": "mid " * 100, "distance": 0.5},
+    ]
+    selected = PromptBuilder.fit_context(docs, token_budget=240)
+
+    assert selected[0]["content"].startswith("high")
+    assert sum(d["tokens"] for d in selected) <= 240
+    assert all(not d["content"].startswith("low") for d in selected)
+    return True
+
+
+def test_dedupe_overlapping_chunks():
+    """Test that duplicate chunks are dropped and sliding-window overlap is stripped"""
+    words = [f"w{i}" for i in range(120)]
+    first = " ".join(words[:60])
+    second = " ".join(words[50:120])
+    docs = [
+        {"content": first, "distance": 0.1},
+        {"content": first, "distance": 0.2},
+        {"content": second, "distance": 0.3},
+    ]
+    kept = PromptBuilder.dedupe_chunks(docs)
+
+    assert len(kept) == 2
+    assert kept[1]["content"].split()[0] == "w60"
+    return True
+
+
+def test_trim_history_keeps_recent_turns():
+    """Test that history is trimmed from the oldest end and starts with a user turn"""
+    history = []
+    for i in range(10):
+        history.append({"role": "user", "parts": [{"text": f"question {i} " * 10}]})
+        history.append({"role": "model", "parts": [{"text": f"answer {i} " * 10}]})
+    trimmed = PromptBuilder.trim_history(history, token_budget=100)
+
+    assert trimmed
+    assert trimmed[-1] == history[-1]
+    assert trimmed[0]["role"] == "user"
+    assert PromptBuilder.estimate_history_tokens(trimmed) <= 100
+    return True
+
+
+def test_usage_cost():
+    """Test per-message and per-character billing"""
+    config = {
+        "cost_per_message": 1.0,
+        "cost_per_character_response": 0.01,
+        "enabled_per_message": True,
+        "enabled_per_character": True,
+    }
+    assert TokenQueries.calculate_usage_cost(config, "x" * 250) == 4
+    assert TokenQueries.calculate_usage_cost(TokenQueries.DEFAULT_TOKEN_CONFIG, "x" * 250) == 1
+    return True
+
+
+def main():
+    """Run all tests"""
+    tests = [
+        test_estimate_tokens,
+        test_fit_context_ranks_and_respects_budget,
+        test_dedupe_overlapping_chunks,
+        test_trim_history_keeps_recent_turns,
+        test_usage_cost,
+    ]
+
+    failed = 0
+    for test_func in tests:
+        try:
+            test_func()
+            print(f"✓ {test_func.__name__}")
+        except Exception as e:
+            print(f"✗ {test_func.__name__}: {str(e)}")
+            failed += 1
+
+    print(f"Passed: {len(tests) - failed}/{len(tests)}")
+    return failed == 0
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Test script for the startup query plan check
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("ADMIN_PASSWORD", "test-admin-password")
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+
+from sqlalchemy import create_engine
+from app.db.query_plans import check_query_plans, full_scans
+from app.models import Base, ChatSession
+
+
+def test_sqlite_plan_lines():
+    """Test only bare table scans are reported, whatever the table or alias name"""
+    print("=" * 60)
+    print("TEST 1: SQLite Plan Lines")
+    print("=" * 60)
+
+    cases = [
+        ("SCAN chat_sessions", ["chat_sessions"]),
+        ("SCAN m", ["m"]),
+        ("SCAN TABLE chat_sessions", ["chat_sessions"]),
+        ("SCAN chat_sessions USING INDEX ix_chat_sessions_user_updated", []),
+        ("SCAN m USING COVERING INDEX ix_chat_messages_session_created", []),
+        ("SCAN TABLE chat_sessions USING INDEX ix_chat_sessions_user_updated", []),
+        ("SEARCH chat_sessions USING INDEX ix_chat_sessions_user_updated (user_id=?)", []),
+        ("SCAN CONSTANT ROW", []),
+        ("USE TEMP B-TREE FOR ORDER BY", []),
+    ]
+    for line, expected in cases:
+        reported = full_scans("sqlite", [line])
+        print(f"{line!r}: {reported}")
+        assert reported == expected, f"{line!r} reported as {reported}!"
+    print("✓ PASSED\n")
+    return True
+
+
+def test_missing_index_is_reported():
+    """Test the check passes on the full schema and flags the session list once its index is gone"""
+    print("=" * 60)
+    print("TEST 2: Missing Index Reported")
+    print("=" * 60)
+
+    def check(drop_index=None):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        if drop_index:
+            with engine.begin() as conn:
+                conn.exec_driver_sql(f"DROP INDEX {drop_index}")
+        try:
+            return check_query_plans(engine)
+        finally:
+            engine.dispose()
+
+    indexed = check()
+    dropped = check("ix_chat_sessions_user_updated")
+    print(f"Problems with every index: {indexed}, without the session index: {dropped}")
+
+    assert indexed == {}, "Indexed hot queries were reported as full scans!"
+    assert dropped.get("chat sessions by user") == [ChatSession.__tablename__]
+    print("✓ PASSED\n")
+    return True
+
+
+def main():
+    print("\n" + "=" * 60)
+    print("QUERY PLAN CHECK TEST SUITE")
+    print("=" * 60 + "\n")
+
+    tests = [
+        ("SQLite Plan Lines", test_sqlite_plan_lines),
+        ("Missing Index Reported", test_missing_index_is_reported),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            if test_func():
+                passed += 1
+        except Exception as e:
+            print(f"✗ FAILED: {str(e)}\n")
+            failed += 1
+
+    print("=" * 60)
+    print("TEST SUMMARY")
+    print("=" * 60)
+    print(f"Passed: {passed}/{len(tests)}")
+    print(f"Failed: {failed}/{len(tests)}")
+    print("=" * 60 + "\n")
+
+    return failed == 0
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Test script for the catalog read-through cache when Supabase fails
+"""
+import sys
+import os
+import asyncio
+sys.path.insert(0, os.path.dirname(__file__))
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("ADMIN_PASSWORD", "test-admin-password")
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+
+import httpx
+from app.core.mock_supabase import MockSupabaseClient, AsyncMockSupabaseClient
+from app.db import queries
+from app.db.queries import SubscriptionQueries, TokenQueries
+from app.utils.read_through_cache import ReadThroughCache
+
+
+class Unreachable:
+    def table(self, table_name):
+        raise httpx.ConnectError("Supabase unreachable")
+
+    def rpc(self, fn_name, params=None):
+        raise httpx.ConnectError("Supabase unreachable")
+
+
+CATALOG_CACHE = queries.catalog_cache
+
+
+def fresh_catalog():
+    client = MockSupabaseClient()
+    client.table("subscription_plans").insert({"slug": "pro", "is_active": True, "sort_order": 1}).execute()
+    queries.supabase = AsyncMockSupabaseClient(client)
+    # Every entry is stale at once but may be served stale for a minute
+    queries.catalog_cache = ReadThroughCache(ttl=0, stale_ttl=60)
+    return client
+
+
+def test_outage_serves_stale_plans():
+    """Test a failed reload keeps serving the last good plans instead of caching an empty catalog"""
+    print("=" * 60)
+    print("TEST 1: Stale Plans During Outage")
+    print("=" * 60)
+
+    fresh_catalog()
+
+    async def scenario():
+        first = await SubscriptionQueries.get_cached_plans()
+        queries.supabase = Unreachable()
+        second = await SubscriptionQueries.get_cached_plans()
+        await asyncio.sleep(0.01)  # let the background refresh fail
+        third = await SubscriptionQueries.get_cached_plans()
+        return first, second, third
+
+    try:
+        first, second, third = asyncio.run(scenario())
+        stale_hits = queries.catalog_cache.stale_hits
+    finally:
+        queries.catalog_cache = CATALOG_CACHE
+    print(f"Plans before: {len(first.value)}, during outage: {len(second.value)}, {len(third.value)}")
+
+    assert [p["slug"] for p in third.value] == ["pro"], "Outage replaced the cached plans!"
+    assert third.etag == first.etag, "Stale entry was replaced!"
+    assert stale_hits == 2
+    print("✓ PASSED\n")
+    return True
+
+
+def test_cold_outage_is_not_cached():
+    """Test a failed first load raises and leaves nothing cached, while the uncached helpers keep their defaults"""
+    print("=" * 60)
+    print("TEST 2: Cold Cache Outage")
+    print("=" * 60)
+
+    fresh_catalog()
+    queries.supabase = Unreachable()
+
+    try:
+        try:
+            asyncio.run(TokenQueries.get_cached_token_config())
+        except httpx.ConnectError as e:
+            print(f"Load failed: {e}")
+        else:
+            raise AssertionError("Outage was cached as a token config!")
+        cached = queries.catalog_cache.peek("token_config")
+    finally:
+        queries.catalog_cache = CATALOG_CACHE
+
+    assert cached is None, "Defaults were cached!"
+    assert asyncio.run(TokenQueries.get_token_config()) == TokenQueries.DEFAULT_TOKEN_CONFIG
+    assert asyncio.run(SubscriptionQueries.get_plans()) == []
+    print("✓ PASSED\n")
+    return True
+
+
+def main():
+    print("\n" + "=" * 60)
+    print("READ-THROUGH CACHE TEST SUITE")
+    print("=" * 60 + "\n")
+
+    tests = [
+        ("Stale Plans During Outage", test_outage_serves_stale_plans),
+        ("Cold Cache Outage", test_cold_outage_is_not_cached),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            if test_func():
+                passed += 1
+        except Exception as e:
+            print(f"✗ FAILED: {str(e)}\n")
+            failed += 1
+
+    print("=" * 60)
+    print("TEST SUMMARY")
+    print("=" * 60)
+    print(f"Passed: {passed}/{len(tests)}")
+    print(f"Failed: {failed}/{len(tests)}")
+    print("=" * 60 + "\n")
+
+    return failed == 0
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Test script for LLM call retries, circuit breaking and hedging
+"""
+import sys
+import os
+import asyncio
+import threading
+import time
+sys.path.insert(0, os.path.dirname(__file__))
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("ADMIN_PASSWORD", "test-admin-password")
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+
+from app.ai_engine import resilience
+from app.ai_engine.errors import LLMError
+from app.ai_engine.resilience import CircuitBreaker, ResilientCaller, RetryBudget
+
+
+def fast_caller(failure_threshold=2, reset_seconds=0.05):
+    caller = ResilientCaller()
+    caller.breaker = CircuitBreaker(failure_threshold, reset_seconds)
+    return caller
+
+
+def upstream_down():
+    raise LLMError("upstream unavailable", status_code=503)
+
+
+def open_circuit(caller):
+    async def trip():
+        for _ in range(caller.breaker.failure_threshold):
+            try:
+                await caller.call(upstream_down)
+            except LLMError:
+                pass
+    return trip()
+
+
+def with_settings(**overrides):
+    """Apply setting overrides and return a function that restores them"""
+    saved = {name: getattr(resilience.settings, name) for name in overrides}
+    for name, value in overrides.items():
+        setattr(resilience.settings, name, value)
+    return lambda: [setattr(resilience.settings, name, value) for name, value in saved.items()]
+
+
+def test_breaker_opens_and_recovers():
+    """Test the circuit opens after consecutive failures, rejects calls, then closes after a successful probe"""
+    print("=" * 60)
+    print("TEST 1: Circuit Opens And Recovers")
+    print("=" * 60)
+
+    restore = with_settings(LLM_MAX_RETRIES=0)
+    caller = fast_caller()
+
+    async def scenario():
+        await open_circuit(caller)
+        opened = caller.breaker.state
+        try:
+            await caller.call(lambda: "ok")
+        except LLMError as e:
+            rejected = e.status_code
+        await asyncio.sleep(0.06)
+        result = await caller.call(lambda: "ok")
+        return opened, rejected, result
+
+    try:
+        opened, rejected, result = asyncio.run(scenario())
+    finally:
+        restore()
+    print(f"State after failures: {opened}, rejected with: {rejected}, probe result: {result}")
+
+    assert opened == CircuitBreaker.OPEN
+    assert rejected == 503, "Open circuit let a call through!"
+    assert result == "ok" and caller.breaker.state == CircuitBreaker.CLOSED
+    print("✓ PASSED\n")
+    return True
+
+
+def test_cancelled_probe_frees_the_circuit():
+    """Test a half-open probe cancelled mid-call lets the next request probe instead of wedging the circuit open"""
+    print("=" * 60)
+    print("TEST 2: Cancelled Probe")
+    print("=" * 60)
+
+    restore = with_settings(LLM_MAX_RETRIES=0)
+    caller = fast_caller()
+
+    async def scenario():
+        await open_circuit(caller)
+        await asyncio.sleep(0.06)
+        probe = asyncio.ensure_future(caller.call(lambda: time.sleep(0.2)))
+        await asyncio.sleep(0.02)
+        probe.cancel()
+        try:
+            await probe
+        except asyncio.CancelledError:
+            pass
+        return await caller.call(lambda: "ok")
+
+    try:
+        result = asyncio.run(scenario())
+    finally:
+        restore()
+    print(f"Next call after the cancelled probe: {result}, state: {caller.breaker.state}")
+
+    assert result == "ok", "Cancelled probe left the circuit refusing every request!"
+    assert caller.breaker.state == CircuitBreaker.CLOSED
+    print("✓ PASSED\n")
+    return True
+
+
+def test_non_retryable_probe_failure_keeps_circuit_open():
+    """Test an unmapped error on the half-open probe does not close the circuit but frees the probe slot"""
+    print("=" * 60)
+    print("TEST 3: Non-Retryable Probe Failure")
+    print("=" * 60)
+
+    restore = with_settings(LLM_MAX_RETRIES=0)
+    caller = fast_caller()
+
+    def broken():
+        raise ValueError("unexpected SDK response")
+
+    async def scenario():
+        await open_circuit(caller)
+        await asyncio.sleep(0.06)
+        try:
+            await caller.call(broken)
+        except LLMError as e:
+            status = e.status_code
+        state = caller.breaker.state
+        result = await caller.call(lambda: "ok")
+        return status, state, result
+
+    try:
+        status, state, result = asyncio.run(scenario())
+    finally:
+        restore()
+    print(f"Probe failed with {status}, state after it: {state}, next probe: {result}")
+
+    assert status == 502
+    assert state == CircuitBreaker.HALF_OPEN, "Non-retryable error closed the circuit!"
+    assert result == "ok" and caller.breaker.state == CircuitBreaker.CLOSED
+    print("✓ PASSED\n")
+    return True
+
+
+def test_retry_budget_caps_retries():
+    """Test retries stop once they exceed the budget's share of recent calls"""
+    print("=" * 60)
+    print("TEST 4: Retry Budget")
+    print("=" * 60)
+
+    budget = RetryBudget(ratio=0.2, minimum=2)
+    for _ in range(20):
+        budget.record_call()
+    granted = sum(budget.try_spend() for _ in range(10))
+    print(f"Retries granted for 20 calls at 20%: {granted}")
+
+    assert granted == 4, "Retry budget did not cap retries!"
+
+    restore = with_settings(LLM_MAX_RETRIES=5, LLM_RETRY_BASE_DELAY_MS=1, LLM_RETRY_MAX_DELAY_MS=1)
+    caller = fast_caller(failure_threshold=100)
+    caller.budget = RetryBudget(ratio=0.0, minimum=1)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        raise LLMError("upstream unavailable", status_code=503)
+
+    try:
+        try:
+            asyncio.run(caller.call(flaky))
+        except LLMError:
+            pass
+    finally:
+        restore()
+    print(f"Attempts with a one-retry budget: {len(attempts)}")
+
+    assert len(attempts) == 2, "Retries ignored the budget!"
+    print("✓ PASSED\n")
+    return True
+
+
+def test_hedge_wins_over_slow_primary():
+    """Test a hedged request is sent after the latency percentile and its answer is used when it finishes first"""
+    print("=" * 60)
+    print("TEST 5: Hedged Request")
+    print("=" * 60)
+
+    restore = with_settings(LLM_HEDGE_ENABLED=True, LLM_HEDGE_MIN_SAMPLES=1, LLM_HEDGE_PERCENTILE=0.5)
+    caller = fast_caller()
+    caller.metrics.record("success", 0.02)
+    lock = threading.Lock()
+    calls = []
+
+    def generate():
+        with lock:
+            calls.append(1)
+            first = len(calls) == 1
+        time.sleep(0.5 if first else 0.01)
+        return "primary" if first else "hedge"
+
+    async def scenario():
+        # Timed inside the loop: asyncio.run also waits for the abandoned primary's thread
+        start = time.perf_counter()
+        result = await caller.call(generate)
+        return result, time.perf_counter() - start
+
+    try:
+        result, elapsed = asyncio.run(scenario())
+    finally:
+        restore()
+    print(f"Result: {result} in {elapsed:.2f}s, hedges: {caller.metrics.hedges}, wins: {caller.metrics.hedge_wins}")
+
+    assert result == "hedge" and elapsed < 0.4, "Hedge did not cut the tail latency!"
+    assert caller.metrics.hedges == 1 and caller.metrics.hedge_wins == 1
+    print("✓ PASSED\n")
+    return True
+
+
+def main():
+    print("\n" + "=" * 60)
+    print("LLM RESILIENCE TEST SUITE")
+    print("=" * 60 + "\n")
+
+    tests = [
+        ("Circuit Opens And Recovers", test_breaker_opens_and_recovers),
+        ("Cancelled Probe", test_cancelled_probe_frees_the_circuit),
+        ("Non-Retryable Probe Failure", test_non_retryable_probe_failure_keeps_circuit_open),
+        ("Retry Budget", test_retry_budget_caps_retries),
+        ("Hedged Request", test_hedge_wins_over_slow_primary),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            if test_func():
+                passed += 1
+        except Exception as e:
+            print(f"✗ FAILED: {str(e)}\n")
+            failed += 1
+
+    print("=" * 60)
+    print("TEST SUMMARY")
+    print("=" * 60)
+    print(f"Passed: {passed}/{len(tests)}")
+    print(f"Failed: {failed}/{len(tests)}")
+    print("=" * 60 + "\n")
+
+    return failed == 0
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Test script for serialised SQLite writes with mixed Core and ORM writers
+"""
+import sys
+import os
+import asyncio
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(__file__))
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("ADMIN_PASSWORD", "test-admin-password")
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+
+from sqlalchemy import event, func, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.db.sqlite import SerializedAsyncSession
+from app.models import Base, ChatSession, User
+
+
+async def make_sessions():
+    path = os.path.join(tempfile.mkdtemp(prefix="cyberscholar-sqlite-"), "writes.db")
+    # A short busy timeout so a lock inversion fails fast instead of after SQLITE_BUSY_TIMEOUT_MS
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}", connect_args={"timeout": 0.5})
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        dbapi_connection.execute("PRAGMA journal_mode=WAL")
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    sessions = async_sessionmaker(engine, class_=SerializedAsyncSession, autoflush=False, expire_on_commit=False)
+    async with sessions() as db:
+        db.add(User(id="user-1", email="writes@example.com", username="writes", hashed_password="x"))
+        await db.commit()
+    return engine, sessions
+
+
+def test_core_and_orm_writers_do_not_collide():
+    """Test execute(insert) writers and ORM add/commit writers queue instead of hitting 'database is locked'"""
+    print("=" * 60)
+    print("TEST 1: Mixed Core and ORM Writers")
+    print("=" * 60)
+
+    async def scenario():
+        engine, sessions = await make_sessions()
+
+        async def core_writer(i):
+            async with sessions() as db:
+                await db.execute(insert(ChatSession).values(id=f"core-{i}", user_id="user-1", title="core"))
+                await asyncio.sleep(0.05)
+                await db.commit()
+
+        async def orm_writer(i):
+            async with sessions() as db:
+                db.add(ChatSession(id=f"orm-{i}", user_id="user-1", title="orm"))
+                await db.commit()
+
+        try:
+            start = time.perf_counter()
+            await asyncio.wait_for(asyncio.gather(*[writer(i) for i in range(10) for writer in (core_writer, orm_writer)]), timeout=30)
+            elapsed = time.perf_counter() - start
+            async with sessions() as db:
+                count = (await db.execute(select(func.count()).select_from(ChatSession))).scalar_one()
+            return count, elapsed
+        finally:
+            await engine.dispose()
+
+    count, elapsed = asyncio.run(scenario())
+    print(f"Sessions written: {count} in {elapsed:.2f}s")
+
+    assert count == 20, "A writer failed!"
+    print("✓ PASSED\n")
+    return True
+
+
+def test_rollback_releases_the_lock():
+    """Test a writer that rolls back does not block the next writer"""
+    print("=" * 60)
+    print("TEST 2: Rollback Releases Lock")
+    print("=" * 60)
+
+    async def scenario():
+        engine, sessions = await make_sessions()
+        try:
+            async with sessions() as db:
+                await db.execute(insert(ChatSession).values(id="rolled-back", user_id="user-1"))
+                await db.rollback()
+            async with sessions() as db:
+                db.add(ChatSession(id="kept", user_id="user-1"))
+                await asyncio.wait_for(db.commit(), timeout=2)
+            async with sessions() as db:
+                return (await db.execute(select(ChatSession.id))).scalars().all()
+        finally:
+            await engine.dispose()
+
+    ids = asyncio.run(scenario())
+    print(f"Sessions: {ids}")
+
+    assert ids == ["kept"], "Rolled back write was kept or the next write was blocked!"
+    print("✓ PASSED\n")
+    return True
+
+
+def main():
+    print("\n" + "=" * 60)
+    print("SQLITE WRITE SERIALISATION TEST SUITE")
+    print("=" * 60 + "\n")
+
+    tests = [
+        ("Mixed Core and ORM Writers", test_core_and_orm_writers_do_not_collide),
+        ("Rollback Releases Lock", test_rollback_releases_the_lock),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            if test_func():
+                passed += 1
+        except Exception as e:
+            print(f"✗ FAILED: {str(e)}\n")
+            failed += 1
+
+    print("=" * 60)
+    print("TEST SUMMARY")
+    print("=" * 60)
+    print(f"Passed: {passed}/{len(tests)}")
+    print(f"Failed: {failed}/{len(tests)}")
+    print("=" * 60 + "\n")
+
+    return failed == 0
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Test script for the async Supabase client's error handling and pool lifecycle
+"""
+import sys
+import os
+import asyncio
+sys.path.insert(0, os.path.dirname(__file__))
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("ADMIN_PASSWORD", "test-admin-password")
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+
+import httpx
+from app.core.supabase_async import AsyncSupabaseClient, SupabaseRequestError, is_transient_error
+
+
+def gateway(handler):
+    """A client whose requests are answered by handler instead of the network"""
+    client = AsyncSupabaseClient("https://example.supabase.co", "service-key")
+
+    async def ensure_client():
+        if client._client is None:
+            client._client = httpx.AsyncClient(base_url=client.base_url, transport=httpx.MockTransport(handler))
+            client._semaphore = asyncio.Semaphore(4)
+        return client._client
+
+    client._ensure_client = ensure_client
+    return client
+
+
+def test_gateway_html_errors_are_transient():
+    """Test an HTML 502/503 from a gateway raises a transient SupabaseRequestError instead of a JSON decode error"""
+    print("=" * 60)
+    print("TEST 1: Gateway Error Pages")
+    print("=" * 60)
+
+    def handler(request):
+        if request.url.path.endswith("/down"):
+            return httpx.Response(503, text="<html><body>503 Service Temporarily Unavailable</body></html>")
+        if request.url.path.endswith("/bad"):
+            return httpx.Response(400, json={"message": "column does not exist"})
+        return httpx.Response(200, json=[{"id": 1}])
+
+    client = gateway(handler)
+
+    async def scenario():
+        errors = []
+        for table in ("down", "bad"):
+            try:
+                await client.table(table).select("*").execute()
+            except Exception as e:
+                errors.append(e)
+        ok = await client.table("plans").select("*").execute()
+        await client.aclose()
+        return errors, ok.data
+
+    errors, data = asyncio.run(scenario())
+    for error in errors:
+        print(f"{type(error).__name__}: {error}")
+
+    down, bad = errors
+    assert isinstance(down, SupabaseRequestError) and down.status_code == 503, "Gateway page was not a SupabaseRequestError!"
+    assert is_transient_error(down), "503 from the gateway is not retried!"
+    assert isinstance(bad, SupabaseRequestError) and not is_transient_error(bad)
+    assert "column does not exist" in str(bad)
+    assert data == [{"id": 1}]
+    assert client.errors == 2
+    print("✓ PASSED\n")
+    return True
+
+
+def test_stale_pool_is_closed():
+    """Test the pool opened on an earlier event loop is closed when a new loop replaces it"""
+    print("=" * 60)
+    print("TEST 2: Stale Pool Closed")
+    print("=" * 60)
+
+    client = AsyncSupabaseClient("https://example.supabase.co", "service-key")
+
+    async def open_pool():
+        return await client._ensure_client()
+
+    first = asyncio.run(open_pool())
+    second = asyncio.run(open_pool())
+    print(f"First pool closed: {first.is_closed}, second pool closed: {second.is_closed}")
+
+    assert first is not second
+    assert first.is_closed, "Pool from the old loop was leaked!"
+    assert not second.is_closed
+    asyncio.run(client.aclose())
+    print("✓ PASSED\n")
+    return True
+
+
+def main():
+    print("\n" + "=" * 60)
+    print("ASYNC SUPABASE CLIENT TEST SUITE")
+    print("=" * 60 + "\n")
+
+    tests = [
+        ("Gateway Error Pages", test_gateway_html_errors_are_transient),
+        ("Stale Pool Closed", test_stale_pool_is_closed),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            if test_func():
+                passed += 1
+        except Exception as e:
+            print(f"✗ FAILED: {str(e)}\n")
+            failed += 1
+
+    print("=" * 60)
+    print("TEST SUMMARY")
+    print("=" * 60)
+    print(f"Passed: {passed}/{len(tests)}")
+    print(f"Failed: {failed}/{len(tests)}")
+    print("=" * 60 + "\n")
+
+    return failed == 0
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
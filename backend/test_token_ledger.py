@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Test script for atomic token transactions against the in-memory Supabase stand-in
+"""
+import sys
+import os
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+sys.path.insert(0, os.path.dirname(__file__))
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("ADMIN_PASSWORD", "test-admin-password")
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+
+from fastapi import HTTPException
+from app.core.mock_supabase import MockSupabaseClient, AsyncMockSupabaseClient
+from app.db import queries
+from app.db.queries import TokenQueries
+from app.db.token_reservations import TokenReservations
+
+
+def fresh_client(tokens_total=100, tokens_used=0):
+    client = MockSupabaseClient()
+    client.table("profiles").insert({"id": "user-1", "tokens_total": tokens_total, "tokens_used": tokens_used}).execute()
+    queries.supabase = AsyncMockSupabaseClient(client)
+    return client
+
+
+def profile(client):
+    return client.table("profiles").select("*").eq("id", "user-1").execute().data[0]
+
+
+def test_usage_deducts_and_logs():
+    """Test usage raises tokens_used and records balances"""
+    print("=" * 60)
+    print("TEST 1: Usage Deduction")
+    print("=" * 60)
+
+    client = fresh_client()
+    transaction = asyncio.run(TokenQueries.add_token_transaction("user-1", 3, "usage", "Chat message"))
+    print(f"Transaction: {transaction}")
+
+    assert transaction["balance_before"] == 100 and transaction["balance_after"] == 97, "Wrong balances on usage!"
+    assert profile(client)["tokens_used"] == 3, "tokens_used was not increased!"
+    assert len(client.table("token_transactions").select("*").execute().data) == 1, "Transaction was not logged!"
+    print("✓ PASSED\n")
+    return True
+
+
+def test_penalty_is_a_debit():
+    """Test penalties spend tokens instead of granting them"""
+    print("=" * 60)
+    print("TEST 2: Penalty Deduction")
+    print("=" * 60)
+
+    client = fresh_client()
+    transaction = asyncio.run(TokenQueries.add_token_transaction("user-1", 10, "penalty", "Abuse"))
+    print(f"Profile: {profile(client)}")
+
+    assert profile(client)["tokens_total"] == 100, "Penalty changed tokens_total!"
+    assert profile(client)["tokens_used"] == 10, "Penalty did not increase tokens_used!"
+    assert transaction["balance_after"] == 90, "Wrong balance after penalty!"
+    print("✓ PASSED\n")
+    return True
+
+
+def test_bonus_grants_tokens():
+    """Test credits raise tokens_total"""
+    print("=" * 60)
+    print("TEST 3: Bonus Credit")
+    print("=" * 60)
+
+    client = fresh_client(tokens_total=10, tokens_used=10)
+    transaction = asyncio.run(TokenQueries.add_token_transaction("user-1", 25, "bonus", "Welcome", admin_notes="promo"))
+    print(f"Transaction: {transaction}")
+
+    assert profile(client)["tokens_total"] == 35, "Bonus did not increase tokens_total!"
+    assert transaction["balance_before"] == 0 and transaction["balance_after"] == 25, "Wrong balances on bonus!"
+    print("✓ PASSED\n")
+    return True
+
+
+def test_concurrent_deductions_are_not_lost():
+    """Test parallel deductions all land on the balance"""
+    print("=" * 60)
+    print("TEST 4: Concurrent Deductions")
+    print("=" * 60)
+
+    client = fresh_client(tokens_total=1000)
+
+    def charge(_):
+        return asyncio.run(TokenQueries.add_token_transaction("user-1", 1, "usage", "Chat message"))
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(charge, range(200)))
+
+    balances = sorted(result["balance_after"] for result in results)
+    print(f"tokens_used: {profile(client)['tokens_used']}")
+
+    assert profile(client)["tokens_used"] == 200, "Lost updates under concurrency!"
+    assert balances == list(range(800, 1000)), "Balances overlap between transactions!"
+    print("✓ PASSED\n")
+    return True
+
+
+def test_unknown_user_is_rejected():
+    """Test a missing profile logs nothing"""
+    print("=" * 60)
+    print("TEST 5: Unknown User")
+    print("=" * 60)
+
+    client = fresh_client()
+    transaction = asyncio.run(TokenQueries.add_token_transaction("missing", 5, "usage", "Chat message"))
+
+    assert transaction is None, "Transaction for an unknown user should fail!"
+    assert not client.table("token_transactions").select("*").execute().data, "Orphan transaction was logged!"
+    print("✓ PASSED\n")
+    return True
+
+
+def test_batch_skips_unknown_users():
+    """Test batched settlement applies good entries and skips bad ones"""
+    print("=" * 60)
+    print("TEST 6: Batched Settlement")
+    print("=" * 60)
+
+    client = fresh_client()
+    entries = [
+        {"user_id": "user-1", "amount": 2, "transaction_type": "usage", "reason": "Chat message"},
+        {"user_id": "missing", "amount": 2, "transaction_type": "usage", "reason": "Chat message"},
+        {"user_id": "user-1", "amount": 3, "transaction_type": "usage", "reason": "Chat message"},
+    ]
+    transactions = asyncio.run(TokenQueries.apply_token_transactions(entries))
+    print(f"Applied: {[t['balance_after'] for t in transactions]}")
+
+    assert [t["balance_after"] for t in transactions] == [98, 95], "Wrong batch balances!"
+    assert profile(client)["tokens_used"] == 5, "Batch did not reach the profile!"
+    assert TokenQueries.balance_cache.get("user-1") == 95, "Balance cache was not refreshed!"
+    print("✓ PASSED\n")
+    return True
+
+
+def test_snapshot_plus_delta_balance():
+    """Test the ledger balance is unchanged by folding transactions into the snapshot"""
+    print("=" * 60)
+    print("TEST 7: Snapshot Balance")
+    print("=" * 60)
+
+    client = fresh_client()
+    for amount, kind in [(4, "usage"), (10, "bonus"), (1, "penalty")]:
+        asyncio.run(TokenQueries.add_token_transaction("user-1", amount, kind, "Ledger test"))
+    before = asyncio.run(TokenQueries.get_user_tokens("user-1"))
+    folded = asyncio.run(TokenQueries.snapshot_balances(lag_seconds=0, limit=100))
+    after = asyncio.run(TokenQueries.get_user_tokens("user-1"))
+    snapshot = client.table("token_balance_snapshots").select("*").eq("user_id", "user-1").execute().data[0]
+    print(f"Before: {before}, after: {after}, snapshot: {snapshot['credits']}/{snapshot['debits']}")
+
+    assert before == after == {"total": 110, "used": 5, "available": 105}, "Snapshot changed the balance!"
+    assert folded == 1 and snapshot["transaction_count"] == 3, "Transactions were not folded!"
+    assert not asyncio.run(TokenQueries.reconcile_balances()), "Profile drifted from the ledger!"
+    print("✓ PASSED\n")
+    return True
+
+
+def test_token_pack_credit_survives_repair():
+    """Test a confirmed token pack is credited through the ledger, so a repairing reconcile keeps it"""
+    print("=" * 60)
+    print("TEST 8: Token Pack Credit")
+    print("=" * 60)
+
+    client = fresh_client()
+    asyncio.run(TokenQueries.add_token_transaction("user-1", 5, "usage", "Chat message"))
+    client.table("token_pack_requests").insert({"id": "pack-request-1", "user_id": "user-1", "tokens": 250, "status": "pending"}).execute()
+    client.table("token_pack_requests").update({"status": "confirmed"}).eq("id", "pack-request-1").execute()
+    client.table("token_pack_requests").update({"admin_notes": "checked"}).eq("id", "pack-request-1").execute()
+    drifted = asyncio.run(TokenQueries.reconcile_balances(repair=True))
+    balance = asyncio.run(TokenQueries.get_user_tokens("user-1"))
+    print(f"Balance: {balance}, drifted: {drifted}")
+
+    purchases = [t for t in client.table("token_transactions").select("*").execute().data if t["transaction_type"] == "token_pack_purchase"]
+    assert len(purchases) == 1 and purchases[0]["amount"] == 250, "Token pack was not credited exactly once!"
+    assert not drifted, "Token pack credit drifted from the ledger!"
+    assert profile(client)["tokens_total"] == 350 and balance == {"total": 350, "used": 5, "available": 345}
+    print("✓ PASSED\n")
+    return True
+
+
+def test_failed_request_releases_reservation():
+    """Test a hold is released when the request fails before settling (retrieval raising)"""
+    print("=" * 60)
+    print("TEST 9: Reservation Release")
+    print("=" * 60)
+
+    fresh_client()
+    book = TokenReservations()
+
+    def retrieve(*args):
+        raise RuntimeError("vector store unavailable")
+
+    async def request():
+        with await book.reserve("user-1") as reservation:
+            assert reservation.id in book.held["user-1"], "Reservation was not held!"
+            retrieve("user-1", "nmap", 3)
+            reservation.settle(response_text="never reached", reason="Chat message")
+
+    try:
+        asyncio.run(request())
+    except RuntimeError as e:
+        print(f"Request failed: {e}")
+    else:
+        raise AssertionError("Retrieval error was swallowed!")
+
+    assert not book.held.get("user-1"), "Hold leaked after the request failed!"
+    assert book.held_amount("user-1") == 0 and not book.queue, "Failed request was charged!"
+    print("✓ PASSED\n")
+    return True
+
+
+def test_reservation_overlaps_request_work():
+    """Test the reservation runs alongside retrieval, and a refused or abandoned one leaves no hold"""
+    print("=" * 60)
+    print("TEST 10: Concurrent Reservation")
+    print("=" * 60)
+
+    fresh_client()
+
+    class SlowBook(TokenReservations):
+        refuse = False
+
+        async def reserve(self, user_id):
+            await asyncio.sleep(0.1)
+            if self.refuse:
+                raise HTTPException(status_code=402, detail="Insufficient token balance")
+            return await super().reserve(user_id)
+
+    async def work(result="docs", fail=False):
+        await asyncio.sleep(0.1)
+        if fail:
+            raise RuntimeError("vector store unavailable")
+        return result
+
+    async def scenario():
+        book = SlowBook()
+        start = time.perf_counter()
+        reservation, docs = await book.reserve_during("user-1", work())
+        elapsed = time.perf_counter() - start
+        reservation.release()
+
+        book.refuse = True
+        try:
+            await book.reserve_during("user-1", work())
+        except HTTPException as e:
+            refused = e.status_code
+        book.refuse = False
+
+        try:
+            await book.reserve_during("user-1", work(fail=True))
+        except RuntimeError:
+            pass
+        await asyncio.sleep(0.15)
+        return docs, elapsed, refused, book.held_amount("user-1")
+
+    docs, elapsed, refused, held = asyncio.run(scenario())
+    print(f"Reserved with {docs} in {elapsed:.2f}s, refused with {refused}, held afterwards: {held}")
+
+    assert docs == "docs" and elapsed < 0.18, "Reservation ran serially before the request work!"
+    assert refused == 402
+    assert held == 0, "Hold leaked after the request work failed!"
+    print("✓ PASSED\n")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("\n" + "=" * 60)
+    print("TOKEN LEDGER TEST SUITE")
+    print("=" * 60 + "\n")
+
+    tests = [
+        ("Usage Deduction", test_usage_deducts_and_logs),
+        ("Penalty Deduction", test_penalty_is_a_debit),
+        ("Bonus Credit", test_bonus_grants_tokens),
+        ("Concurrent Deductions", test_concurrent_deductions_are_not_lost),
+        ("Unknown User", test_unknown_user_is_rejected),
+        ("Batched Settlement", test_batch_skips_unknown_users),
+        ("Snapshot Balance", test_snapshot_plus_delta_balance),
+        ("Token Pack Credit", test_token_pack_credit_survives_repair),
+        ("Reservation Release", test_failed_request_releases_reservation),
+        ("Concurrent Reservation", test_reservation_overlaps_request_work),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            if test_func():
+                passed += 1
+        except Exception as e:
+            print(f"✗ FAILED: {str(e)}\n")
+            failed += 1
+
+    print("=" * 60)
+    print("TEST SUMMARY")
+    print("=" * 60)
+    print(f"Passed: {passed}/{len(tests)}")
+    print(f"Failed: {failed}/{len(tests)}")
+    print("=" * 60 + "\n")
+
+    return failed == 0
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
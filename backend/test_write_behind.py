@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Test script for the chat write-behind buffer
+"""
+import sys
+import os
+import asyncio
+import tempfile
+import uuid
+sys.path.insert(0, os.path.dirname(__file__))
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("ADMIN_PASSWORD", "test-admin-password")
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.db.write_behind import ChatWriteBuffer
+from app.models import Base, ChatMessage, ChatSession, User
+
+
+class FlakySessions:
+    """Session factory that fails while down, like a locked or unreachable database"""
+
+    def __init__(self, sessions):
+        self.sessions = sessions
+        self.down = False
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.down:
+            raise OperationalError("INSERT INTO chat_messages", {}, Exception("database is locked"))
+        return self.sessions()
+
+
+async def make_sessions():
+    path = os.path.join(tempfile.mkdtemp(prefix="cyberscholar-writebehind-"), "chat.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+    async with sessions() as db:
+        db.add(User(id="user-1", email="buffer@example.com", username="buffer", hashed_password="x"))
+        db.add(ChatSession(id="session-1", user_id="user-1", title="Recon"))
+        await db.commit()
+    return engine, sessions
+
+
+def exchange(session_id="session-1", message_id=None):
+    return [
+        ChatMessage(id=message_id or str(uuid.uuid4()), session_id=session_id, role="user", content="what is nmap"),
+        ChatMessage(id=str(uuid.uuid4()), session_id=session_id, role="assistant", content="a port scanner"),
+    ]
+
+
+async def message_count(sessions):
+    async with sessions() as db:
+        return (await db.execute(select(func.count()).select_from(ChatMessage))).scalar_one()
+
+
+def test_batched_flush():
+    """Test queued messages are written in one flush once max_batch is reached, without waiting for the interval"""
+    print("=" * 60)
+    print("TEST 1: Batched Flush")
+    print("=" * 60)
+
+    async def scenario():
+        engine, sessions = await make_sessions()
+        buffer = ChatWriteBuffer(sessions, flush_interval_ms=60000, max_batch=6, max_pending=100)
+        try:
+            for _ in range(2):
+                await buffer.enqueue("user-1", messages=exchange())
+            before = await message_count(sessions)
+            await buffer.enqueue("user-1", messages=exchange())
+            await asyncio.sleep(0.2)
+            return before, await message_count(sessions), buffer.stats()
+        finally:
+            await buffer.stop()
+            await engine.dispose()
+
+    before, after, stats = asyncio.run(scenario())
+    print(f"Rows before the batch filled: {before}, after: {after}, stats: {stats}")
+
+    assert before == 0, "Rows were written before the batch filled!"
+    assert after == 6
+    assert stats["flushes"] == 1 and stats["rows_written"] == 6 and stats["pending_rows"] == 0
+    print("✓ PASSED\n")
+    return True
+
+
+def test_stop_flushes_queue():
+    """Test stop() writes out everything still queued"""
+    print("=" * 60)
+    print("TEST 2: Flush On Stop")
+    print("=" * 60)
+
+    async def scenario():
+        engine, sessions = await make_sessions()
+        buffer = ChatWriteBuffer(sessions, flush_interval_ms=60000, max_batch=100, max_pending=100)
+        try:
+            new_session = ChatSession(id="session-2", user_id="user-1", title="New")
+            await buffer.enqueue("user-1", new_session=new_session, messages=exchange("session-2"))
+            await buffer.stop()
+            return await message_count(sessions), buffer.pending
+        finally:
+            await engine.dispose()
+
+    written, pending = asyncio.run(scenario())
+    print(f"Messages written on stop: {written}, still pending: {pending}")
+
+    assert written == 2 and pending == 0, "Queued rows were lost on shutdown!"
+    print("✓ PASSED\n")
+    return True
+
+
+def test_failed_flush_requeues_rows():
+    """Test rows go back on the queue when the database fails, including during the row-by-row fallback"""
+    print("=" * 60)
+    print("TEST 3: Re-queue After Database Failure")
+    print("=" * 60)
+
+    async def scenario():
+        engine, sessions = await make_sessions()
+        flaky = FlakySessions(sessions)
+        buffer = ChatWriteBuffer(flaky, flush_interval_ms=60000, max_batch=100, max_pending=100)
+        try:
+            # Database down for the bulk write
+            await buffer.enqueue("user-1", messages=exchange())
+            flaky.down = True
+            try:
+                await buffer.flush()
+            except OperationalError:
+                pass
+            requeued_after_bulk = buffer.pending
+            flaky.down = False
+            await buffer.flush()
+
+            # A duplicate id sends the flush to the row-by-row fallback, which then loses the database
+            duplicate = exchange()
+            await buffer.enqueue("user-1", messages=duplicate)
+            await buffer.flush()
+            await buffer.enqueue("user-1", messages=exchange(message_id=duplicate[0].id) + exchange())
+            original_write = buffer._write
+
+            async def write_then_fail(*batch):
+                if flaky.calls > 0 and any(len(rows) == 1 for rows in batch):
+                    flaky.down = True
+                await original_write(*batch)
+
+            buffer._write = write_then_fail
+            flaky.calls = 0
+            try:
+                await buffer.flush()
+            except OperationalError:
+                pass
+            requeued_after_fallback = buffer.pending
+            still_pending = "user-1" in buffer.pending_users
+            buffer._write = original_write
+            flaky.down = False
+            await buffer.flush()
+            return requeued_after_bulk, requeued_after_fallback, still_pending, await message_count(sessions)
+        finally:
+            await buffer.stop()
+            await engine.dispose()
+
+    after_bulk, after_fallback, still_pending, written = asyncio.run(scenario())
+    print(f"Re-queued after bulk failure: {after_bulk}, after fallback failure: {after_fallback}, messages written: {written}")
+
+    assert after_bulk == 2, "Rows were lost when the bulk write failed!"
+    assert after_fallback == 4 and still_pending, "Rows were lost when the row-by-row fallback failed!"
+    assert written == 7, "Re-queued rows were not written once the database came back!"
+    print("✓ PASSED\n")
+    return True
+
+
+def test_read_your_writes_during_flush():
+    """Test flush_if_pending waits for a flush already in flight instead of returning before its commit"""
+    print("=" * 60)
+    print("TEST 4: Read Your Writes During Flush")
+    print("=" * 60)
+
+    async def scenario():
+        engine, sessions = await make_sessions()
+        buffer = ChatWriteBuffer(sessions, flush_interval_ms=60000, max_batch=100, max_pending=100)
+        original_write = buffer._write
+
+        async def slow_write(*batch):
+            await asyncio.sleep(0.1)
+            await original_write(*batch)
+
+        buffer._write = slow_write
+        try:
+            await buffer.enqueue("user-1", messages=exchange())
+            background = asyncio.create_task(buffer.flush())
+            await asyncio.sleep(0.01)
+            await buffer.flush_if_pending("user-1")
+            visible = await message_count(sessions)
+            await background
+            return visible
+        finally:
+            await buffer.stop()
+            await engine.dispose()
+
+    visible = asyncio.run(scenario())
+    print(f"Messages visible after flush_if_pending: {visible}")
+
+    assert visible == 2, "Read returned before the in-flight flush committed!"
+    print("✓ PASSED\n")
+    return True
+
+
+def main():
+    print("\n" + "=" * 60)
+    print("CHAT WRITE-BEHIND TEST SUITE")
+    print("=" * 60 + "\n")
+
+    tests = [
+        ("Batched Flush", test_batched_flush),
+        ("Flush On Stop", test_stop_flushes_queue),
+        ("Re-queue After Database Failure", test_failed_flush_requeues_rows),
+        ("Read Your Writes During Flush", test_read_your_writes_during_flush),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            if test_func():
+                passed += 1
+        except Exception as e:
+            print(f"✗ FAILED: {str(e)}\n")
+            failed += 1
+
+    print("=" * 60)
+    print("TEST SUMMARY")
+    print("=" * 60)
+    print(f"Passed: {passed}/{len(tests)}")
+    print(f"Failed: {failed}/{len(tests)}")
+    print("=" * 60 + "\n")
+
+    return failed == 0
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -74,7 +74,7 @@ class AdminService {
     tier?: string;
     status?: string;
     limit?: number;
-    offset?: number;
+    cursor?: string;
   }) {
     const response = await apiClient.get("/admin/users", true, params);
     return response;
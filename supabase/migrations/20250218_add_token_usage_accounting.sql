@@ -0,0 +1,4 @@
+-- Record LLM prompt/response token counts alongside each usage transaction
+ALTER TABLE public.token_transactions
+  ADD COLUMN IF NOT EXISTS input_tokens INTEGER,
+  ADD COLUMN IF NOT EXISTS output_tokens INTEGER;
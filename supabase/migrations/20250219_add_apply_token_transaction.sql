@@ -0,0 +1,77 @@
+-- Apply a token transaction atomically: lock the profile row, move the balance
+-- and log the transaction in one round trip, so concurrent chats cannot lose updates.
+-- Debits (usage, penalty) raise tokens_used; everything else raises tokens_total.
+CREATE OR REPLACE FUNCTION public.apply_token_transaction(
+  p_user_id UUID,
+  p_amount INTEGER,
+  p_transaction_type TEXT,
+  p_reason TEXT,
+  p_admin_notes TEXT DEFAULT NULL,
+  p_input_tokens INTEGER DEFAULT NULL,
+  p_output_tokens INTEGER DEFAULT NULL
+)
+RETURNS public.token_transactions AS $$
+DECLARE
+  v_profile RECORD;
+  v_balance_before INTEGER;
+  v_balance_after INTEGER;
+  v_transaction public.token_transactions;
+BEGIN
+  IF p_amount IS NULL OR p_amount < 0 THEN
+    RAISE EXCEPTION 'Token amount must be a non-negative integer' USING ERRCODE = '22023';
+  END IF;
+
+  SELECT COALESCE(tokens_total, 0) AS tokens_total, COALESCE(tokens_used, 0) AS tokens_used
+  INTO v_profile
+  FROM public.profiles
+  WHERE id = p_user_id
+  FOR UPDATE;
+
+  IF NOT FOUND THEN
+    RAISE EXCEPTION 'Profile % not found', p_user_id USING ERRCODE = 'P0002';
+  END IF;
+
+  v_balance_before := GREATEST(0, v_profile.tokens_total - v_profile.tokens_used);
+
+  IF p_transaction_type IN ('usage', 'penalty') THEN
+    UPDATE public.profiles
+    SET tokens_used = v_profile.tokens_used + p_amount
+    WHERE id = p_user_id;
+    v_balance_after := GREATEST(0, v_profile.tokens_total - v_profile.tokens_used - p_amount);
+  ELSE
+    UPDATE public.profiles
+    SET tokens_total = v_profile.tokens_total + p_amount
+    WHERE id = p_user_id;
+    v_balance_after := GREATEST(0, v_profile.tokens_total + p_amount - v_profile.tokens_used);
+  END IF;
+
+  INSERT INTO public.token_transactions (
+    user_id,
+    amount,
+    transaction_type,
+    reason,
+    balance_before,
+    balance_after,
+    admin_notes,
+    input_tokens,
+    output_tokens
+  ) VALUES (
+    p_user_id,
+    p_amount,
+    p_transaction_type,
+    p_reason,
+    v_balance_before,
+    v_balance_after,
+    p_admin_notes,
+    p_input_tokens,
+    p_output_tokens
+  )
+  RETURNING * INTO v_transaction;
+
+  RETURN v_transaction;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- Balances are only moved by the backend's service role
+REVOKE ALL ON FUNCTION public.apply_token_transaction(UUID, INTEGER, TEXT, TEXT, TEXT, INTEGER, INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.apply_token_transaction(UUID, INTEGER, TEXT, TEXT, TEXT, INTEGER, INTEGER) TO service_role;
@@ -0,0 +1,31 @@
+-- Settle a batch of token transactions in one round trip. Each entry is applied
+-- through apply_token_transaction in its own subtransaction, so one bad entry
+-- (e.g. a deleted profile) is skipped instead of failing the whole batch.
+-- Callers sort entries by user_id so concurrent batches lock profiles in the same order.
+CREATE OR REPLACE FUNCTION public.apply_token_transactions(p_transactions JSONB)
+RETURNS SETOF public.token_transactions AS $$
+DECLARE
+  v_entry JSONB;
+  v_transaction public.token_transactions;
+BEGIN
+  FOR v_entry IN SELECT value FROM jsonb_array_elements(p_transactions) LOOP
+    BEGIN
+      v_transaction := public.apply_token_transaction(
+        (v_entry->>'user_id')::UUID,
+        (v_entry->>'amount')::INTEGER,
+        v_entry->>'transaction_type',
+        v_entry->>'reason',
+        v_entry->>'admin_notes',
+        (v_entry->>'input_tokens')::INTEGER,
+        (v_entry->>'output_tokens')::INTEGER
+      );
+      RETURN NEXT v_transaction;
+    EXCEPTION WHEN OTHERS THEN
+      RAISE WARNING 'Skipping token transaction for %: %', v_entry->>'user_id', SQLERRM;
+    END;
+  END LOOP;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+REVOKE ALL ON FUNCTION public.apply_token_transactions(JSONB) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.apply_token_transactions(JSONB) TO service_role;
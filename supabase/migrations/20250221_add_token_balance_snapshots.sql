@@ -0,0 +1,319 @@
+-- Ledger-derived token balances: balance = snapshot + transactions after the snapshot's watermark.
+-- A periodic job folds older transactions into the snapshot, so reading a balance only
+-- scans the few transactions since the last fold, however long the ledger grows.
+-- profiles.tokens_total / tokens_used stay as a denormalised copy, checked by reconcile_token_balances.
+
+CREATE INDEX IF NOT EXISTS idx_token_transactions_user_created
+  ON public.token_transactions (user_id, created_at DESC, id DESC);
+
+CREATE TABLE IF NOT EXISTS public.token_balance_snapshots (
+  user_id UUID PRIMARY KEY REFERENCES public.profiles(id) ON DELETE CASCADE,
+  base_total BIGINT NOT NULL DEFAULT 0,
+  base_used BIGINT NOT NULL DEFAULT 0,
+  credits BIGINT NOT NULL DEFAULT 0,
+  debits BIGINT NOT NULL DEFAULT 0,
+  transaction_count BIGINT NOT NULL DEFAULT 0,
+  watermark_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT '-infinity',
+  watermark_id UUID NOT NULL DEFAULT '00000000-0000-0000-0000-000000000000',
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+);
+
+ALTER TABLE public.token_balance_snapshots ENABLE ROW LEVEL SECURITY;
+
+-- Existing balances become the base; their history is already behind the watermark
+INSERT INTO public.token_balance_snapshots (user_id, base_total, base_used, watermark_at, watermark_id)
+SELECT
+  p.id,
+  COALESCE(p.tokens_total, 0),
+  COALESCE(p.tokens_used, 0),
+  COALESCE(last_tx.created_at, '-infinity'),
+  COALESCE(last_tx.id, '00000000-0000-0000-0000-000000000000')
+FROM public.profiles p
+LEFT JOIN LATERAL (
+  SELECT t.created_at, t.id
+  FROM public.token_transactions t
+  WHERE t.user_id = p.id
+  ORDER BY t.created_at DESC, t.id DESC
+  LIMIT 1
+) last_tx ON true
+ON CONFLICT (user_id) DO NOTHING;
+
+-- Sum of transactions after a watermark, split into credits and debits
+CREATE OR REPLACE FUNCTION public.token_ledger_delta(
+  p_user_id UUID,
+  p_after_at TIMESTAMP WITH TIME ZONE,
+  p_after_id UUID,
+  p_until TIMESTAMP WITH TIME ZONE DEFAULT 'infinity'
+)
+RETURNS TABLE (credits BIGINT, debits BIGINT, transaction_count BIGINT, last_at TIMESTAMP WITH TIME ZONE, last_id UUID) AS $$
+  SELECT
+    COALESCE(SUM(t.amount) FILTER (WHERE t.transaction_type NOT IN ('usage', 'penalty')), 0)::BIGINT,
+    COALESCE(SUM(t.amount) FILTER (WHERE t.transaction_type IN ('usage', 'penalty')), 0)::BIGINT,
+    COUNT(*)::BIGINT,
+    (ARRAY_AGG(t.created_at ORDER BY t.created_at DESC, t.id DESC))[1],
+    (ARRAY_AGG(t.id ORDER BY t.created_at DESC, t.id DESC))[1]
+  FROM public.token_transactions t
+  WHERE t.user_id = p_user_id
+    AND (t.created_at, t.id) > (p_after_at, p_after_id)
+    AND t.created_at < p_until
+    AND t.transaction_type <> 'allowance_reset';
+$$ LANGUAGE sql STABLE SET search_path = public;
+
+CREATE OR REPLACE FUNCTION public.get_token_balance(p_user_id UUID)
+RETURNS TABLE (tokens_total BIGINT, tokens_used BIGINT, available BIGINT, snapshot_at TIMESTAMP WITH TIME ZONE, unsnapshotted_transactions BIGINT) AS $$
+DECLARE
+  v_snapshot public.token_balance_snapshots;
+  v_delta RECORD;
+BEGIN
+  SELECT * INTO v_snapshot FROM public.token_balance_snapshots WHERE user_id = p_user_id;
+
+  IF NOT FOUND THEN
+    RETURN QUERY
+    SELECT COALESCE(p.tokens_total, 0)::BIGINT, COALESCE(p.tokens_used, 0)::BIGINT,
+           GREATEST(0, COALESCE(p.tokens_total, 0) - COALESCE(p.tokens_used, 0))::BIGINT,
+           NULL::TIMESTAMP WITH TIME ZONE, 0::BIGINT
+    FROM public.profiles p
+    WHERE p.id = p_user_id;
+    RETURN;
+  END IF;
+
+  SELECT * INTO v_delta FROM public.token_ledger_delta(p_user_id, v_snapshot.watermark_at, v_snapshot.watermark_id);
+
+  tokens_total := v_snapshot.base_total + v_snapshot.credits + v_delta.credits;
+  tokens_used := v_snapshot.base_used + v_snapshot.debits + v_delta.debits;
+  available := GREATEST(0, tokens_total - tokens_used);
+  snapshot_at := v_snapshot.updated_at;
+  unsnapshotted_transactions := v_delta.transaction_count;
+  RETURN NEXT;
+END;
+$$ LANGUAGE plpgsql STABLE SECURITY DEFINER SET search_path = public;
+
+-- Same contract as before; transactions now carry the time they were applied (after the
+-- profile lock), so per-user ledger order matches balance order, and the first transaction
+-- for a profile without a snapshot bootstraps one from its current balance.
+CREATE OR REPLACE FUNCTION public.apply_token_transaction(
+  p_user_id UUID,
+  p_amount INTEGER,
+  p_transaction_type TEXT,
+  p_reason TEXT,
+  p_admin_notes TEXT DEFAULT NULL,
+  p_input_tokens INTEGER DEFAULT NULL,
+  p_output_tokens INTEGER DEFAULT NULL
+)
+RETURNS public.token_transactions AS $$
+DECLARE
+  v_profile RECORD;
+  v_balance_before INTEGER;
+  v_balance_after INTEGER;
+  v_transaction public.token_transactions;
+BEGIN
+  IF p_amount IS NULL OR p_amount < 0 THEN
+    RAISE EXCEPTION 'Token amount must be a non-negative integer' USING ERRCODE = '22023';
+  END IF;
+
+  SELECT COALESCE(tokens_total, 0) AS tokens_total, COALESCE(tokens_used, 0) AS tokens_used
+  INTO v_profile
+  FROM public.profiles
+  WHERE id = p_user_id
+  FOR UPDATE;
+
+  IF NOT FOUND THEN
+    RAISE EXCEPTION 'Profile % not found', p_user_id USING ERRCODE = 'P0002';
+  END IF;
+
+  INSERT INTO public.token_balance_snapshots (user_id, base_total, base_used, watermark_at)
+  VALUES (p_user_id, v_profile.tokens_total, v_profile.tokens_used, clock_timestamp())
+  ON CONFLICT (user_id) DO NOTHING;
+
+  v_balance_before := GREATEST(0, v_profile.tokens_total - v_profile.tokens_used);
+
+  IF p_transaction_type IN ('usage', 'penalty') THEN
+    UPDATE public.profiles
+    SET tokens_used = v_profile.tokens_used + p_amount
+    WHERE id = p_user_id;
+    v_balance_after := GREATEST(0, v_profile.tokens_total - v_profile.tokens_used - p_amount);
+  ELSE
+    UPDATE public.profiles
+    SET tokens_total = v_profile.tokens_total + p_amount
+    WHERE id = p_user_id;
+    v_balance_after := GREATEST(0, v_profile.tokens_total + p_amount - v_profile.tokens_used);
+  END IF;
+
+  INSERT INTO public.token_transactions (
+    user_id,
+    amount,
+    transaction_type,
+    reason,
+    balance_before,
+    balance_after,
+    admin_notes,
+    input_tokens,
+    output_tokens,
+    created_at
+  ) VALUES (
+    p_user_id,
+    p_amount,
+    p_transaction_type,
+    p_reason,
+    v_balance_before,
+    v_balance_after,
+    p_admin_notes,
+    p_input_tokens,
+    p_output_tokens,
+    clock_timestamp()
+  )
+  RETURNING * INTO v_transaction;
+
+  RETURN v_transaction;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- Set an absolute allowance (subscription activation, plan purchase) and restart the
+-- snapshot from it; the allowance_reset row is the new watermark.
+CREATE OR REPLACE FUNCTION public.set_token_allowance(
+  p_user_id UUID,
+  p_tokens_total INTEGER,
+  p_tokens_used INTEGER DEFAULT NULL,
+  p_reason TEXT DEFAULT 'Token allowance set'
+)
+RETURNS public.token_transactions AS $$
+DECLARE
+  v_balance RECORD;
+  v_used INTEGER;
+  v_transaction public.token_transactions;
+BEGIN
+  PERFORM 1 FROM public.profiles WHERE id = p_user_id FOR UPDATE;
+  IF NOT FOUND THEN
+    RAISE EXCEPTION 'Profile % not found', p_user_id USING ERRCODE = 'P0002';
+  END IF;
+
+  SELECT * INTO v_balance FROM public.get_token_balance(p_user_id);
+  v_used := COALESCE(p_tokens_used, v_balance.tokens_used);
+
+  UPDATE public.profiles
+  SET tokens_total = p_tokens_total, tokens_used = v_used
+  WHERE id = p_user_id;
+
+  INSERT INTO public.token_transactions (
+    user_id, amount, transaction_type, reason, balance_before, balance_after, created_at
+  ) VALUES (
+    p_user_id, p_tokens_total, 'allowance_reset', p_reason,
+    v_balance.available, GREATEST(0, p_tokens_total - v_used), clock_timestamp()
+  )
+  RETURNING * INTO v_transaction;
+
+  INSERT INTO public.token_balance_snapshots AS s (
+    user_id, base_total, base_used, credits, debits, transaction_count, watermark_at, watermark_id, updated_at
+  ) VALUES (
+    p_user_id, p_tokens_total, v_used, 0, 0, 0, v_transaction.created_at, v_transaction.id, now()
+  )
+  ON CONFLICT (user_id) DO UPDATE SET
+    base_total = EXCLUDED.base_total,
+    base_used = EXCLUDED.base_used,
+    credits = 0,
+    debits = 0,
+    transaction_count = 0,
+    watermark_at = EXCLUDED.watermark_at,
+    watermark_id = EXCLUDED.watermark_id,
+    updated_at = now();
+
+  RETURN v_transaction;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- Fold transactions older than p_lag_seconds into their snapshots. The lag keeps
+-- transactions that are still committing out of the fold; they remain in the delta.
+CREATE OR REPLACE FUNCTION public.snapshot_token_balances(p_lag_seconds INTEGER DEFAULT 60, p_limit INTEGER DEFAULT 1000)
+RETURNS INTEGER AS $$
+DECLARE
+  v_cutoff TIMESTAMP WITH TIME ZONE := now() - make_interval(secs => p_lag_seconds);
+  v_snapshot public.token_balance_snapshots;
+  v_delta RECORD;
+  v_folded INTEGER := 0;
+BEGIN
+  FOR v_snapshot IN
+    SELECT s.* FROM public.token_balance_snapshots s
+    WHERE EXISTS (
+      SELECT 1 FROM public.token_transactions t
+      WHERE t.user_id = s.user_id
+        AND (t.created_at, t.id) > (s.watermark_at, s.watermark_id)
+        AND t.created_at < v_cutoff
+    )
+    LIMIT p_limit
+    FOR UPDATE SKIP LOCKED
+  LOOP
+    SELECT * INTO v_delta
+    FROM public.token_ledger_delta(v_snapshot.user_id, v_snapshot.watermark_at, v_snapshot.watermark_id, v_cutoff);
+
+    IF v_delta.transaction_count > 0 THEN
+      UPDATE public.token_balance_snapshots
+      SET credits = credits + v_delta.credits,
+          debits = debits + v_delta.debits,
+          transaction_count = transaction_count + v_delta.transaction_count,
+          watermark_at = v_delta.last_at,
+          watermark_id = v_delta.last_id,
+          updated_at = now()
+      WHERE user_id = v_snapshot.user_id;
+      v_folded := v_folded + 1;
+    END IF;
+  END LOOP;
+
+  RETURN v_folded;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- Profiles whose denormalised columns disagree with the ledger; p_repair rewrites them from the ledger
+CREATE OR REPLACE FUNCTION public.reconcile_token_balances(p_repair BOOLEAN DEFAULT false, p_limit INTEGER DEFAULT 1000)
+RETURNS TABLE (user_id UUID, profile_total BIGINT, profile_used BIGINT, ledger_total BIGINT, ledger_used BIGINT) AS $$
+BEGIN
+  RETURN QUERY
+  SELECT p.id, COALESCE(p.tokens_total, 0)::BIGINT, COALESCE(p.tokens_used, 0)::BIGINT, b.tokens_total, b.tokens_used
+  FROM public.profiles p
+  JOIN public.token_balance_snapshots s ON s.user_id = p.id
+  CROSS JOIN LATERAL public.get_token_balance(p.id) b
+  WHERE COALESCE(p.tokens_total, 0) <> b.tokens_total OR COALESCE(p.tokens_used, 0) <> b.tokens_used
+  LIMIT p_limit;
+
+  IF p_repair THEN
+    UPDATE public.profiles p
+    SET tokens_total = b.tokens_total, tokens_used = b.tokens_used
+    FROM public.token_balance_snapshots s
+    CROSS JOIN LATERAL public.get_token_balance(s.user_id) b
+    WHERE s.user_id = p.id
+      AND (COALESCE(p.tokens_total, 0) <> b.tokens_total OR COALESCE(p.tokens_used, 0) <> b.tokens_used);
+  END IF;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- Keyset page of a user's ledger, newest first, optionally within [p_from, p_to)
+CREATE OR REPLACE FUNCTION public.list_token_transactions(
+  p_user_id UUID,
+  p_limit INTEGER DEFAULT 50,
+  p_before_at TIMESTAMP WITH TIME ZONE DEFAULT NULL,
+  p_before_id UUID DEFAULT NULL,
+  p_from TIMESTAMP WITH TIME ZONE DEFAULT NULL,
+  p_to TIMESTAMP WITH TIME ZONE DEFAULT NULL
+)
+RETURNS SETOF public.token_transactions AS $$
+  SELECT t.*
+  FROM public.token_transactions t
+  WHERE t.user_id = p_user_id
+    AND (p_before_at IS NULL OR (t.created_at, t.id) < (p_before_at, p_before_id))
+    AND (p_from IS NULL OR t.created_at >= p_from)
+    AND (p_to IS NULL OR t.created_at < p_to)
+  ORDER BY t.created_at DESC, t.id DESC
+  LIMIT LEAST(GREATEST(p_limit, 1), 500);
+$$ LANGUAGE sql STABLE SET search_path = public;
+
+REVOKE ALL ON FUNCTION public.token_ledger_delta(UUID, TIMESTAMP WITH TIME ZONE, UUID, TIMESTAMP WITH TIME ZONE) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION public.get_token_balance(UUID) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION public.set_token_allowance(UUID, INTEGER, INTEGER, TEXT) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION public.snapshot_token_balances(INTEGER, INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION public.reconcile_token_balances(BOOLEAN, INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION public.list_token_transactions(UUID, INTEGER, TIMESTAMP WITH TIME ZONE, UUID, TIMESTAMP WITH TIME ZONE, TIMESTAMP WITH TIME ZONE) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.token_ledger_delta(UUID, TIMESTAMP WITH TIME ZONE, UUID, TIMESTAMP WITH TIME ZONE) TO service_role;
+GRANT EXECUTE ON FUNCTION public.get_token_balance(UUID) TO service_role;
+GRANT EXECUTE ON FUNCTION public.set_token_allowance(UUID, INTEGER, INTEGER, TEXT) TO service_role;
+GRANT EXECUTE ON FUNCTION public.snapshot_token_balances(INTEGER, INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION public.reconcile_token_balances(BOOLEAN, INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION public.list_token_transactions(UUID, INTEGER, TIMESTAMP WITH TIME ZONE, UUID, TIMESTAMP WITH TIME ZONE, TIMESTAMP WITH TIME ZONE) TO service_role;
@@ -0,0 +1,163 @@
+-- Materialised admin dashboard counters, maintained by triggers so get_admin_stats
+-- reads a few dozen rows instead of scanning profiles, subscriptions, payments and the ledger.
+-- Each metric is split over 16 shards so hot writers (every usage transaction) do not
+-- serialise on one counter row; readers sum the shards.
+
+CREATE TABLE IF NOT EXISTS public.admin_stats (
+  metric TEXT NOT NULL,
+  shard SMALLINT NOT NULL DEFAULT 0,
+  value BIGINT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+  PRIMARY KEY (metric, shard)
+);
+
+ALTER TABLE public.admin_stats ENABLE ROW LEVEL SECURITY;
+
+-- Same key as the dashboard: "Pro Plus" -> pro_plus
+CREATE OR REPLACE FUNCTION public.admin_stats_plan_key(p_plan_name TEXT)
+RETURNS TEXT AS $$
+  SELECT replace(lower(COALESCE(p_plan_name, '')), ' ', '_');
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION public.bump_admin_stat(p_metric TEXT, p_delta BIGINT)
+RETURNS VOID AS $$
+BEGIN
+  IF p_delta IS NULL OR p_delta = 0 THEN
+    RETURN;
+  END IF;
+  INSERT INTO public.admin_stats (metric, shard, value, updated_at)
+  VALUES (p_metric, floor(random() * 16)::SMALLINT, p_delta, now())
+  ON CONFLICT (metric, shard)
+  DO UPDATE SET value = public.admin_stats.value + EXCLUDED.value, updated_at = EXCLUDED.updated_at;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE OR REPLACE FUNCTION public.admin_stats_on_profile()
+RETURNS TRIGGER AS $$
+BEGIN
+  PERFORM public.bump_admin_stat('total_users', CASE WHEN TG_OP = 'INSERT' THEN 1 ELSE -1 END);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE OR REPLACE FUNCTION public.admin_stats_on_subscription()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    PERFORM public.bump_admin_stat('total_revenue', -COALESCE(OLD.price_paid, 0));
+    IF OLD.status = 'active' THEN
+      PERFORM public.bump_admin_stat('active:' || public.admin_stats_plan_key(OLD.plan_name), -1);
+      PERFORM public.bump_admin_stat('monthly_revenue', -COALESCE(OLD.price_paid, 0));
+    END IF;
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    PERFORM public.bump_admin_stat('total_revenue', COALESCE(NEW.price_paid, 0));
+    IF NEW.status = 'active' THEN
+      PERFORM public.bump_admin_stat('active:' || public.admin_stats_plan_key(NEW.plan_name), 1);
+      PERFORM public.bump_admin_stat('monthly_revenue', COALESCE(NEW.price_paid, 0));
+    END IF;
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE OR REPLACE FUNCTION public.admin_stats_on_payment_request()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.status = 'pending' THEN
+    PERFORM public.bump_admin_stat('pending_payments', -1);
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.status = 'pending' THEN
+    PERFORM public.bump_admin_stat('pending_payments', 1);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE OR REPLACE FUNCTION public.admin_stats_on_token_transaction()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.transaction_type = 'usage' THEN
+    PERFORM public.bump_admin_stat('token_usage', -COALESCE(OLD.amount, 0));
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.transaction_type = 'usage' THEN
+    PERFORM public.bump_admin_stat('token_usage', COALESCE(NEW.amount, 0));
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+DROP TRIGGER IF EXISTS admin_stats_profiles ON public.profiles;
+CREATE TRIGGER admin_stats_profiles
+  AFTER INSERT OR DELETE ON public.profiles
+  FOR EACH ROW EXECUTE FUNCTION public.admin_stats_on_profile();
+
+DROP TRIGGER IF EXISTS admin_stats_subscriptions ON public.subscriptions;
+CREATE TRIGGER admin_stats_subscriptions
+  AFTER INSERT OR DELETE OR UPDATE OF status, plan_name, price_paid ON public.subscriptions
+  FOR EACH ROW EXECUTE FUNCTION public.admin_stats_on_subscription();
+
+DROP TRIGGER IF EXISTS admin_stats_payment_requests ON public.payment_requests;
+CREATE TRIGGER admin_stats_payment_requests
+  AFTER INSERT OR DELETE OR UPDATE OF status ON public.payment_requests
+  FOR EACH ROW EXECUTE FUNCTION public.admin_stats_on_payment_request();
+
+DROP TRIGGER IF EXISTS admin_stats_token_transactions ON public.token_transactions;
+CREATE TRIGGER admin_stats_token_transactions
+  AFTER INSERT OR DELETE OR UPDATE OF amount, transaction_type ON public.token_transactions
+  FOR EACH ROW EXECUTE FUNCTION public.admin_stats_on_token_transaction();
+
+-- Recompute every counter from the base tables (backfill, or repair after manual SQL with triggers disabled).
+-- The exclusive lock makes concurrent trigger bumps wait, so none are lost or double counted.
+CREATE OR REPLACE FUNCTION public.refresh_admin_stats()
+RETURNS VOID AS $$
+BEGIN
+  LOCK TABLE public.admin_stats IN EXCLUSIVE MODE;
+  DELETE FROM public.admin_stats;
+
+  INSERT INTO public.admin_stats (metric, value)
+  SELECT 'total_users', count(*) FROM public.profiles
+  UNION ALL
+  SELECT 'pending_payments', count(*) FROM public.payment_requests WHERE status = 'pending'
+  UNION ALL
+  SELECT 'token_usage', COALESCE(sum(amount), 0) FROM public.token_transactions WHERE transaction_type = 'usage'
+  UNION ALL
+  SELECT 'total_revenue', COALESCE(sum(price_paid), 0) FROM public.subscriptions
+  UNION ALL
+  SELECT 'monthly_revenue', COALESCE(sum(price_paid), 0) FROM public.subscriptions WHERE status = 'active'
+  UNION ALL
+  SELECT 'active:' || public.admin_stats_plan_key(plan_name), count(*)
+  FROM public.subscriptions
+  WHERE status = 'active'
+  GROUP BY public.admin_stats_plan_key(plan_name);
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+SELECT public.refresh_admin_stats();
+
+CREATE OR REPLACE FUNCTION public.get_admin_stats()
+RETURNS JSONB AS $$
+  WITH totals AS (
+    SELECT metric, sum(value)::BIGINT AS value
+    FROM public.admin_stats
+    GROUP BY metric
+  )
+  SELECT jsonb_build_object(
+    'total_users', COALESCE((SELECT value FROM totals WHERE metric = 'total_users'), 0),
+    'pending_payments', COALESCE((SELECT value FROM totals WHERE metric = 'pending_payments'), 0),
+    'monthly_revenue', COALESCE((SELECT value FROM totals WHERE metric = 'monthly_revenue'), 0),
+    'total_revenue', COALESCE((SELECT value FROM totals WHERE metric = 'total_revenue'), 0),
+    'token_usage', COALESCE((SELECT value FROM totals WHERE metric = 'token_usage'), 0),
+    'active_subscriptions', COALESCE(
+      (SELECT jsonb_object_agg(substr(metric, 8), value) FROM totals WHERE metric LIKE 'active:%'),
+      '{}'::jsonb
+    ),
+    'updated_at', (SELECT max(updated_at) FROM public.admin_stats)
+  );
+$$ LANGUAGE sql STABLE SECURITY DEFINER SET search_path = public;
+
+REVOKE ALL ON FUNCTION public.bump_admin_stat(TEXT, BIGINT) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION public.refresh_admin_stats() FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION public.get_admin_stats() FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.refresh_admin_stats() TO service_role;
+GRANT EXECUTE ON FUNCTION public.get_admin_stats() TO service_role;
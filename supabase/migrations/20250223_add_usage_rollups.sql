@@ -0,0 +1,217 @@
+-- Hourly and daily usage rollups per user (and the user's plan) for the admin trend charts.
+-- Sources are folded in incrementally from a (timestamp, id) watermark, so each event is read
+-- once, and charts read the compact usage_rollups table instead of the raw ledgers.
+-- Chat messages live in the backend database; the backend aggregates them and merges the
+-- result through merge_usage_rollups.
+
+CREATE TABLE IF NOT EXISTS public.usage_rollups (
+  bucket TEXT NOT NULL CHECK (bucket IN ('hour', 'day')),
+  bucket_start TIMESTAMP WITH TIME ZONE NOT NULL,
+  user_id UUID NOT NULL,
+  metric TEXT NOT NULL,
+  plan TEXT NOT NULL DEFAULT 'free',
+  event_count BIGINT NOT NULL DEFAULT 0,
+  amount BIGINT NOT NULL DEFAULT 0,
+  PRIMARY KEY (bucket, bucket_start, user_id, metric)
+);
+
+CREATE INDEX IF NOT EXISTS idx_usage_rollups_bucket_metric
+  ON public.usage_rollups (bucket, metric, bucket_start);
+CREATE INDEX IF NOT EXISTS idx_usage_rollups_user
+  ON public.usage_rollups (user_id, bucket, bucket_start);
+
+CREATE TABLE IF NOT EXISTS public.usage_rollup_watermarks (
+  source TEXT PRIMARY KEY,
+  watermark_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT '-infinity',
+  watermark_id TEXT NOT NULL DEFAULT '',
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+);
+
+ALTER TABLE public.usage_rollups ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.usage_rollup_watermarks ENABLE ROW LEVEL SECURITY;
+
+-- Range scans past each watermark
+CREATE INDEX IF NOT EXISTS idx_token_transactions_created
+  ON public.token_transactions (created_at, id);
+CREATE INDEX IF NOT EXISTS idx_payment_requests_created
+  ON public.payment_requests (created_at, id);
+CREATE INDEX IF NOT EXISTS idx_payment_requests_confirmed
+  ON public.payment_requests (admin_confirmed_at, id) WHERE status = 'confirmed';
+
+CREATE OR REPLACE FUNCTION public.usage_bucket_start(p_bucket TEXT, p_at TIMESTAMP WITH TIME ZONE)
+RETURNS TIMESTAMP WITH TIME ZONE AS $$
+  SELECT date_trunc(p_bucket, p_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC';
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Fold up to p_limit events of one source older than p_lag_seconds into both bucket sizes.
+-- Sources: token_transactions (metric tokens:<type>), payment_requests (payments:requested),
+-- payment_confirmations (payments:confirmed). Returns the number of events folded; a
+-- concurrent run on the same source returns 0 instead of double counting.
+CREATE OR REPLACE FUNCTION public.rollup_usage_source(
+  p_source TEXT,
+  p_lag_seconds INTEGER DEFAULT 120,
+  p_limit INTEGER DEFAULT 5000
+)
+RETURNS INTEGER AS $$
+DECLARE
+  v_watermark public.usage_rollup_watermarks;
+  v_cutoff TIMESTAMP WITH TIME ZONE := now() - make_interval(secs => p_lag_seconds);
+  v_folded INTEGER;
+BEGIN
+  IF p_source NOT IN ('token_transactions', 'payment_requests', 'payment_confirmations') THEN
+    RAISE EXCEPTION 'Unknown usage source %', p_source USING ERRCODE = '22023';
+  END IF;
+
+  INSERT INTO public.usage_rollup_watermarks (source) VALUES (p_source) ON CONFLICT (source) DO NOTHING;
+  SELECT * INTO v_watermark
+  FROM public.usage_rollup_watermarks
+  WHERE source = p_source
+  FOR UPDATE SKIP LOCKED;
+  IF NOT FOUND THEN
+    RETURN 0;
+  END IF;
+
+  WITH events AS (
+    SELECT e.*
+    FROM (
+      SELECT t.user_id, t.created_at AS occurred_at, t.id::TEXT AS event_id,
+             'tokens:' || t.transaction_type AS metric, t.amount::BIGINT AS amount
+      FROM public.token_transactions t
+      WHERE p_source = 'token_transactions'
+        AND t.created_at >= v_watermark.watermark_at AND t.created_at < v_cutoff
+      UNION ALL
+      SELECT r.user_id, r.created_at, r.id::TEXT, 'payments:requested', r.amount::BIGINT
+      FROM public.payment_requests r
+      WHERE p_source = 'payment_requests'
+        AND r.created_at >= v_watermark.watermark_at AND r.created_at < v_cutoff
+      UNION ALL
+      SELECT r.user_id, r.admin_confirmed_at, r.id::TEXT, 'payments:confirmed', r.amount::BIGINT
+      FROM public.payment_requests r
+      WHERE p_source = 'payment_confirmations' AND r.status = 'confirmed'
+        AND r.admin_confirmed_at >= v_watermark.watermark_at AND r.admin_confirmed_at < v_cutoff
+    ) e
+    WHERE (e.occurred_at, e.event_id) > (v_watermark.watermark_at, v_watermark.watermark_id)
+    ORDER BY e.occurred_at, e.event_id
+    LIMIT p_limit
+  ),
+  buckets AS (
+    SELECT b.bucket, public.usage_bucket_start(b.bucket, e.occurred_at) AS bucket_start,
+           e.user_id, e.metric, COALESCE(p.subscription_tier, 'free') AS plan,
+           count(*) AS event_count, COALESCE(sum(e.amount), 0) AS amount
+    FROM events e
+    CROSS JOIN (VALUES ('hour'), ('day')) AS b(bucket)
+    LEFT JOIN public.profiles p ON p.id = e.user_id
+    GROUP BY 1, 2, 3, 4, 5
+  ),
+  merged AS (
+    INSERT INTO public.usage_rollups AS u (bucket, bucket_start, user_id, metric, plan, event_count, amount)
+    SELECT bucket, bucket_start, user_id, metric, plan, event_count, amount FROM buckets
+    ON CONFLICT (bucket, bucket_start, user_id, metric)
+    DO UPDATE SET event_count = u.event_count + EXCLUDED.event_count,
+                  amount = u.amount + EXCLUDED.amount,
+                  plan = EXCLUDED.plan
+  ),
+  last_event AS (
+    SELECT occurred_at, event_id FROM events ORDER BY occurred_at DESC, event_id DESC LIMIT 1
+  ),
+  advanced AS (
+    UPDATE public.usage_rollup_watermarks w
+    SET watermark_at = l.occurred_at, watermark_id = l.event_id, updated_at = now()
+    FROM last_event l
+    WHERE w.source = p_source
+  )
+  SELECT count(*) INTO v_folded FROM events;
+
+  RETURN v_folded;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE OR REPLACE FUNCTION public.get_usage_rollup_watermark(p_source TEXT)
+RETURNS public.usage_rollup_watermarks AS $$
+  INSERT INTO public.usage_rollup_watermarks (source) VALUES (p_source)
+  ON CONFLICT (source) DO UPDATE SET source = EXCLUDED.source
+  RETURNING *;
+$$ LANGUAGE sql SECURITY DEFINER SET search_path = public;
+
+-- Merge hourly rows aggregated by the backend ([{bucket_start, user_id, metric, event_count, amount}])
+-- and move the source's watermark, but only from p_from_at/p_from_id: when another worker got
+-- there first nothing is merged and FALSE is returned, so rows are never counted twice.
+CREATE OR REPLACE FUNCTION public.merge_usage_rollups(
+  p_source TEXT,
+  p_rows JSONB,
+  p_from_at TIMESTAMP WITH TIME ZONE,
+  p_from_id TEXT,
+  p_watermark_at TIMESTAMP WITH TIME ZONE,
+  p_watermark_id TEXT
+)
+RETURNS BOOLEAN AS $$
+DECLARE
+  v_watermark public.usage_rollup_watermarks;
+BEGIN
+  SELECT * INTO v_watermark FROM public.usage_rollup_watermarks WHERE source = p_source FOR UPDATE;
+  IF NOT FOUND OR (v_watermark.watermark_at, v_watermark.watermark_id) IS DISTINCT FROM (p_from_at, p_from_id) THEN
+    RETURN FALSE;
+  END IF;
+
+  WITH rows AS (
+    SELECT r.user_id, r.metric, public.usage_bucket_start('hour', r.bucket_start) AS hour_start,
+           r.event_count, r.amount
+    FROM jsonb_to_recordset(p_rows) AS r(bucket_start TIMESTAMP WITH TIME ZONE, user_id UUID, metric TEXT, event_count BIGINT, amount BIGINT)
+  ),
+  buckets AS (
+    SELECT b.bucket, public.usage_bucket_start(b.bucket, r.hour_start) AS bucket_start,
+           r.user_id, r.metric, COALESCE(p.subscription_tier, 'free') AS plan,
+           sum(r.event_count) AS event_count, sum(r.amount) AS amount
+    FROM rows r
+    CROSS JOIN (VALUES ('hour'), ('day')) AS b(bucket)
+    LEFT JOIN public.profiles p ON p.id = r.user_id
+    GROUP BY 1, 2, 3, 4, 5
+  )
+  INSERT INTO public.usage_rollups AS u (bucket, bucket_start, user_id, metric, plan, event_count, amount)
+  SELECT bucket, bucket_start, user_id, metric, plan, event_count, amount FROM buckets
+  ON CONFLICT (bucket, bucket_start, user_id, metric)
+  DO UPDATE SET event_count = u.event_count + EXCLUDED.event_count,
+                amount = u.amount + EXCLUDED.amount,
+                plan = EXCLUDED.plan;
+
+  UPDATE public.usage_rollup_watermarks
+  SET watermark_at = p_watermark_at, watermark_id = p_watermark_id, updated_at = now()
+  WHERE source = p_source;
+  RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- Time series over [p_from, p_to) grouped by plan, user or overall
+CREATE OR REPLACE FUNCTION public.get_usage_rollups(
+  p_bucket TEXT,
+  p_from TIMESTAMP WITH TIME ZONE,
+  p_to TIMESTAMP WITH TIME ZONE,
+  p_group_by TEXT DEFAULT 'plan',
+  p_metric TEXT DEFAULT NULL,
+  p_user_id UUID DEFAULT NULL,
+  p_plan TEXT DEFAULT NULL
+)
+RETURNS TABLE (bucket_start TIMESTAMP WITH TIME ZONE, group_key TEXT, metric TEXT, event_count BIGINT, amount BIGINT) AS $$
+  SELECT u.bucket_start,
+         CASE p_group_by WHEN 'user' THEN u.user_id::TEXT WHEN 'plan' THEN u.plan ELSE 'all' END AS group_key,
+         u.metric,
+         sum(u.event_count)::BIGINT,
+         sum(u.amount)::BIGINT
+  FROM public.usage_rollups u
+  WHERE u.bucket = p_bucket
+    AND u.bucket_start >= p_from AND u.bucket_start < p_to
+    AND (p_metric IS NULL OR u.metric = p_metric)
+    AND (p_user_id IS NULL OR u.user_id = p_user_id)
+    AND (p_plan IS NULL OR u.plan = p_plan)
+  GROUP BY 1, 2, 3
+  ORDER BY 1, 2, 3;
+$$ LANGUAGE sql STABLE SECURITY DEFINER SET search_path = public;
+
+REVOKE ALL ON FUNCTION public.rollup_usage_source(TEXT, INTEGER, INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION public.get_usage_rollup_watermark(TEXT) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION public.merge_usage_rollups(TEXT, JSONB, TIMESTAMP WITH TIME ZONE, TEXT, TIMESTAMP WITH TIME ZONE, TEXT) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION public.get_usage_rollups(TEXT, TIMESTAMP WITH TIME ZONE, TIMESTAMP WITH TIME ZONE, TEXT, TEXT, UUID, TEXT) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.rollup_usage_source(TEXT, INTEGER, INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION public.get_usage_rollup_watermark(TEXT) TO service_role;
+GRANT EXECUTE ON FUNCTION public.merge_usage_rollups(TEXT, JSONB, TIMESTAMP WITH TIME ZONE, TEXT, TIMESTAMP WITH TIME ZONE, TEXT) TO service_role;
+GRANT EXECUTE ON FUNCTION public.get_usage_rollups(TEXT, TIMESTAMP WITH TIME ZONE, TIMESTAMP WITH TIME ZONE, TEXT, TEXT, UUID, TEXT) TO service_role;
@@ -0,0 +1,50 @@
+-- Indexed admin user search: trigram GIN indexes serve the substring (ILIKE '%term%') matches
+-- that B-tree indexes cannot, and keyset pagination on (created_at, id) replaces OFFSET,
+-- so both the first and the ten-thousandth page cost the same at millions of profiles.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm WITH SCHEMA extensions;
+
+CREATE INDEX IF NOT EXISTS idx_profiles_email_trgm
+  ON public.profiles USING gin (email extensions.gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_profiles_username_trgm
+  ON public.profiles USING gin (username extensions.gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_profiles_created
+  ON public.profiles (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_profiles_tier_created
+  ON public.profiles (subscription_tier, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_profiles_status_created
+  ON public.profiles (subscription_status, created_at DESC, id DESC);
+
+-- Newest-first page of profiles matching the filters, strictly after the (p_before_at, p_before_id) cursor.
+-- The search term is matched literally (LIKE wildcards escaped) against email or username.
+CREATE OR REPLACE FUNCTION public.search_profiles(
+  p_search TEXT DEFAULT NULL,
+  p_tier TEXT DEFAULT NULL,
+  p_status TEXT DEFAULT NULL,
+  p_before_at TIMESTAMP WITH TIME ZONE DEFAULT NULL,
+  p_before_id UUID DEFAULT NULL,
+  p_limit INTEGER DEFAULT 50
+)
+RETURNS SETOF public.profiles AS $$
+DECLARE
+  v_pattern TEXT := NULL;
+BEGIN
+  IF p_search IS NOT NULL AND btrim(p_search) <> '' THEN
+    v_pattern := '%' || replace(replace(replace(btrim(p_search), '\', '\\'), '%', '\%'), '_', '\_') || '%';
+  END IF;
+
+  RETURN QUERY
+  SELECT p.*
+  FROM public.profiles p
+  WHERE (v_pattern IS NULL OR p.email ILIKE v_pattern OR p.username ILIKE v_pattern)
+    AND (p_tier IS NULL OR p.subscription_tier = p_tier)
+    AND (p_status IS NULL OR p.subscription_status = p_status)
+    AND (p_before_at IS NULL OR (p.created_at, p.id) < (p_before_at, p_before_id))
+  ORDER BY p.created_at DESC, p.id DESC
+  LIMIT LEAST(GREATEST(p_limit, 1), 201);
+END;
+$$ LANGUAGE plpgsql STABLE SECURITY DEFINER SET search_path = public, extensions;
+
+REVOKE ALL ON FUNCTION public.search_profiles(TEXT, TEXT, TEXT, TIMESTAMP WITH TIME ZONE, UUID, INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.search_profiles(TEXT, TEXT, TEXT, TIMESTAMP WITH TIME ZONE, UUID, INTEGER) TO service_role;
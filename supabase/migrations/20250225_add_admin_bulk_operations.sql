@@ -0,0 +1,158 @@
+-- Bulk admin operations: one set-based statement per step, all inside the function's transaction,
+-- so granting tokens to a whole campus is one request and either fully applies or not at all.
+-- Targets are explicit user ids and/or a filter; every affected user gets an audit_log row
+-- tagged with a shared batch id, and the function reports one result row per target.
+--
+-- Operations and their p_params:
+--   grant_tokens, remove_tokens  {amount, reason, notes}  (bonus / penalty ledger entries)
+--   ban {reason}, unban {}
+--   set_tier {tier}
+--   cancel_subscription {reason}
+-- p_filter keys: tier, status, is_banned, email_domain, all (true to target every profile).
+
+CREATE OR REPLACE FUNCTION public.admin_bulk_operation(
+  p_operation TEXT,
+  p_user_ids UUID[] DEFAULT NULL,
+  p_filter JSONB DEFAULT NULL,
+  p_params JSONB DEFAULT '{}'::jsonb,
+  p_actor TEXT DEFAULT 'admin',
+  p_dry_run BOOLEAN DEFAULT FALSE,
+  p_max_targets INTEGER DEFAULT 50000
+)
+RETURNS TABLE (user_id UUID, status TEXT, detail TEXT) AS $$
+#variable_conflict use_column
+DECLARE
+  v_filter JSONB := COALESCE(p_filter, '{}'::jsonb);
+  v_has_filter BOOLEAN;
+  v_targets UUID[];
+  v_batch_id UUID := gen_random_uuid();
+  v_amount INTEGER;
+  v_reason TEXT := p_params->>'reason';
+  v_notes TEXT := p_params->>'notes';
+  v_skipped UUID[] := '{}';
+BEGIN
+  IF p_operation NOT IN ('grant_tokens', 'remove_tokens', 'ban', 'unban', 'set_tier', 'cancel_subscription') THEN
+    RAISE EXCEPTION 'Unknown bulk operation %', p_operation USING ERRCODE = '22023';
+  END IF;
+
+  v_has_filter := (v_filter->>'all')::BOOLEAN IS TRUE
+    OR v_filter ?| ARRAY['tier', 'status', 'is_banned', 'email_domain'];
+  IF p_user_ids IS NULL AND NOT v_has_filter THEN
+    RAISE EXCEPTION 'Bulk operation needs user_ids or a filter' USING ERRCODE = '22023';
+  END IF;
+
+  IF p_operation IN ('grant_tokens', 'remove_tokens') THEN
+    v_amount := (p_params->>'amount')::INTEGER;
+    IF v_amount IS NULL OR v_amount <= 0 THEN
+      RAISE EXCEPTION 'Token amount must be a positive integer' USING ERRCODE = '22023';
+    END IF;
+  END IF;
+
+  -- Lock targets in id order, the same order apply_token_transactions uses, so bulk and chat writes cannot deadlock
+  SELECT COALESCE(array_agg(t.id), '{}') INTO v_targets
+  FROM (
+    SELECT p.id
+    FROM public.profiles p
+    WHERE (p_user_ids IS NULL OR p.id = ANY(p_user_ids))
+      AND (v_filter->>'tier' IS NULL OR p.subscription_tier = v_filter->>'tier')
+      AND (v_filter->>'status' IS NULL OR p.subscription_status = v_filter->>'status')
+      AND (v_filter->>'is_banned' IS NULL OR COALESCE(p.is_banned, FALSE) = (v_filter->>'is_banned')::BOOLEAN)
+      AND (v_filter->>'email_domain' IS NULL OR p.email ILIKE '%@' || replace(replace(v_filter->>'email_domain', '%', '\%'), '_', '\_'))
+    ORDER BY p.id
+    FOR UPDATE
+  ) t;
+
+  IF cardinality(v_targets) > p_max_targets THEN
+    RAISE EXCEPTION 'Bulk operation matches % users, more than the limit of %', cardinality(v_targets), p_max_targets
+      USING ERRCODE = '22023';
+  END IF;
+
+  IF NOT p_dry_run THEN
+    IF p_operation IN ('grant_tokens', 'remove_tokens') THEN
+      INSERT INTO public.token_balance_snapshots (user_id, base_total, base_used, watermark_at)
+      SELECT p.id, COALESCE(p.tokens_total, 0), COALESCE(p.tokens_used, 0), clock_timestamp()
+      FROM public.profiles p
+      WHERE p.id = ANY(v_targets)
+      ON CONFLICT (user_id) DO NOTHING;
+
+      WITH before AS (
+        SELECT p.id, COALESCE(p.tokens_total, 0) AS total, COALESCE(p.tokens_used, 0) AS used
+        FROM public.profiles p
+        WHERE p.id = ANY(v_targets)
+      ),
+      moved AS (
+        UPDATE public.profiles p
+        SET tokens_total = CASE WHEN p_operation = 'grant_tokens' THEN b.total + v_amount ELSE b.total END,
+            tokens_used = CASE WHEN p_operation = 'remove_tokens' THEN b.used + v_amount ELSE b.used END
+        FROM before b
+        WHERE p.id = b.id
+      )
+      INSERT INTO public.token_transactions (user_id, amount, transaction_type, reason, balance_before, balance_after, admin_notes, created_at)
+      SELECT
+        b.id,
+        v_amount,
+        CASE WHEN p_operation = 'grant_tokens' THEN 'bonus' ELSE 'penalty' END,
+        COALESCE(v_reason, 'Bulk admin adjustment'),
+        GREATEST(0, b.total - b.used),
+        CASE WHEN p_operation = 'grant_tokens' THEN GREATEST(0, b.total + v_amount - b.used)
+             ELSE GREATEST(0, b.total - b.used - v_amount) END,
+        v_notes,
+        clock_timestamp()
+      FROM before b;
+
+    ELSIF p_operation = 'ban' THEN
+      UPDATE public.profiles p
+      SET is_banned = TRUE, banned_at = now(), ban_reason = v_reason
+      WHERE p.id = ANY(v_targets);
+
+    ELSIF p_operation = 'unban' THEN
+      UPDATE public.profiles p
+      SET is_banned = FALSE, banned_at = NULL, ban_reason = NULL
+      WHERE p.id = ANY(v_targets);
+
+    ELSIF p_operation = 'set_tier' THEN
+      IF p_params->>'tier' IS NULL THEN
+        RAISE EXCEPTION 'set_tier needs a tier' USING ERRCODE = '22023';
+      END IF;
+      UPDATE public.profiles p
+      SET subscription_tier = p_params->>'tier'
+      WHERE p.id = ANY(v_targets);
+
+    ELSIF p_operation = 'cancel_subscription' THEN
+      WITH cancelled AS (
+        UPDATE public.subscriptions s
+        SET status = 'cancelled', cancelled_at = now(), cancel_reason = v_reason, updated_at = now()
+        WHERE s.user_id = ANY(v_targets) AND s.status = 'active'
+        RETURNING s.user_id
+      )
+      SELECT COALESCE(array_agg(t.id), '{}') INTO v_skipped
+      FROM unnest(v_targets) AS t(id)
+      WHERE t.id NOT IN (SELECT c.user_id FROM cancelled c);
+
+      UPDATE public.profiles p
+      SET subscription_status = 'cancelled'
+      WHERE p.id = ANY(v_targets) AND NOT (p.id = ANY(v_skipped));
+    END IF;
+
+    INSERT INTO public.audit_log (user_id, email_snapshot, event_type, event_category, description, metadata)
+    SELECT p.id, p.email, 'admin_bulk_' || p_operation, 'admin',
+           'Bulk ' || replace(p_operation, '_', ' ') || ' by ' || p_actor,
+           jsonb_build_object('batch_id', v_batch_id, 'actor', p_actor, 'params', p_params, 'filter', v_filter)
+    FROM public.profiles p
+    WHERE p.id = ANY(v_targets) AND NOT (p.id = ANY(v_skipped));
+  END IF;
+
+  RETURN QUERY
+  SELECT t.id,
+         CASE WHEN p_dry_run THEN 'matched' WHEN t.id = ANY(v_skipped) THEN 'skipped' ELSE 'applied' END,
+         CASE WHEN NOT p_dry_run AND t.id = ANY(v_skipped) THEN 'No active subscription' ELSE v_batch_id::TEXT END
+  FROM unnest(v_targets) AS t(id)
+  UNION ALL
+  SELECT m.id, 'not_found', 'Profile not found'
+  FROM unnest(COALESCE(p_user_ids, '{}')) AS m(id)
+  WHERE NOT (m.id = ANY(v_targets));
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+REVOKE ALL ON FUNCTION public.admin_bulk_operation(TEXT, UUID[], JSONB, JSONB, TEXT, BOOLEAN, INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.admin_bulk_operation(TEXT, UUID[], JSONB, JSONB, TEXT, BOOLEAN, INTEGER) TO service_role;
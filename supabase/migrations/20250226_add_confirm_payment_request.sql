@@ -0,0 +1,94 @@
+-- Payment confirmation as one transactional, idempotent function.
+-- Confirming used to be five PostgREST calls (payment, plan, subscription, profile, allowance);
+-- a failure between them left a confirmed payment without a subscription or tokens.
+-- confirm_payment_request does all of it under a row lock on the payment, and links the
+-- subscription back to the payment, so a retried or repeated confirmation returns the
+-- first result instead of creating a second subscription.
+
+ALTER TABLE public.subscriptions ADD COLUMN IF NOT EXISTS payment_request_id UUID;
+ALTER TABLE public.payment_requests ADD COLUMN IF NOT EXISTS subscription_id UUID;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_subscriptions_payment_request
+  ON public.subscriptions (payment_request_id)
+  WHERE payment_request_id IS NOT NULL;
+
+-- Returns {status, payment, subscription}; status is one of
+--   confirmed          this call confirmed the payment
+--   already_confirmed  an earlier call did; payment and subscription are the existing rows
+--   refused            the payment is rejected or expired
+--   plan_not_found     the payment's plan no longer exists (nothing is changed)
+--   not_found          no such payment
+CREATE OR REPLACE FUNCTION public.confirm_payment_request(
+  p_payment_id UUID,
+  p_admin_notes TEXT DEFAULT NULL
+)
+RETURNS JSONB AS $$
+DECLARE
+  v_payment public.payment_requests%ROWTYPE;
+  v_plan public.subscription_plans%ROWTYPE;
+  v_subscription public.subscriptions%ROWTYPE;
+BEGIN
+  SELECT * INTO v_payment FROM public.payment_requests WHERE id = p_payment_id FOR UPDATE;
+  IF NOT FOUND THEN
+    RETURN jsonb_build_object('status', 'not_found');
+  END IF;
+
+  IF v_payment.status = 'confirmed' THEN
+    SELECT * INTO v_subscription FROM public.subscriptions WHERE payment_request_id = v_payment.id;
+    RETURN jsonb_build_object(
+      'status', 'already_confirmed',
+      'payment', to_jsonb(v_payment),
+      'subscription', CASE WHEN v_subscription.id IS NULL THEN NULL ELSE to_jsonb(v_subscription) END
+    );
+  END IF;
+
+  IF v_payment.status IN ('rejected', 'expired') THEN
+    RETURN jsonb_build_object('status', 'refused', 'payment', to_jsonb(v_payment));
+  END IF;
+
+  SELECT * INTO v_plan FROM public.subscription_plans WHERE id = v_payment.plan_id;
+  IF NOT FOUND THEN
+    RETURN jsonb_build_object('status', 'plan_not_found', 'payment', to_jsonb(v_payment));
+  END IF;
+
+  INSERT INTO public.subscriptions (
+    user_id, plan_id, plan_name, billing_cycle, price_paid, tokens_total, tokens_used,
+    status, started_at, expires_at, activated_by_admin, payment_request_id
+  )
+  VALUES (
+    v_payment.user_id, v_payment.plan_id, v_payment.plan_name, v_payment.billing_cycle, v_payment.amount,
+    v_plan.tokens_per_month, 0, 'active', now(),
+    now() + CASE WHEN v_payment.billing_cycle = 'yearly' THEN INTERVAL '365 days' ELSE INTERVAL '30 days' END,
+    FALSE, v_payment.id
+  )
+  RETURNING * INTO v_subscription;
+
+  UPDATE public.payment_requests
+  SET status = 'confirmed',
+      admin_confirmed_at = now(),
+      admin_notes = p_admin_notes,
+      subscription_id = v_subscription.id,
+      updated_at = now()
+  WHERE id = v_payment.id
+  RETURNING * INTO v_payment;
+
+  UPDATE public.profiles
+  SET subscription_tier = v_plan.slug,
+      subscription_status = 'active',
+      subscription_id = v_subscription.id
+  WHERE id = v_payment.user_id;
+
+  PERFORM public.set_token_allowance(
+    v_payment.user_id, v_plan.tokens_per_month, NULL, 'Payment confirmed: ' || v_payment.plan_name
+  );
+
+  RETURN jsonb_build_object(
+    'status', 'confirmed',
+    'payment', to_jsonb(v_payment),
+    'subscription', to_jsonb(v_subscription)
+  );
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+REVOKE ALL ON FUNCTION public.confirm_payment_request(UUID, TEXT) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.confirm_payment_request(UUID, TEXT) TO service_role;
@@ -0,0 +1,31 @@
+-- Token pack confirmations used to add NEW.tokens straight onto profiles.tokens_total without
+-- a token_transactions row. Since balances are derived from snapshots plus the ledger
+-- (20250221), those tokens were invisible to get_token_balance, and reconcile_token_balances
+-- in repair mode rewrote the profile from the ledger and erased them.
+-- The trigger now credits the pack through apply_token_transaction like every other balance change.
+
+CREATE OR REPLACE FUNCTION public.handle_token_pack_confirmation()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF (NEW.status = 'confirmed' AND (OLD.status IS NULL OR OLD.status != 'confirmed')) THEN
+    UPDATE public.subscriptions
+    SET tokens_total = tokens_total + NEW.tokens
+    WHERE user_id = NEW.user_id AND status = 'active';
+
+    PERFORM public.apply_token_transaction(
+      NEW.user_id,
+      NEW.tokens,
+      'token_pack_purchase',
+      'Token pack purchase',
+      'token_pack_request:' || NEW.id::TEXT
+    );
+  END IF;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+DROP TRIGGER IF EXISTS token_pack_confirmation_trigger ON public.token_pack_requests;
+CREATE TRIGGER token_pack_confirmation_trigger
+AFTER UPDATE ON public.token_pack_requests
+FOR EACH ROW
+EXECUTE FUNCTION public.handle_token_pack_confirmation();